@@ -0,0 +1,207 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from footbot.benchmark.training import EVENTS
+from footbot.benchmark.training import get_peak_rss
+from footbot.benchmark.training import get_training_df
+from footbot.data import metrics
+from footbot.data.backends import LocalBackend
+from footbot.predictor import snapshots
+from footbot.predictor import train_predict
+from footbot.predictor.features import TRAIN_COLUMNS
+
+# tables read by the `train` and `predict` templates
+TRAIN_TABLE = "element_gameweeks_features_all_v01"
+PREDICT_TABLE = "element_gameweeks_prediction_features_2122_v01"
+
+SEASONS = [1, 3, 6]
+
+# baseline values below which a metric is too noisy to compare
+REGRESSION_MINIMUMS = {"seconds": 0.05, "peak_traced_bytes": 2**20}
+
+
+def get_feature_tables(seasons, rows_per_event=600, features=30, seed=0):
+    """
+    Get synthetic training and prediction feature tables shaped like the tables
+    read by the `train` and `predict` templates.
+
+    :param seasons: Number of seasons of 38 events of training rows
+    :param rows_per_event: Number of elements per event
+    :param features: Number of numerical feature columns
+    :param seed: Random seed
+    :return: Tuple of training and prediction feature dataframes, the latter with
+        a season of future events
+    """
+
+    def get_df(seasons, seed):
+        rng = np.random.default_rng(seed)
+        df = get_training_df(seasons, rows_per_event, features, seed)
+        rows = len(df)
+
+        # most rows pass the `train` template's filter on minutes
+        df["rolling_avg_minutes_element_p10"] = rng.uniform(20, 90, rows)
+        for column in TRAIN_COLUMNS[:5]:
+            df[column] = rng.integers(0, 3, rows)
+        df["minutes"] = rng.integers(0, 91, rows)
+        df["element"] = np.tile(np.arange(1, rows_per_event + 1), seasons * EVENTS)
+        df["element_all"] = df["element"]
+        df["safe_web_name"] = "player " + df["element"].astype(str)
+        df["event"] = (df["event_all"] - 1) % EVENTS + 1
+        df["season"] = (df["event_all"] - 1) // EVENTS
+        df["fixture"] = df["event"] * 10 + df["team"] % 10
+        return df
+
+    train_df = get_df(seasons, seed)
+    predict_df = get_df(1, seed + 1).drop(
+        ["total_points"]
+        + [i for i in TRAIN_COLUMNS if i not in ["element", "safe_web_name", "event"]],
+        axis=1,
+    )
+
+    return train_df, predict_df
+
+
+def run_pipeline(backend):
+    """
+    Train the points model and publish predictions, as `/update_predictions` does.
+
+    Stages are profiled by the pipeline's own calls to `metrics.stage_profiler`. A
+    query and the conversion of its results to a dataframe are one stage, as the
+    results are converted a batch at a time as they are read.
+
+    :param backend: LocalBackend holding the feature tables
+    """
+
+    model = train_predict.get_points_model("train", backend)
+    # rows of every event are predicted, rather than asking the FPL API for the
+    # current event
+    predict_df = train_predict.get_prediction_features_df(
+        "predict", backend, model, current_event=0
+    )
+    predict_df = train_predict.predict_points(predict_df, model)
+    snapshots.save_snapshot(predict_df, backend)
+
+
+def profile_pipeline(seasons, rows_per_event=600, features=30, repeats=1):
+    """
+    Profile the pipeline on synthetic feature tables in a local backend.
+
+    Runs in a fresh process so its peak resident set size is its own. Stages are
+    timed without tracing memory, then traced in one more run.
+
+    :param seasons: Number of seasons of synthetic training data
+    :param rows_per_event: Number of elements per event
+    :param features: Number of numerical feature columns
+    :param repeats: Number of timed runs, of which the fastest time per stage is kept
+    :return: An array of dictionaries of results per stage
+    """
+
+    train_df, predict_df = get_feature_tables(seasons, rows_per_event, features)
+
+    with tempfile.TemporaryDirectory() as root:
+        backend = LocalBackend(root)
+        backend.write_table("fpl", TRAIN_TABLE, train_df)
+        backend.write_table("fpl", PREDICT_TABLE, predict_df)
+        del train_df, predict_df
+
+        runs = []
+        for trace_memory in [False] * repeats + [True]:
+            # start each run without snapshots, as appending to a local table
+            # rewrites all of it
+            for table in [snapshots.SNAPSHOTS_TABLE, snapshots.CURRENT_TABLE]:
+                path = backend.get_path("fpl", table)
+                if os.path.exists(path):
+                    os.remove(path)
+            with metrics.stage_profiler.profile(trace_memory) as stages:
+                run_pipeline(backend)
+            runs.append(stages)
+
+    peak_rss = get_peak_rss()
+
+    results = []
+    for stage, stats in runs[-1].items():
+        seconds = min(i[stage]["seconds"] for i in runs[:-1])
+        results.append(
+            {
+                "seasons": seasons,
+                "stage": stage,
+                "rows": stats["rows"],
+                "seconds": seconds,
+                "rows_per_second": stats["rows"] / seconds if seconds else None,
+                "peak_traced_bytes": stats["peak_traced_bytes"],
+                "peak_rss_bytes": peak_rss,
+            }
+        )
+
+    return results
+
+
+def run_predictor_benchmark(
+    seasons=SEASONS, rows_per_event=600, features=30, repeats=1
+):
+    """
+    Profile each stage of training the points model and publishing its predictions,
+    for training data of each number of seasons.
+
+    Each size runs in a fresh process.
+
+    :param seasons: An array of numbers of seasons of synthetic training data
+    :param rows_per_event: Number of elements per event
+    :param features: Number of numerical feature columns
+    :param repeats: Number of timed runs per size
+    :return: An array of dictionaries of results per size and stage
+    """
+
+    results = []
+    for n in seasons:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results += executor.submit(
+                profile_pipeline, n, rows_per_event, features, repeats
+            ).result()
+
+    return results
+
+
+def get_regressions(results, baseline, threshold=0.25, minimums=REGRESSION_MINIMUMS):
+    """
+    Compare benchmark results with those of an earlier run.
+
+    :param results: An array of dictionaries of results per size and stage
+    :param baseline: Results of an earlier run, in the same format
+    :param threshold: Fraction by which a metric may exceed its baseline
+    :param minimums: Dictionary of the baseline value below which each compared
+        metric is ignored
+    :return: An array of dictionaries of metrics exceeding their baseline
+    """
+
+    baseline = {(i["seasons"], i["stage"]): i for i in baseline}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result["seasons"], result["stage"]))
+        if before is None:
+            continue
+
+        for metric, minimum in minimums.items():
+            if before.get(metric) is None or result.get(metric) is None:
+                continue
+            if before[metric] < minimum:
+                continue
+            if result[metric] > before[metric] * (1 + threshold):
+                regressions.append(
+                    {
+                        "seasons": result["seasons"],
+                        "stage": result["stage"],
+                        "metric": metric,
+                        "value": result[metric],
+                        "baseline": before[metric],
+                    }
+                )
+
+    return regressions
@@ -0,0 +1,201 @@
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from footbot.predictor.incremental import IncrementalLasso
+from footbot.predictor.train_predict import CATEGORICAL_FEATURES
+from footbot.predictor.train_predict import HYPERPARAMETERS
+from footbot.predictor.train_predict import get_downcast_df
+from footbot.predictor.train_predict import get_features
+from footbot.predictor.train_predict import get_model
+
+EVENTS = 38
+
+# pre-processed feature matrices compared by `run_sparse_benchmark`
+PIPELINES = ["dense float64", "sparse float32", "dense float32"]
+
+
+def get_training_df(seasons=3, rows_per_event=600, features=30, seed=0):
+    """
+    Get a synthetic dataframe shaped like the incremental training data.
+
+    Points depend linearly on a few numerical features and on home advantage,
+    and a tenth of numerical values are missing.
+
+    :param seasons: Number of seasons of 38 events
+    :param rows_per_event: Number of rows per event
+    :param features: Number of numerical feature columns
+    :param seed: Random seed
+    :return: Dataframe of `total_points`, features and `event_all`
+    """
+
+    rng = np.random.default_rng(seed)
+    rows = seasons * EVENTS * rows_per_event
+
+    numerical = rng.normal(size=(rows, features))
+    is_home = rng.integers(0, 2, rows).astype(bool)
+    points = 2 + numerical[:, : min(features, 5)].sum(axis=1) + is_home
+    points += rng.normal(0, 2, rows)
+    numerical[rng.uniform(size=(rows, features)) < 0.1] = np.nan
+
+    df = pd.DataFrame({"total_points": np.round(points)})
+    for i in range(features):
+        df[f"rolling_avg_feature_{i}"] = numerical[:, i]
+    df["element_type"] = rng.integers(1, 5, rows)
+    df["team"] = rng.integers(1, 21, rows)
+    df["opponent_team"] = rng.integers(1, 21, rows)
+    df["was_home"] = is_home
+    for flag in ["was_sunday", "was_weekday", "was_late", "was_early"]:
+        df[flag] = rng.uniform(size=rows) < 0.3
+    df["event_all"] = np.repeat(np.arange(1, seasons * EVENTS + 1), rows_per_event)
+
+    return df
+
+
+def run_incremental_benchmark(seasons=3, rows_per_event=600, features=30):
+    """
+    Compare adding the latest event to an incremental model with a full refit.
+
+    :param seasons: Number of seasons of synthetic training data
+    :param rows_per_event: Number of rows per event
+    :param features: Number of numerical feature columns
+    :return: Dictionary of timings and the largest coefficient and prediction differences
+    """
+
+    df = get_training_df(seasons, rows_per_event, features)
+    last_event_all = df["event_all"].max()
+    history_df = df[df["event_all"] < last_event_all]
+    new_df = df[df["event_all"] == last_event_all]
+
+    feature_names = get_features(df.drop("event_all", axis=1))
+    x = df.drop(["total_points", "event_all"], axis=1)
+
+    start = time.perf_counter()
+    model = get_model(feature_names)
+    model.fit(x, df["total_points"])
+    full_seconds = time.perf_counter() - start
+
+    incremental = IncrementalLasso(
+        feature_names["numerical"], CATEGORICAL_FEATURES, HYPERPARAMETERS["alpha"]
+    )
+    incremental.partial_fit(history_df)
+    start = time.perf_counter()
+    incremental.partial_fit(new_df)
+    incremental_seconds = time.perf_counter() - start
+
+    coef = np.array([incremental.coef[i] for i in incremental.get_columns()])
+    full_coef = model.named_steps["predictive model"].coef_
+
+    return {
+        "rows": len(df),
+        "new_rows": len(new_df),
+        "features": len(coef),
+        "full_seconds": full_seconds,
+        "incremental_seconds": incremental_seconds,
+        "speedup": full_seconds / incremental_seconds,
+        "incremental_sweeps": incremental.iterations,
+        "max_coef_difference": float(np.abs(coef - full_coef).max()),
+        "max_prediction_difference": float(
+            np.abs(incremental.predict(x) - model.predict(x)).max()
+        ),
+    }
+
+
+def get_peak_rss():
+    """
+    :return: Peak resident set size of this process in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def fit_pipeline(seasons, rows_per_event, features, pipeline):
+    """
+    Fit the points model to synthetic data as it arrives from `to_dataframe`.
+
+    Runs in a fresh process so its peak resident set size is its own.
+
+    :param seasons: Number of seasons of synthetic training data
+    :param rows_per_event: Number of rows per event
+    :param features: Number of numerical feature columns
+    :param pipeline: One of PIPELINES, `dense float32` being `get_model` as shipped
+    :return: Dictionary of fit time, memory and Lasso iterations
+    """
+
+    df = get_training_df(seasons, rows_per_event, features).drop("event_all", axis=1)
+
+    def fit():
+        train_df = df if pipeline == "dense float64" else get_downcast_df(df)
+        model = get_model(get_features(train_df))
+        if pipeline == "dense float64":
+            model.set_params(
+                **{
+                    "pre-process features__preprocess categorical features__dtype": (
+                        np.float64
+                    ),
+                }
+            )
+        elif pipeline == "sparse float32":
+            model.set_params(**{"pre-process features__sparse_threshold": 1.0})
+        model.fit(train_df.drop("total_points", axis=1), train_df["total_points"])
+        return train_df, model
+
+    start = time.perf_counter()
+    train_df, model = fit()
+    fit_seconds = time.perf_counter() - start
+    peak_rss = get_peak_rss()
+
+    tracemalloc.start()
+    try:
+        fit()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "dataframe_bytes": int(train_df.memory_usage(deep=True).sum()),
+        "fit_seconds": fit_seconds,
+        "peak_rss_bytes": peak_rss,
+        "peak_traced_bytes": peak,
+        "lasso_iterations": int(model.named_steps["predictive model"].n_iter_),
+    }
+
+
+def run_sparse_benchmark(seasons=6, rows_per_event=600, features=30):
+    """
+    Compare fitting dense float64 features with downcast, sparse float32 and dense
+    float32 features.
+
+    Each fit runs in a fresh process. Peak resident set size includes generating
+    the synthetic data, while peak traced memory only covers the fit.
+
+    :param seasons: Number of seasons of synthetic training data
+    :param rows_per_event: Number of rows per event
+    :param features: Number of numerical feature columns
+    :return: An array of dictionaries of results, ordered like PIPELINES
+    """
+
+    results = []
+    for pipeline in PIPELINES:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            result = executor.submit(
+                fit_pipeline, seasons, rows_per_event, features, pipeline
+            ).result()
+        results.append(
+            {
+                "pipeline": pipeline,
+                "rows": seasons * EVENTS * rows_per_event,
+                **result,
+            }
+        )
+
+    return results
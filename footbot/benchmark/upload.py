@@ -0,0 +1,216 @@
+import multiprocessing
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow
+from google.cloud import bigquery
+
+from footbot.benchmark.training import get_peak_rss
+from footbot.data import schema
+from footbot.data import utils
+
+
+class StandInJob:
+    def result(self):
+        return None
+
+
+class StandInClient:
+    """BigQuery client stand-in whose load jobs only read the uploaded file."""
+
+    def __init__(self, project="footbot-001"):
+        self.project = project
+        self.uploaded_bytes = 0
+
+    def dataset(self, dataset):
+        return bigquery.DatasetReference(self.project, dataset)
+
+    def load_table_from_file(self, file_obj, destination, job_config=None):
+        self.uploaded_bytes = len(file_obj.read())
+        return StandInJob()
+
+
+def get_synthetic_records(fields, rows, seed=0):
+    """
+    Generate payload records with plausible values for every field.
+
+    :param fields: An array of schema fields
+    :param rows: Number of records
+    :param seed: Random seed
+    :return: An array of dictionaries
+    """
+
+    rng = np.random.default_rng(seed)
+
+    columns = {}
+    for field in fields:
+        if field.dtype in ["int16", "int32"]:
+            values = rng.integers(0, 100, rows).tolist()
+        elif field.dtype == "float32":
+            values = [f"{i:.1f}" for i in rng.uniform(0, 20, rows)]
+        elif field.dtype == "bool":
+            values = (rng.uniform(size=rows) > 0.5).tolist()
+        elif field.dtype == "datetime":
+            values = ["2021-08-13T19:00:00Z"] * rows
+        elif field.dtype == "category":
+            values = rng.choice(["a", "d", "i", "u"], rows).tolist()
+        else:
+            values = [f"name {i}" for i in rng.integers(0, 1000, rows)]
+        columns[field.source or field.name] = values
+
+    return [dict(zip(columns, i)) for i in zip(*columns.values())]
+
+
+def get_element_data_df(rows, seed=0):
+    """
+    Get a synthetic dataframe shaped like the `element_data` table.
+
+    :param rows: Number of rows
+    :param seed: Random seed
+    :return: Dataframe
+    """
+    return schema.parse_records(
+        get_synthetic_records(schema.ELEMENT_FIELDS, rows, seed), schema.ELEMENT_FIELDS
+    )
+
+
+def get_prediction_df(rows, features=60, seed=0):
+    """
+    Get a synthetic dataframe shaped like the `element_gameweeks_predictions` table.
+
+    :param rows: Number of rows
+    :param features: Number of numerical feature columns
+    :param seed: Random seed
+    :return: Dataframe
+    """
+
+    rng = np.random.default_rng(seed)
+    df = get_element_data_df(rows, seed)[["element", "safe_web_name", "team"]]
+    df["event"] = rng.integers(1, 39, rows)
+    for i in range(features):
+        df[f"feature_{i}"] = rng.normal(size=rows)
+    df["predicted_total_points"] = rng.normal(2, 1, rows)
+
+    return df
+
+
+def measure(fn, repeats=3):
+    """
+    Measure the fastest wall time and the peak memory of a function.
+
+    Traced memory only covers Python and NumPy allocations, so buffers allocated
+    by Arrow during Parquet serialisation are measured from Arrow's memory pool.
+    The pool's peak cannot be reset, so run this in a fresh process, before
+    anything else has used Arrow.
+
+    :param fn: Function taking no arguments
+    :param repeats: Number of timed runs
+    :return: Tuple of seconds, peak traced bytes and peak Arrow bytes
+    """
+
+    pool = pyarrow.default_memory_pool()
+    arrow_allocated = pool.bytes_allocated()
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    arrow_peak = max(pool.max_memory() - arrow_allocated, 0)
+
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+
+    return min(seconds), peak, arrow_peak
+
+
+def measure_upload(table, source_format, rows, dataset=None, repeats=3):
+    """
+    Measure one upload through `write_to_table`.
+
+    Runs in a fresh process, so Arrow's peak and the peak resident set size are
+    the upload's own.
+
+    :param table: Either "element_data" or "predictions"
+    :param source_format: Either "CSV" or "PARQUET"
+    :param rows: Number of rows in the table
+    :param dataset: Optional dataset to load the table into in BigQuery
+    :param repeats: Number of timed runs
+    :return: Dictionary of results
+    """
+
+    get_df = get_element_data_df if table == "element_data" else get_prediction_df
+    df = get_df(rows)
+    client = utils.set_up_bigquery() if dataset else StandInClient()
+    rss_before = get_peak_rss()
+
+    seconds, peak, arrow_peak = measure(
+        lambda: utils.write_to_table(
+            dataset or "benchmark",
+            f"benchmark_{table}_{source_format.lower()}",
+            df,
+            client,
+            write_disposition="WRITE_TRUNCATE",
+            source_format=source_format,
+        ),
+        repeats=repeats,
+    )
+
+    return {
+        "table": table,
+        "source_format": source_format,
+        "rows": len(df),
+        "dataframe_bytes": int(df.memory_usage(deep=True).sum()),
+        "file_bytes": len(utils.get_load_file(df, source_format).getvalue()),
+        "seconds": seconds,
+        "peak_traced_bytes": peak,
+        "peak_arrow_bytes": arrow_peak,
+        # an upper bound, as the two peaks need not coincide
+        "peak_bytes": peak + arrow_peak,
+        "peak_rss_increase_bytes": get_peak_rss() - rss_before,
+    }
+
+
+def run_upload_benchmark(
+    element_rows=50000,
+    prediction_rows=25000,
+    dataset=None,
+    repeats=3,
+):
+    """
+    Compare CSV and Parquet uploads through `write_to_table`.
+
+    Without a dataset, uploads go to a stand-in that only reads the serialised file,
+    which isolates serialisation cost. With a dataset, each table is loaded into
+    `<dataset>.benchmark_<table>_<format>` in BigQuery to include load latency.
+    Each upload is measured in a fresh process.
+
+    :param element_rows: Number of rows in the element data table
+    :param prediction_rows: Number of rows in the prediction table
+    :param dataset: Optional dataset for benchmark tables in BigQuery
+    :param repeats: Number of timed runs per measurement
+    :return: An array of dictionaries of results
+    """
+
+    results = []
+    for table, rows in [
+        ("element_data", element_rows),
+        ("predictions", prediction_rows),
+    ]:
+        for source_format in ["CSV", "PARQUET"]:
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                results.append(
+                    executor.submit(
+                        measure_upload, table, source_format, rows, dataset, repeats
+                    ).result()
+                )
+
+    return results
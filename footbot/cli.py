@@ -1,12 +1,26 @@
+import json
 import logging
 import os
 from pprint import pprint
 from typing import Optional
+from typing import Tuple
 
 import click
 
+from .benchmark.predictor import SEASONS
+from .benchmark.predictor import get_regressions
+from .benchmark.predictor import run_predictor_benchmark
+from .benchmark.training import run_incremental_benchmark
+from .benchmark.training import run_sparse_benchmark
+from .benchmark.upload import run_upload_benchmark
+from .data import clients
+from .data import utils
+from .data.sync import sync_element_history_fixtures
 from .main import app
+from .main import update_element_history_fixtures_bulk
 from .optimiser.team_selector import optimise_entry
+from .predictor.features import build_local_features
+from .predictor.selection import run_model_selection
 
 root = logging.getLogger()
 logger = logging.getLogger(__name__)
@@ -56,3 +70,167 @@ def optimise(
     )
 
     click.echo(pprint(team_data))
+
+
+@cli.command()
+@click.option("--max-workers", type=int, default=16)
+def update_history(max_workers: int):
+    report = update_element_history_fixtures_bulk(max_workers=max_workers)
+
+    for timing in sorted(report["timings"], key=lambda x: -x["seconds"])[:10]:
+        click.echo(f"element {timing['element']}: {timing['seconds']:.2f}s")
+
+    click.echo(
+        f"fetched {report['elements']} elements in {report['seconds']:.1f}s "
+        f"with {len(report['failed'])} failures"
+    )
+
+    for failure in report["failed"]:
+        click.echo(f"element {failure['element']} failed: {failure['error']}")
+
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--max-workers", type=int, default=16)
+def sync_history(max_workers: int):
+    client = utils.set_up_bigquery()
+    report = sync_element_history_fixtures(client, max_workers=max_workers)
+
+    click.echo(
+        f"synced {report['elements']} elements in {report['seconds']:.1f}s: "
+        f"{report['history_rows']} history rows, "
+        f"{report['fixtures_rows']} fixture rows, "
+        f"{len(report['failed'])} failures"
+    )
+
+
+@cli.command()
+@click.option("--local-dir", default=utils.LOCAL_DIR)
+def export_local(local_dir: str):
+    rows = utils.export_local_tables(
+        clients.get_bigquery_client(), clients.get_local_backend(local_dir)
+    )
+
+    for table, n in rows.items():
+        click.echo(f"exported {n} rows of {table}")
+
+    click.echo(f"run with FOOTBOT_BACKEND=local FOOTBOT_LOCAL_DIR={local_dir}")
+
+
+@cli.command()
+@click.option("--budget-seconds", type=float, default=600)
+@click.option("--max-workers", type=int, default=None)
+def select_model(budget_seconds: float, max_workers: Optional[int]):
+    ranking = run_model_selection(
+        utils.set_up_bigquery(),
+        budget_seconds=budget_seconds,
+        max_workers=max_workers,
+    )
+
+    click.echo(ranking.to_string())
+
+
+@cli.command()
+@click.option("--local-dir", default=utils.LOCAL_DIR)
+@click.option("--last-event", type=int, default=None)
+def build_features(local_dir: str, last_event: Optional[int]):
+    report = build_local_features(
+        clients.get_local_backend(local_dir), last_event=last_event
+    )
+
+    click.echo(
+        f"computed {report['train_rows']} training rows to event "
+        f"{report['last_event']} and {report['predict_rows']} prediction rows "
+        f"in {report['seconds']:.1f}s"
+    )
+
+
+@cli.group()
+def benchmark():
+    pass
+
+
+@benchmark.command()
+@click.option("--element-rows", type=int, default=50000)
+@click.option("--prediction-rows", type=int, default=25000)
+@click.option("--dataset", default=None)
+@click.option("--repeats", type=int, default=3)
+def upload(element_rows: int, prediction_rows: int, dataset: str, repeats: int):
+    results = run_upload_benchmark(
+        element_rows=element_rows,
+        prediction_rows=prediction_rows,
+        dataset=dataset,
+        repeats=repeats,
+    )
+
+    click.echo(json.dumps(results, indent=2))
+
+
+@benchmark.command()
+@click.option("--seasons", type=int, default=3)
+@click.option("--rows-per-event", type=int, default=600)
+@click.option("--features", type=int, default=30)
+def incremental(seasons: int, rows_per_event: int, features: int):
+    results = run_incremental_benchmark(
+        seasons=seasons, rows_per_event=rows_per_event, features=features
+    )
+
+    click.echo(json.dumps(results, indent=2))
+
+
+@benchmark.command()
+@click.option("--seasons", type=int, default=6)
+@click.option("--rows-per-event", type=int, default=600)
+@click.option("--features", type=int, default=30)
+def sparse(seasons: int, rows_per_event: int, features: int):
+    results = run_sparse_benchmark(
+        seasons=seasons, rows_per_event=rows_per_event, features=features
+    )
+
+    click.echo(json.dumps(results, indent=2))
+
+
+@benchmark.command()
+@click.option("--seasons", type=int, multiple=True, default=SEASONS)
+@click.option("--rows-per-event", type=int, default=600)
+@click.option("--features", type=int, default=30)
+@click.option("--repeats", type=int, default=1)
+@click.option("--output", default=None)
+@click.option("--baseline", default=None)
+@click.option("--threshold", type=float, default=0.25)
+def predictor(
+    seasons: Tuple[int],
+    rows_per_event: int,
+    features: int,
+    repeats: int,
+    output: Optional[str],
+    baseline: Optional[str],
+    threshold: float,
+):
+    results = run_predictor_benchmark(
+        seasons=seasons,
+        rows_per_event=rows_per_event,
+        features=features,
+        repeats=repeats,
+    )
+
+    click.echo(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        with open(baseline, "r") as f:
+            regressions = get_regressions(results, json.load(f), threshold)
+
+        for regression in regressions:
+            click.echo(
+                f"{regression['stage']} with {regression['seasons']} seasons regressed: "
+                f"{regression['metric']} {regression['value']:.4g} against "
+                f"{regression['baseline']:.4g}"
+            )
+
+        if regressions:
+            raise SystemExit(1)
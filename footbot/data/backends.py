@@ -0,0 +1,276 @@
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from footbot.data import metrics
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# fully qualified table references, e.g. `footbot-001.fpl.element_data_2122`
+TABLE_REF_PATTERN = re.compile(r"`[\w-]+\.(\w+)\.(\w+)`")
+
+# statements that change the table they name, whose result is saved back to disk
+# templates may start with comments declaring their parameters
+DML_PATTERN = re.compile(
+    r"^(?:\s*--[^\n]*\n)*\s*(?:DELETE\s+FROM|UPDATE|INSERT\s+INTO)"
+    r"\s+`[\w-]+\.(\w+)\.(\w+)`",
+    re.IGNORECASE,
+)
+
+
+def translate_sql(sql):
+    """
+    Translate BigQuery SQL into DuckDB SQL.
+
+    Only the constructs used by footbot's queries are translated: table references,
+    `* EXCEPT(...)`, `IN UNNEST(@array)` and `@parameters`.
+
+    :param sql: BigQuery SQL
+    :return: DuckDB SQL
+    """
+
+    sql = TABLE_REF_PATTERN.sub(r"\1.\2", sql)
+    sql = re.sub(r"\*\s*EXCEPT\s*\(", "* EXCLUDE(", sql, flags=re.IGNORECASE)
+    sql = re.sub(
+        r"IN\s+UNNEST\s*\(\s*(@\w+)\s*\)",
+        r"IN (SELECT UNNEST(\1))",
+        sql,
+        flags=re.IGNORECASE,
+    )
+    sql = re.sub(r"@(\w+)", r"$\1", sql)
+    return sql
+
+
+def get_parameters(job_config):
+    """
+    :param job_config: Optional query job config with query parameters
+    :return: Dictionary of parameter values by name, with arrays as lists
+    """
+
+    if job_config is None:
+        return {}
+    return {
+        p.name: p.values if isinstance(p, bigquery.ArrayQueryParameter) else p.value
+        for p in job_config.query_parameters
+    }
+
+
+class LocalBackend:
+    """
+    Embedded SQL backend over Parquet files, standing in for BigQuery.
+
+    Each table is a file at `{root}/{dataset}/{table}.parquet`. Tables are loaded
+    into an in-memory DuckDB database when a query references them, and reloaded
+    when their file changes. Statements that change a table save it back to its file.
+    Referencing a table without a file raises NotFound, as in BigQuery.
+
+    Has the same `query`, `query_batches`, `write_table` and `upsert_table` methods
+    as `utils.BigQueryBackend`.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: Directory holding a subdirectory of Parquet files per dataset
+        """
+        if duckdb is None:
+            raise Exception("the local backend needs duckdb, `pip install duckdb`")
+
+        self.root = root
+        self.connection = duckdb.connect()
+        self.loaded = {}
+        self.lock = threading.RLock()
+
+    def get_path(self, dataset, table):
+        return os.path.join(self.root, dataset, f"{table}.parquet")
+
+    def get_table(self, ref):
+        """
+        Get table metadata, like `bigquery.Client.get_table`.
+
+        :param ref: Table reference, e.g. `footbot-001.fpl.element_data_2122`
+        :return: Object with `table_type`, `modified` and `num_rows`
+        """
+
+        dataset, table = ref.split(".")[-2:]
+        path = self.get_path(dataset, table)
+        if not os.path.exists(path):
+            raise NotFound(f"`{dataset}.{table}` does not exist in {self.root}")
+
+        return SimpleNamespace(
+            table_type="TABLE",
+            modified=datetime.datetime.fromtimestamp(
+                os.path.getmtime(path), tz=datetime.timezone.utc
+            ),
+            num_rows=pq.ParquetFile(path).metadata.num_rows,
+        )
+
+    def read_table(self, dataset, table):
+        """
+        :return: Dataframe of a table, empty if the table does not exist
+        """
+        path = self.get_path(dataset, table)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        return pd.read_parquet(path)
+
+    def query(self, sql, job_config=None, label="query"):
+        """
+        Run BigQuery SQL, like `bigquery.Client.query(...).to_dataframe()`.
+
+        :param sql: BigQuery SQL
+        :param job_config: Optional query job config with query parameters
+        :param label: Name the call is recorded under in `metrics.job_metrics`
+        :return: Dataframe of query results, empty for statements that change a table
+        """
+
+        start = time.perf_counter()
+        df = self._query(sql, job_config)
+        metrics.job_metrics.record(label, time.perf_counter() - start, rows=len(df))
+        return df
+
+    def _query(self, sql, job_config):
+        parameters = get_parameters(job_config)
+        with self.lock:
+            for dataset, table in set(TABLE_REF_PATTERN.findall(sql)):
+                self._load(dataset, table)
+
+            result = self.connection.execute(translate_sql(sql), parameters)
+
+            dml = DML_PATTERN.match(sql)
+            if dml:
+                self._save(*dml.groups())
+                return pd.DataFrame()
+
+            return result.df()
+
+    def query_batches(self, sql, job_config=None, label="query", batch_rows=100000):
+        """
+        Run a BigQuery SELECT and yield its results a batch at a time, like
+        `bigquery.RowIterator.to_dataframe_iterable`.
+
+        :param sql: BigQuery SQL
+        :param job_config: Optional query job config with query parameters
+        :param label: Name the call is recorded under in `metrics.job_metrics`
+        :param batch_rows: Maximum number of rows per batch
+        :return: Generator of dataframes of query results
+        """
+
+        return metrics.job_metrics.record_batches(
+            label,
+            self._query_batches(sql, job_config, batch_rows),
+            time.perf_counter(),
+        )
+
+    def _query_batches(self, sql, job_config, batch_rows):
+        parameters = get_parameters(job_config)
+        with self.lock:
+            for dataset, table in set(TABLE_REF_PATTERN.findall(sql)):
+                self._load(dataset, table)
+
+            # a cursor reads the same database, so other queries can run meanwhile
+            cursor = self.connection.cursor()
+            result = cursor.execute(translate_sql(sql), parameters)
+            # `fetch_record_batch` is deprecated in newer versions of duckdb
+            fetch = (
+                getattr(result, "to_arrow_reader", None) or result.fetch_record_batch
+            )
+            reader = fetch(batch_rows)
+
+        try:
+            for batch in reader:
+                yield batch.to_pandas()
+        finally:
+            cursor.close()
+
+    def write_table(
+        self, dataset, table, df, write_disposition="WRITE_APPEND", **load_options
+    ):
+        """
+        Write a dataframe to a table, like a BigQuery load job.
+
+        :param dataset: Dataset
+        :param table: Table
+        :param df: Dataframe to write
+        :param write_disposition: Either "WRITE_APPEND" or "WRITE_TRUNCATE"
+        :param load_options: Options of `utils.BigQueryBackend.write_table`, e.g.
+            `source_format`, which do not apply to Parquet files and are ignored
+        """
+
+        with self.lock:
+            if write_disposition == "WRITE_APPEND":
+                existing = self.read_table(dataset, table)
+                if len(existing.columns):
+                    df = pd.concat([existing, df], ignore_index=True)
+            self._write(dataset, table, df)
+
+    def upsert_table(self, dataset, table, df, keys, partition_key, partitions):
+        """
+        Replace the rows of a table for a set of partitions, like the MERGE in
+        `utils.BigQueryBackend.upsert_table`.
+
+        :param dataset: Dataset
+        :param table: Table
+        :param df: Dataframe with the same columns as the table
+        :param keys: An array of columns identifying a row, or empty to replace
+            every row of the partitions
+        :param partition_key: Column identifying the partitions being replaced
+        :param partitions: An array of partitions being replaced
+        """
+
+        with self.lock:
+            existing = self.read_table(dataset, table)
+            if len(existing.columns):
+                replaced = existing[partition_key].isin(partitions)
+                matched = False
+                if keys:
+                    matched = pd.MultiIndex.from_frame(existing[keys]).isin(
+                        pd.MultiIndex.from_frame(df[keys])
+                    )
+                df = pd.concat([existing[~(replaced | matched)], df], ignore_index=True)
+            self._write(dataset, table, df)
+
+    def _load(self, dataset, table):
+        path = self.get_path(dataset, table)
+        if not os.path.exists(path):
+            # like BigQuery, rather than reading a copy loaded before it was removed
+            raise NotFound(f"`{dataset}.{table}` does not exist in {self.root}")
+
+        modified = os.stat(path).st_mtime_ns
+        if self.loaded.get((dataset, table)) == modified:
+            return
+
+        logger.debug(f"loading {dataset}.{table} from {path}")
+        self.connection.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+        self.connection.execute(
+            f"CREATE OR REPLACE TABLE {dataset}.{table} AS "
+            f"SELECT * FROM read_parquet('{path}')"
+        )
+        self.loaded[(dataset, table)] = modified
+
+    def _save(self, dataset, table):
+        df = self.connection.execute(f"SELECT * FROM {dataset}.{table}").df()
+        self._write(dataset, table, df)
+        self.loaded[(dataset, table)] = os.stat(
+            self.get_path(dataset, table)
+        ).st_mtime_ns
+
+    def _write(self, dataset, table, df):
+        path = self.get_path(dataset, table)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# seconds a response is served without revalidation, by endpoint
+# None means a response never goes stale
+DEFAULT_TTLS = [
+    (r"/bootstrap-static/", 300),
+    (r"/fixtures/", 300),
+    (r"/element-summary/\d+/", 900),
+    (r"/entry/\d+/event/\d+/picks/", 300),
+]
+
+# a bulk refresh reads the summary of every element, about 700 in a season, as well
+# as bootstrap, fixtures and picks, so the LRU holds all of them
+MAX_ENTRIES = 2048
+
+# marker for using the TTL configured for an endpoint
+ENDPOINT_TTL = object()
+
+
+class FplCache:
+    """
+    Read-through cache for FPL API responses.
+
+    Responses are held in an in-memory LRU, and optionally on disk, keyed by URL.
+    Fresh responses are served without a request. Stale responses are revalidated
+    with `If-None-Match` and `If-Modified-Since` so unchanged payloads are not resent.
+    """
+
+    def __init__(
+        self,
+        ttls=DEFAULT_TTLS,
+        default_ttl=60,
+        max_entries=MAX_ENTRIES,
+        disk_dir=None,
+        get=requests.get,
+        clock=time.time,
+    ):
+        """
+        :param ttls: An array of (URL pattern, seconds) pairs, first match wins
+        :param default_ttl: Seconds a response is fresh if no pattern matches
+        :param max_entries: Maximum number of responses held in memory
+        :param disk_dir: Optional directory in which to persist responses
+        :param get: Function used to make HTTP GET requests
+        :param clock: Function returning the current time in seconds
+        """
+        self.ttls = [(re.compile(p), t) for p, t in ttls]
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.get = get
+        self.clock = clock
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0}
+
+    def get_ttl(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def get_json(self, url, ttl=ENDPOINT_TTL):
+        """
+        Get the JSON payload for a URL, using a cached response where possible.
+
+        :param url: URL to get
+        :param ttl: Seconds the response stays fresh, None for forever,
+            defaults to the endpoint's configured TTL
+        :return: Parsed JSON payload
+        """
+
+        ttl = self.get_ttl(url) if ttl is ENDPOINT_TTL else ttl
+        now = self.clock()
+        entry = self._get_entry(url)
+
+        if entry and (entry["expires"] is None or entry["expires"] > now):
+            self._count("hits")
+            return json.loads(entry["content"])
+
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.get(url, headers=headers)
+
+        if entry and response.status_code == 304:
+            self._count("revalidated")
+            content = entry["content"]
+        else:
+            self._count("misses")
+            response.raise_for_status()
+            content = response.content.decode("utf-8")
+
+        self._set_entry(
+            url,
+            {
+                "content": content,
+                "etag": response.headers.get("ETag", entry and entry.get("etag")),
+                "last_modified": response.headers.get(
+                    "Last-Modified", entry and entry.get("last_modified")
+                ),
+                "expires": None if ttl is None else now + ttl,
+            },
+        )
+
+        return json.loads(content)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _get_path(self, url):
+        return os.path.join(
+            self.disk_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def _get_entry(self, url):
+        with self.lock:
+            if url in self.entries:
+                self.entries.move_to_end(url)
+                return self.entries[url]
+
+        if not self.disk_dir:
+            return None
+
+        try:
+            with open(self._get_path(url), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self._set_entry(url, entry, persist=False)
+        return entry
+
+    def _set_entry(self, url, entry, persist=True):
+        with self.lock:
+            self.entries[url] = entry
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        if persist and self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                path = self._get_path(url)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.info(f"unable to persist response for {url} with exception {e}")
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+
+from google.cloud import bigquery
+from google.cloud import bigquery_storage_v1beta1
+from google.cloud import tasks_v2
+
+from footbot.data.backends import LocalBackend
+
+try:
+    from google.cloud import storage
+except ImportError:
+    storage = None
+
+logger = logging.getLogger(__name__)
+
+SECRETS_PATH = "./secrets/service_account.json"
+
+_lock = threading.RLock()
+_clients = {}
+_stats = {}
+
+
+def set_credentials(secrets_path=SECRETS_PATH):
+    """point Google client libraries at service account credentials"""
+    if os.environ.get("GOOGLE_APPLICATION_CREDENTIALS") != secrets_path:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = secrets_path
+
+
+def get_client(key, factory):
+    """
+    Get a client from the registry, creating it on first use.
+
+    Clients are created once per process and shared across requests and threads,
+    so credentials, HTTP sessions and gRPC channels are reused.
+
+    :param key: Name of the client in the registry
+    :param factory: Function taking no arguments that creates the client
+    :return: Client
+    """
+
+    with _lock:
+        stats = _stats.setdefault(key, {"created": 0, "reused": 0, "setup_seconds": 0})
+
+        if key in _clients:
+            stats["reused"] += 1
+            return _clients[key]
+
+        logger.info(f"setting up {key} client")
+        start = time.perf_counter()
+        client = factory()
+        stats["setup_seconds"] += time.perf_counter() - start
+        stats["created"] += 1
+
+        _clients[key] = client
+        return client
+
+
+def get_bigquery_client(secrets_path=SECRETS_PATH):
+    def factory():
+        set_credentials(secrets_path)
+        return bigquery.Client()
+
+    return get_client(f"bigquery:{secrets_path}", factory)
+
+
+def get_bqstorage_client(secrets_path=SECRETS_PATH):
+    def factory():
+        set_credentials(secrets_path)
+        return bigquery_storage_v1beta1.BigQueryStorageClient()
+
+    return get_client(f"bqstorage:{secrets_path}", factory)
+
+
+def get_tasks_client(secrets_path=SECRETS_PATH):
+    def factory():
+        set_credentials(secrets_path)
+        return tasks_v2.CloudTasksClient()
+
+    return get_client(f"tasks:{secrets_path}", factory)
+
+
+def get_storage_client(secrets_path=SECRETS_PATH):
+    def factory():
+        if storage is None:
+            raise Exception(
+                "artifact buckets need google-cloud-storage, "
+                "`pip install google-cloud-storage`"
+            )
+        set_credentials(secrets_path)
+        return storage.Client()
+
+    return get_client(f"storage:{secrets_path}", factory)
+
+
+def get_local_backend(root):
+    return get_client(f"local:{root}", lambda: LocalBackend(root))
+
+
+def reset():
+    """
+    Forget every client so the next use creates a new one.
+
+    gRPC channels must not be shared across a fork, so this runs in forked children.
+    """
+    global _lock
+    _lock = threading.RLock()
+    _clients.clear()
+
+
+def get_stats():
+    """
+    Get client creation and reuse counts per client.
+
+    `saved_seconds` estimates the setup time avoided by reuse, using the mean
+    time taken to create the client.
+
+    :return: Dictionary of statistics per client
+    """
+
+    with _lock:
+        return {
+            key: {
+                **stats,
+                "saved_seconds": stats["reused"]
+                * stats["setup_seconds"]
+                / max(stats["created"], 1),
+            }
+            for key, stats in _stats.items()
+        }
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
@@ -1,15 +1,20 @@
 import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
-import requests
 
+from footbot.data import fpl
+from footbot.data import scheduler
+from footbot.data import schema
 from footbot.data import utils
 
+logger = logging.getLogger(__name__)
+
 
 def get_bootstrap():
-    return requests.get(
-        "https://fantasy.premierleague.com/api/bootstrap-static/"
-    ).json()
+    return fpl.get_bootstrap()
 
 
 def get_element_df(bootstrap_data):
@@ -19,92 +24,17 @@ def get_element_df(bootstrap_data):
 
     current_datetime = datetime.datetime.now()
 
-    element_df = pd.DataFrame(bootstrap_data["elements"])
-
-    element_df["element"] = element_df["id"]
-    element_df["current_event"] = current_event
-    element_df["datetime"] = current_datetime
-    element_df["safe_web_name"] = element_df["web_name"].apply(utils.get_safe_web_name)
-
-    element_df = element_df[
-        [
-            "element",
-            "current_event",
-            "datetime",
-            "safe_web_name",
-            "assists",
-            "bonus",
-            "bps",
-            "chance_of_playing_next_round",
-            "chance_of_playing_this_round",
-            "clean_sheets",
-            "code",
-            "cost_change_event",
-            "cost_change_event_fall",
-            "cost_change_start",
-            "cost_change_start_fall",
-            "creativity",
-            "dreamteam_count",
-            "element_type",
-            "ep_next",
-            "ep_this",
-            "event_points",
-            "first_name",
-            "form",
-            "goals_conceded",
-            "goals_scored",
-            "ict_index",
-            "in_dreamteam",
-            "influence",
-            "minutes",
-            "news",
-            "news_added",
-            "now_cost",
-            "own_goals",
-            "penalties_missed",
-            "penalties_saved",
-            "photo",
-            "points_per_game",
-            "red_cards",
-            "saves",
-            "second_name",
-            "selected_by_percent",
-            "special",
-            "squad_number",
-            "status",
-            "team",
-            "team_code",
-            "threat",
-            "total_points",
-            "transfers_in",
-            "transfers_in_event",
-            "transfers_out",
-            "transfers_out_event",
-            "value_form",
-            "value_season",
-            "web_name",
-            "yellow_cards",
-        ]
-    ]
-
-    # sanitise data types
-    for i in [
-        "creativity",
-        "ep_next",
-        "ep_this",
-        "form",
-        "ict_index",
-        "influence",
-        "points_per_game",
-        "selected_by_percent",
-        "threat",
-        "value_form",
-        "value_season",
-    ]:
-        element_df[i] = element_df[i].astype("float")
-
-    for i in ["datetime", "news_added"]:
-        element_df[i] = element_df[i].astype("datetime64[ms]")
+    elements = bootstrap_data["elements"]
+
+    element_df = schema.parse_records(
+        elements,
+        schema.ELEMENT_FIELDS,
+        values={
+            "current_event": current_event,
+            "datetime": current_datetime,
+            "safe_web_name": [utils.get_safe_web_name(i["web_name"]) for i in elements],
+        },
+    )
 
     # this is a hack to deal with Bešić
     # UnicodeEncodeError: 'latin-1' codec can't encode character '\u0161'
@@ -121,69 +51,82 @@ def get_elements(bootstrap_data):
     return [i["id"] for i in bootstrap_data["elements"]]
 
 
-def sanitise_element_history_df(element_history_df):
-    if len(element_history_df) == 0:
-        return element_history_df
-
-    element_history_df.columns = [
-        "event" if i == "round" else i for i in element_history_df.columns
-    ]
-
-    # sanitise data types
-    for i in [
-        "creativity",
-        "ict_index",
-        "influence",
-        "threat",
-    ]:
-        element_history_df[i] = element_history_df[i].astype("float")
-
-    for i in ["kickoff_time"]:
-        element_history_df[i] = element_history_df[i].astype("datetime64[ms]")
-
-    return element_history_df
-
-
-def sanitise_element_fixtures_df(element_fixtures_df):
-    if len(element_fixtures_df) == 0:
-        return element_fixtures_df
-
-    for i in ["kickoff_time"]:
-        element_fixtures_df[i] = element_fixtures_df[i].astype("datetime64[ms]")
-
-    element_fixtures_df = element_fixtures_df[
-        [
-            "element",
-            "code",
-            "team_h",
-            "team_h_score",
-            "team_a",
-            "team_a_score",
-            "event",
-            "finished",
-            "minutes",
-            "provisional_start_time",
-            "kickoff_time",
-            "event_name",
-            "is_home",
-            "difficulty",
-        ]
-    ]
+def get_element_history_fixture_dfs(element):
+    element_data = fpl.get_element_summary(element)
 
-    return element_fixtures_df
+    element_history_df = schema.parse_records(
+        element_data["history"], schema.ELEMENT_HISTORY_FIELDS
+    )
+    element_fixtures_df = schema.parse_records(
+        element_data["fixtures"],
+        schema.ELEMENT_FIXTURES_FIELDS,
+        values={"element": int(element)},
+    )
 
+    return element_history_df, element_fixtures_df
 
-def get_element_history_fixture_dfs(element):
-    element_data = requests.get(
-        f"https://fantasy.premierleague.com/api/element-summary/{element}/"
-    ).json()
-    element_history = element_data["history"]
-    element_fixtures = [
-        utils.update_return_dict(k, ["element"], [element])
-        for k in element_data["fixtures"]
-    ]
-
-    element_history_df = sanitise_element_history_df(pd.DataFrame(element_history))
-    element_fixtures_df = sanitise_element_fixtures_df(pd.DataFrame(element_fixtures))
 
-    return element_history_df, element_fixtures_df
+def get_bulk_element_history_fixture_dfs(
+    elements,
+    max_workers=16,
+    fetch=get_element_history_fixture_dfs,
+):
+    """
+    Get gameweek history and fixtures for many elements concurrently.
+
+    Requests are made from a bounded thread pool at background priority. Transient
+    failures are retried by the FPL client alone, so its backoff is all the scheduler
+    sees. Elements that still fail are reported rather than raised.
+
+    :param elements: An array of element identifiers
+    :param max_workers: Maximum number of concurrent requests
+    :param fetch: Function to get history and fixtures for a single element
+    :return: Tuple of combined history dataframe, combined fixtures dataframe and report
+    """
+
+    def fetch_element(element):
+        start = time.perf_counter()
+        try:
+            with fpl.fpl_scheduler.priority(scheduler.BACKGROUND):
+                element_history_df, element_fixtures_df = fetch(element)
+            error = None
+        except Exception as e:
+            element_history_df = element_fixtures_df = None
+            error = str(e)
+
+        seconds = time.perf_counter() - start
+        logger.debug(f"fetched element {element} in {seconds:.2f}s")
+
+        return (
+            element_history_df,
+            element_fixtures_df,
+            dict(element=element, seconds=seconds, error=error),
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch_element, elements))
+
+    history_dfs = [i[0] for i in results if i[0] is not None and len(i[0]) != 0]
+    fixtures_dfs = [i[1] for i in results if i[1] is not None and len(i[1]) != 0]
+    timings = [i[2] for i in results]
+
+    report = {
+        "elements": len(timings),
+        "failed": [i for i in timings if i["error"] is not None],
+        "seconds": time.perf_counter() - start,
+        "timings": timings,
+    }
+
+    history_df = (
+        pd.concat(history_dfs, ignore_index=True)
+        if history_dfs
+        else schema.parse_records([], schema.ELEMENT_HISTORY_FIELDS)
+    )
+    fixtures_df = (
+        pd.concat(fixtures_dfs, ignore_index=True)
+        if fixtures_dfs
+        else schema.parse_records([], schema.ELEMENT_FIXTURES_FIELDS)
+    )
+
+    return history_df, fixtures_df, report
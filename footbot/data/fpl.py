@@ -0,0 +1,181 @@
+import logging
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from footbot.data.cache import ENDPOINT_TTL
+from footbot.data.cache import FplCache
+from footbot.data.scheduler import FetchScheduler
+
+logger = logging.getLogger(__name__)
+
+FPL_API_URL = "https://fantasy.premierleague.com/api"
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class FplClient:
+    """
+    HTTP client for the FPL API.
+
+    Requests share a pooled keep-alive session, have connect and read timeouts,
+    and are retried with jittered exponential backoff on connection errors,
+    429s and 5xx responses. Each attempt is admitted by the scheduler, if given,
+    and its outcome fed back to it.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=3.05,
+        read_timeout=20,
+        retries=4,
+        backoff=0.5,
+        max_backoff=30,
+        pool_size=32,
+        scheduler=None,
+        sleep=time.sleep,
+    ):
+        """
+        :param connect_timeout: Seconds to wait for a connection
+        :param read_timeout: Seconds to wait between bytes of a response
+        :param retries: Number of retries after the first attempt
+        :param backoff: Upper bound in seconds of the wait before the first retry
+        :param max_backoff: Upper bound in seconds of any wait between attempts
+        :param pool_size: Maximum number of kept-alive connections
+        :param scheduler: Optional FetchScheduler limiting the request rate
+        :param sleep: Function used to wait between attempts
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.scheduler = scheduler
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_wait(self, attempt, response=None):
+        """
+        Get seconds to wait before retrying, honouring `Retry-After` if sent.
+
+        :param attempt: Number of attempts made so far, starting at 0
+        :param response: Response of the last attempt, if any
+        :return: Seconds to wait
+        """
+
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+
+        # full jitter, so concurrent clients do not retry in lockstep
+        return random.uniform(0, min(self.backoff * 2**attempt, self.max_backoff))
+
+    def get(self, url, headers=None):
+        """
+        Make a GET request, retrying on transient failures.
+
+        :param url: URL to get
+        :param headers: Optional dictionary of headers
+        :return: Response, which may be an unsuccessful one after the final attempt
+        """
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._get(url, headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise e
+                wait = self.get_wait(attempt)
+                logger.info(f"retrying {url} in {wait:.1f}s after exception {e}")
+            else:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.retries
+                ):
+                    return response
+                wait = self.get_wait(attempt, response)
+                logger.info(
+                    f"retrying {url} in {wait:.1f}s after status {response.status_code}"
+                )
+
+            self.sleep(wait)
+
+    def _get(self, url, headers):
+        if self.scheduler is None:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+        with self.scheduler.slot():
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.scheduler.record(time.perf_counter() - start, error=True)
+                raise e
+            self.scheduler.record(time.perf_counter() - start, response.status_code)
+            return response
+
+
+fpl_scheduler = FetchScheduler()
+fpl_client = FplClient(scheduler=fpl_scheduler)
+fpl_cache = FplCache(get=fpl_client.get, disk_dir=os.environ.get("FOOTBOT_CACHE_DIR"))
+
+
+def get_json(path, ttl=ENDPOINT_TTL):
+    """
+    Get the JSON payload for an FPL API endpoint through the shared cache.
+
+    :param path: Endpoint path relative to the API root, e.g. `bootstrap-static/`
+    :param ttl: Seconds the response stays fresh, None for forever,
+        defaults to the endpoint's configured TTL
+    :return: Parsed JSON payload
+    """
+    return fpl_cache.get_json(f"{FPL_API_URL}/{path}", ttl=ttl)
+
+
+def get_bootstrap():
+    """
+    Get the `bootstrap-static` payload of elements, teams and events.
+
+    :return: Dictionary of bootstrap data
+    """
+    return get_json("bootstrap-static/")
+
+
+def get_element_summary(element):
+    """
+    Get the `element-summary` payload of gameweek history and future fixtures.
+
+    :param element: Element identifier
+    :return: Dictionary with `history` and `fixtures` arrays
+    """
+    return get_json(f"element-summary/{element}/")
+
+
+def get_future_fixtures():
+    """
+    Get every fixture that has yet to be played.
+
+    :return: An array of dictionaries of fixture data
+    """
+    return get_json("fixtures/?future=1")
+
+
+def get_entry_picks(entry, event, finished=False):
+    """
+    Get the picks of an entry for an event.
+
+    :param entry: Team identifier
+    :param event: Event number
+    :param finished: Whether the event has finished, in which case picks never change
+    :return: Dictionary of picks data
+    """
+    return get_json(
+        f"entry/{entry}/event/{event}/picks/",
+        ttl=None if finished else ENDPOINT_TTL,
+    )
@@ -0,0 +1,212 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# job statistics summed per label
+TOTALS = [
+    "seconds",
+    "queue_seconds",
+    "to_dataframe_seconds",
+    "bytes_processed",
+    "bytes_billed",
+    "slot_millis",
+    "rows",
+]
+
+
+def get_job_stats(job):
+    """
+    Get cost and latency statistics from a finished BigQuery job.
+
+    Statistics a job type does not have, e.g. bytes billed for a load job, are None.
+
+    :param job: Query, load or copy job
+    :return: Dictionary of job statistics
+    """
+
+    created = getattr(job, "created", None)
+    started = getattr(job, "started", None)
+    queue_seconds = None
+    if created is not None and started is not None:
+        queue_seconds = (started - created).total_seconds()
+
+    return {
+        "job_id": getattr(job, "job_id", None),
+        "queue_seconds": queue_seconds,
+        "bytes_processed": getattr(job, "total_bytes_processed", None),
+        "bytes_billed": getattr(job, "total_bytes_billed", None),
+        "slot_millis": getattr(job, "slot_millis", None),
+        "cache_hit": getattr(job, "cache_hit", None),
+    }
+
+
+class JobMetrics:
+    """
+    Record warehouse calls as structured log lines and counters per label.
+
+    A label names what made the call, e.g. a template name or `load:fpl.element_data_2122`.
+    """
+
+    def __init__(self, max_recent=200):
+        """
+        :param max_recent: Number of recent calls kept for inspection
+        """
+        self.totals = {}
+        self.recent = deque(maxlen=max_recent)
+        self.lock = threading.Lock()
+
+    def record(self, label, seconds, job=None, rows=None, to_dataframe_seconds=None):
+        """
+        Record a warehouse call.
+
+        :param label: Name of the caller
+        :param seconds: Wall time of the call
+        :param job: Optional finished BigQuery job
+        :param rows: Number of rows returned or loaded
+        :param to_dataframe_seconds: Time spent converting results to a dataframe
+        :return: Dictionary of call statistics
+        """
+
+        stats = {
+            "label": label,
+            "seconds": seconds,
+            "rows": rows,
+            "to_dataframe_seconds": to_dataframe_seconds,
+            **get_job_stats(job),
+        }
+
+        logger.info(json.dumps({"message": "warehouse call", **stats}))
+
+        with self.lock:
+            self.recent.append(stats)
+            totals = self.totals.setdefault(
+                label,
+                {
+                    "calls": 0,
+                    "cache_hits": 0,
+                    "max_seconds": 0.0,
+                    **{i: 0 for i in TOTALS},
+                },
+            )
+            totals["calls"] += 1
+            totals["cache_hits"] += int(bool(stats["cache_hit"]))
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            for key in TOTALS:
+                totals[key] += stats[key] or 0
+
+        return stats
+
+    def record_batches(self, label, batches, start, job=None):
+        """
+        Yield batches of query results, recording the call once every batch is read.
+
+        :param label: Name of the caller
+        :param batches: An iterable of dataframes
+        :param start: `time.perf_counter()` when the call started
+        :param job: Optional BigQuery job, finished by the time batches are read
+        :return: Generator of dataframes
+        """
+
+        batches = iter(batches)
+        rows = 0
+        converting_seconds = 0.0
+        while True:
+            # time spent by the caller between batches is not part of the conversion
+            converting = time.perf_counter()
+            df = next(batches, None)
+            converting_seconds += time.perf_counter() - converting
+            if df is None:
+                break
+            rows += len(df)
+            yield df
+
+        self.record(
+            label,
+            time.perf_counter() - start,
+            job=job,
+            rows=rows,
+            to_dataframe_seconds=converting_seconds,
+        )
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "totals": {k: dict(v) for k, v in self.totals.items()},
+                "recent": list(self.recent),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.totals.clear()
+            self.recent.clear()
+
+
+class StageProfiler:
+    """
+    Record the wall time and, optionally, the peak traced memory of named stages of a
+    run, e.g. of the prediction pipeline.
+
+    Stages are only recorded within `profile`, otherwise `stage` does nothing. Stages
+    must not overlap. Traced memory is the peak of what a stage allocates, covering
+    Python and NumPy allocations. Buffers allocated by Arrow's and DuckDB's own memory
+    pools are not included.
+    """
+
+    def __init__(self):
+        self.stages = None
+        self.trace_memory = False
+
+    @contextlib.contextmanager
+    def profile(self, trace_memory=False):
+        """
+        Record the stages run within a block.
+
+        :param trace_memory: Whether to trace memory, which slows stages down
+        :return: Context manager yielding a dictionary of each stage's results by name
+        """
+
+        self.stages = {}
+        self.trace_memory = trace_memory
+        try:
+            yield self.stages
+        finally:
+            self.stages = None
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Profile a stage.
+
+        :param name: Stage name
+        :param rows: Number of rows the stage processes, if known before it runs
+        :return: Context manager yielding the stage's dictionary of results,
+            in which `rows` can be set once known
+        """
+
+        stats = {"rows": rows}
+        stages, trace_memory = self.stages, self.trace_memory
+        if stages is None:
+            yield stats
+            return
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats["seconds"] = time.perf_counter() - start
+            if trace_memory:
+                _, stats["peak_traced_bytes"] = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            stages[name] = stats
+
+
+job_metrics = JobMetrics()
+stage_profiler = StageProfiler()
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from six import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# fully qualified table references, e.g. `footbot-001.fpl.element_data_2122`
+TABLE_REF_PATTERN = re.compile(r"`([\w-]+\.\w+\.\w+)`")
+
+
+class QueryCache:
+    """
+    Cache of query results keyed on SQL and the freshness of its source tables.
+
+    Results are held as Parquet bytes in an in-memory LRU bounded by size, and
+    optionally on disk. The key includes the last modified time of every table
+    the SQL reads, following views to their base tables, so a result is stale
+    as soon as one of its source tables changes.
+    """
+
+    def __init__(
+        self,
+        max_bytes=256 * 2**20,
+        disk_dir=None,
+        max_disk_bytes=1024 * 2**20,
+        freshness_ttl=10,
+        clock=time.time,
+    ):
+        """
+        :param max_bytes: Maximum size of results held in memory
+        :param disk_dir: Optional directory in which to persist results
+        :param max_disk_bytes: Maximum size of results held on disk
+        :param freshness_ttl: Seconds a table's last modified time is reused before
+            it is looked up again
+        :param clock: Function returning the current time in seconds
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.freshness_ttl = freshness_ttl
+        self.clock = clock
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.sources = {}
+        self.modified = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def get_source_tables(self, sql, client):
+        """
+        Get the base tables read by SQL, following views.
+
+        :param sql: SQL query
+        :param client: BigQuery client
+        :return: Sorted array of table references
+        """
+
+        tables = set()
+        refs = set(TABLE_REF_PATTERN.findall(sql))
+        seen = set()
+        while refs:
+            ref = refs.pop()
+            seen.add(ref)
+            table = client.get_table(ref)
+            if table.table_type == "VIEW":
+                refs |= set(TABLE_REF_PATTERN.findall(table.view_query)) - seen
+            else:
+                tables.add(ref)
+                self._set_modified(ref, table.modified)
+
+        return sorted(tables)
+
+    def get_key(self, sql, client, parameters=None):
+        """
+        Get the cache key for SQL given the current state of its source tables.
+
+        :param sql: SQL query
+        :param client: BigQuery client
+        :param parameters: Optional dictionary of query parameter values
+        :return: Hex digest
+        """
+
+        with self.lock:
+            sources = self.sources.get(sql)
+            if sources and sources["expires"] > self.clock():
+                tables = sources["tables"]
+            else:
+                tables = None
+
+        if tables is None:
+            tables = self.get_source_tables(sql, client)
+            with self.lock:
+                self.sources[sql] = {
+                    "tables": tables,
+                    "expires": self.clock() + self.freshness_ttl,
+                }
+
+        with self.lock:
+            freshness = {t: self.modified[t] for t in tables}
+
+        return hashlib.sha1(
+            json.dumps(
+                [sql, parameters, freshness], sort_keys=True, default=str
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get_df(self, sql, client, run_query, job_config=None, parameters=None):
+        """
+        Get the results of SQL, running it only if no fresh result is cached.
+
+        :param sql: SQL query
+        :param client: BigQuery client
+        :param run_query: Function taking SQL, a client and a job config and
+            returning a dataframe
+        :param job_config: Optional query job config, e.g. with query parameters
+        :param parameters: Optional dictionary of query parameter values
+        :return: Dataframe of query results
+        """
+
+        key = self.get_key(sql, client, parameters)
+
+        content = self._get_entry(key)
+        if content is not None:
+            return pd.read_parquet(BytesIO(content))
+
+        self._count("misses")
+        df = run_query(sql, client, job_config)
+
+        buffer = BytesIO()
+        df.to_parquet(buffer, index=False)
+        self._set_entry(key, buffer.getvalue())
+
+        return df
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sources.clear()
+            self.modified.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, "entries": len(self.entries), "bytes": self.size}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _set_modified(self, ref, modified):
+        with self.lock:
+            self.modified[ref] = modified.isoformat() if modified else None
+
+    def _get_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.parquet")
+
+    def _get_entry(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]
+
+        if not self.disk_dir:
+            return None
+
+        try:
+            with open(self._get_path(key), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        self._count("disk_hits")
+        self._set_entry(key, content, persist=False)
+        return content
+
+    def _set_entry(self, key, content, persist=True):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = content
+            self.size += len(content)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats["evictions"] += 1
+
+        if persist and self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                path = self._get_path(key)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+                self._prune_disk()
+            except OSError as e:
+                logger.info(f"unable to persist result {key} with exception {e}")
+
+    def _prune_disk(self):
+        paths = [
+            os.path.join(self.disk_dir, i)
+            for i in os.listdir(self.disk_dir)
+            if i.endswith(".parquet")
+        ]
+        # oldest first
+        paths.sort(key=os.path.getmtime)
+        size = sum(os.path.getsize(i) for i in paths)
+        while size > self.max_disk_bytes and len(paths) > 1:
+            path = paths.pop(0)
+            size -= os.path.getsize(path)
+            os.remove(path)
@@ -0,0 +1,187 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# lower values are served first
+HIGH = 0
+NORMAL = 1
+BACKGROUND = 2
+
+
+class FetchScheduler:
+    """
+    Admit requests under an adaptive rate and concurrency limit.
+
+    Requests take a token from a bucket refilled at `rate` per second and a slot
+    from a pool of `concurrency` slots. Waiting requests are admitted in priority
+    order. Limits follow AIMD: they grow additively while responses are fast and
+    successful, and are cut multiplicatively on 429s, 5xx responses, errors and
+    slow responses.
+    """
+
+    def __init__(
+        self,
+        rate=10.0,
+        concurrency=16,
+        min_rate=0.5,
+        max_rate=50.0,
+        max_concurrency=32,
+        rate_increase=0.5,
+        decrease=0.5,
+        target_latency=2.0,
+        cooldown=1.0,
+        clock=time.monotonic,
+    ):
+        """
+        :param rate: Initial requests per second
+        :param concurrency: Initial maximum number of requests in flight
+        :param min_rate: Lowest rate after backing off
+        :param max_rate: Highest rate after increasing
+        :param max_concurrency: Highest concurrency after increasing
+        :param rate_increase: Requests per second added after each good response
+        :param decrease: Factor applied to rate and concurrency when backing off
+        :param target_latency: Seconds above which a response counts as slow
+        :param cooldown: Seconds after backing off before backing off again
+        :param clock: Function returning the current time in seconds
+        """
+        self.rate = rate
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.rate_increase = rate_increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.tokens = 1.0
+        self.refilled = clock()
+        self.in_flight = 0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.backed_off = None
+        self.stats = {"admitted": 0, "successes": 0, "back_offs": 0}
+
+        self.condition = threading.Condition()
+        self.local = threading.local()
+
+    @contextmanager
+    def priority(self, priority):
+        """
+        Set the priority of requests made by this thread within the block.
+
+        :param priority: One of HIGH, NORMAL or BACKGROUND
+        """
+        previous = getattr(self.local, "priority", NORMAL)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    @contextmanager
+    def slot(self):
+        """Hold an admitted slot for the duration of a request."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self):
+        """Block until this thread's request is admitted."""
+
+        waiter = (getattr(self.local, "priority", NORMAL), next(self.counter))
+
+        with self.condition:
+            heapq.heappush(self.waiting, waiter)
+            while True:
+                self._refill()
+                if (
+                    self.waiting[0] == waiter
+                    and self.in_flight < self.concurrency
+                    and self.tokens >= 1
+                ):
+                    break
+
+                timeout = None
+                if self.tokens < 1:
+                    timeout = (1 - self.tokens) / self.rate
+                self.condition.wait(timeout)
+
+            heapq.heappop(self.waiting)
+            self.tokens -= 1
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            self.condition.notify_all()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record(self, latency, status_code=None, error=False):
+        """
+        Adjust limits from the outcome of a request.
+
+        :param latency: Seconds the request took
+        :param status_code: HTTP status code of the response, if any
+        :param error: Whether the request failed without a response
+        """
+
+        with self.condition:
+            now = self.clock()
+            is_throttled = (
+                error
+                or status_code == 429
+                or (status_code is not None and status_code >= 500)
+            )
+
+            if is_throttled or latency > self.target_latency:
+                if self.backed_off is None or now - self.backed_off >= self.cooldown:
+                    self.rate = max(self.rate * self.decrease, self.min_rate)
+                    self.concurrency = max(int(self.concurrency * self.decrease), 1)
+                    self.backed_off = now
+                    self.stats["back_offs"] += 1
+                    logger.info(
+                        f"backing off to {self.rate:.1f} requests per second "
+                        f"and {self.concurrency} concurrent requests"
+                    )
+            else:
+                self.stats["successes"] += 1
+                self.rate = min(self.rate + self.rate_increase, self.max_rate)
+                # grow concurrency by one for every `concurrency` good responses
+                if self.stats["successes"] % self.concurrency == 0:
+                    self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+
+            self.condition.notify_all()
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                **self.stats,
+                "rate": self.rate,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self.waiting),
+                "queue_depth_by_priority": {
+                    p: len([i for i in self.waiting if i[0] == p])
+                    for p in [HIGH, NORMAL, BACKGROUND]
+                },
+                "backing_off": self.backed_off is not None
+                and self.clock() - self.backed_off < self.cooldown,
+            }
+
+    def _refill(self):
+        now = self.clock()
+        # allow a small burst of up to one second of requests
+        self.tokens = min(
+            self.tokens + (now - self.refilled) * self.rate, max(self.rate, 1)
+        )
+        self.refilled = now
@@ -0,0 +1,191 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# a field in an FPL payload and the column it becomes
+# `source` is the payload key if it differs from the column name
+Field = namedtuple("Field", ["name", "dtype", "nullable", "source"])
+Field.__new__.__defaults__ = (False, None)
+
+ELEMENT_FIELDS = [
+    Field("element", "int16", source="id"),
+    Field("current_event", "int16"),
+    Field("datetime", "datetime"),
+    Field("safe_web_name", "str"),
+    Field("assists", "int16"),
+    Field("bonus", "int16"),
+    Field("bps", "int16"),
+    Field("chance_of_playing_next_round", "int16", nullable=True),
+    Field("chance_of_playing_this_round", "int16", nullable=True),
+    Field("clean_sheets", "int16"),
+    Field("code", "int32"),
+    Field("cost_change_event", "int16"),
+    Field("cost_change_event_fall", "int16"),
+    Field("cost_change_start", "int16"),
+    Field("cost_change_start_fall", "int16"),
+    Field("creativity", "float32"),
+    Field("dreamteam_count", "int16"),
+    Field("element_type", "int16"),
+    Field("ep_next", "float32", nullable=True),
+    Field("ep_this", "float32", nullable=True),
+    Field("event_points", "int16"),
+    Field("first_name", "str"),
+    Field("form", "float32"),
+    Field("goals_conceded", "int16"),
+    Field("goals_scored", "int16"),
+    Field("ict_index", "float32"),
+    Field("in_dreamteam", "bool"),
+    Field("influence", "float32"),
+    Field("minutes", "int16"),
+    Field("news", "str"),
+    Field("news_added", "datetime", nullable=True),
+    Field("now_cost", "int16"),
+    Field("own_goals", "int16"),
+    Field("penalties_missed", "int16"),
+    Field("penalties_saved", "int16"),
+    Field("photo", "str"),
+    Field("points_per_game", "float32"),
+    Field("red_cards", "int16"),
+    Field("saves", "int16"),
+    Field("second_name", "str"),
+    Field("selected_by_percent", "float32"),
+    Field("special", "bool"),
+    Field("squad_number", "int16", nullable=True),
+    Field("status", "category"),
+    Field("team", "int16"),
+    Field("team_code", "int16"),
+    Field("threat", "float32"),
+    Field("total_points", "int16"),
+    Field("transfers_in", "int32"),
+    Field("transfers_in_event", "int32"),
+    Field("transfers_out", "int32"),
+    Field("transfers_out_event", "int32"),
+    Field("value_form", "float32"),
+    Field("value_season", "float32"),
+    Field("web_name", "str"),
+    Field("yellow_cards", "int16"),
+]
+
+ELEMENT_HISTORY_FIELDS = [
+    Field("element", "int16"),
+    Field("fixture", "int16"),
+    Field("opponent_team", "int16"),
+    Field("total_points", "int16"),
+    Field("was_home", "bool"),
+    Field("kickoff_time", "datetime"),
+    Field("team_h_score", "int16", nullable=True),
+    Field("team_a_score", "int16", nullable=True),
+    Field("event", "int16", source="round"),
+    Field("minutes", "int16"),
+    Field("goals_scored", "int16"),
+    Field("assists", "int16"),
+    Field("clean_sheets", "int16"),
+    Field("goals_conceded", "int16"),
+    Field("own_goals", "int16"),
+    Field("penalties_saved", "int16"),
+    Field("penalties_missed", "int16"),
+    Field("yellow_cards", "int16"),
+    Field("red_cards", "int16"),
+    Field("saves", "int16"),
+    Field("bonus", "int16"),
+    Field("bps", "int16"),
+    Field("influence", "float32"),
+    Field("creativity", "float32"),
+    Field("threat", "float32"),
+    Field("ict_index", "float32"),
+    Field("value", "int16"),
+    Field("transfers_balance", "int32"),
+    Field("selected", "int32"),
+    Field("transfers_in", "int32"),
+    Field("transfers_out", "int32"),
+]
+
+ELEMENT_FIXTURES_FIELDS = [
+    Field("element", "int16"),
+    Field("code", "int32"),
+    Field("team_h", "int16"),
+    Field("team_h_score", "int16", nullable=True),
+    Field("team_a", "int16"),
+    Field("team_a_score", "int16", nullable=True),
+    Field("event", "int16", nullable=True),
+    Field("finished", "bool"),
+    Field("minutes", "int16"),
+    Field("provisional_start_time", "bool"),
+    Field("kickoff_time", "datetime", nullable=True),
+    Field("event_name", "category", nullable=True),
+    Field("is_home", "bool"),
+    Field("difficulty", "int16"),
+]
+
+
+def get_array(values, field):
+    """
+    Convert a list of payload values into a typed array for a field.
+
+    :param values: A list of values
+    :param field: The field the values belong to
+    :return: An array with the field's dtype
+    """
+
+    if not field.nullable and any(v is None for v in values):
+        raise Exception(f"`{field.name}` contains nulls but is not nullable")
+
+    if field.dtype in ["int16", "int32"]:
+        if field.nullable:
+            return pd.array(values, dtype=field.dtype.capitalize())
+        return np.array(values, dtype=field.dtype)
+
+    if field.dtype == "float32":
+        # numbers arrive as strings in some payloads, e.g. "1.2"
+        array = np.array(values, dtype=object)
+        array[array == None] = np.nan  # noqa: E711
+        return array.astype(np.float32)
+
+    if field.dtype == "bool":
+        if field.nullable:
+            return pd.array(values, dtype="boolean")
+        return np.array(values, dtype=bool)
+
+    if field.dtype == "datetime":
+        # timestamps are stored as naive UTC
+        return pd.to_datetime(values, utc=True).tz_convert(None)
+
+    if field.dtype == "category":
+        return pd.Categorical(values)
+
+    if field.dtype == "str":
+        return np.array(values, dtype=object)
+
+    raise Exception(f"`{field.name}` has unknown dtype `{field.dtype}`")
+
+
+def parse_records(records, fields, values=None):
+    """
+    Parse a list of payload records into a typed dataframe.
+
+    Each column is built directly from the records with its final dtype,
+    so no intermediate frame of Python objects is created.
+
+    :param records: An array of dictionaries from an FPL payload
+    :param fields: An array of fields describing the columns
+    :param values: Dictionary of column values not taken from the records,
+        either a scalar or an array with a value per record
+    :return: Dataframe with a column per field
+    """
+
+    values = values or {}
+    columns = {}
+    for field in fields:
+        if field.name in values:
+            column = values[field.name]
+            if np.ndim(column) == 0:
+                column = [column] * len(records)
+            column = list(column)
+        else:
+            source = field.source or field.name
+            column = [r.get(source) for r in records]
+
+        columns[field.name] = get_array(column, field)
+
+    return pd.DataFrame(columns, columns=[i.name for i in fields])
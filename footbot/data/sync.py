@@ -0,0 +1,384 @@
+import logging
+import time
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+
+from footbot.data import element_data
+from footbot.data import fpl
+from footbot.data import utils
+from footbot.data.writer import get_history_writer
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = "element_gameweeks_2122"
+FIXTURES_TABLE = "element_future_fixtures_2122"
+# the last finished event each element's history was fetched at, as an element
+# without a fixture in a gameweek has no history row to show it was checked
+CHECKED_TABLE = "element_gameweeks_checked_2122"
+
+
+def get_checked_events(client):
+    """
+    Get the last finished event at which each element's history was fetched.
+
+    :param client: BigQuery client
+    :return: Dataframe of `element` and `checked_event`, empty if no sync has
+        recorded one
+    """
+
+    try:
+        return utils.run_query(
+            f"""
+            SELECT
+              element,
+              checked_event
+            FROM
+              `footbot-001.fpl.{CHECKED_TABLE}`
+            """,
+            client,
+            label="sync_checked_events",
+        )
+    except NotFound as e:
+        logger.info(f"no checked events have been recorded: {e}")
+        return pd.DataFrame({"element": pd.Series(dtype="int64"), "checked_event": []})
+
+
+def get_history_sync_state(client):
+    """
+    Get the last synced and checked events and running totals for every element.
+
+    :param client: BigQuery client
+    :return: Dataframe with a row per synced or checked element, `last_event` being
+        the last event in the history table
+    """
+
+    history_state_df = utils.run_query(
+        f"""
+        SELECT
+          element,
+          MAX(event) AS last_event,
+          SUM(minutes) AS minutes,
+          SUM(total_points) AS total_points
+        FROM
+          `footbot-001.fpl.{HISTORY_TABLE}`
+        GROUP BY
+          1
+        """,
+        client,
+        label="sync_history_state",
+    )
+
+    return history_state_df.merge(
+        get_checked_events(client), on="element", how="outer"
+    ).fillna({"last_event": 0, "minutes": 0, "total_points": 0, "checked_event": 0})
+
+
+def get_stored_fixtures(client):
+    """
+    Get the fixtures and team of every element in the future fixtures table.
+
+    :param client: BigQuery client
+    :return: Dataframe with a row per element fixture
+    """
+
+    return utils.run_query(
+        f"""
+        SELECT
+          element,
+          code,
+          team_h,
+          team_a,
+          event,
+          kickoff_time,
+          is_home
+        FROM
+          `footbot-001.fpl.{FIXTURES_TABLE}`
+        """,
+        client,
+        label="sync_stored_fixtures",
+    )
+
+
+def get_last_finished_event(bootstrap_data):
+    """
+    Get the event number of the most recent finished gameweek.
+
+    :param bootstrap_data: Data from `bootstrap-static` endpoint
+    :return: Last finished event number, 0 if no events have finished
+    """
+
+    return max([i["id"] for i in bootstrap_data["events"] if i["finished"]] or [0])
+
+
+def get_elements_to_sync(bootstrap_data, sync_state_df):
+    """
+    Get elements whose gameweek history is behind the FPL API.
+
+    An element needs syncing if it has never been synced, if a gameweek has finished
+    since it was last synced or checked, or if its season totals of minutes or
+    points differ from those in the history table, e.g. after bonus points are
+    confirmed.
+
+    :param bootstrap_data: Data from `bootstrap-static` endpoint
+    :param sync_state_df: Dataframe from `get_history_sync_state`
+    :return: An array of elements
+    """
+
+    last_finished_event = get_last_finished_event(bootstrap_data)
+    sync_state = sync_state_df.set_index("element").to_dict("index")
+
+    elements = []
+    for element in bootstrap_data["elements"]:
+        state = sync_state.get(element["id"])
+        if (
+            state is None
+            or max(state["last_event"], state["checked_event"]) < last_finished_event
+            or state["minutes"] != element["minutes"]
+            or state["total_points"] != element["total_points"]
+        ):
+            elements.append(element["id"])
+
+    return elements
+
+
+def get_team_schedules(fixtures_df):
+    """
+    Get the schedule of future fixtures for every team.
+
+    :param fixtures_df: Dataframe of fixtures with code, team_h, team_a, event
+        and kickoff_time columns
+    :return: Dictionary of team to a set of (code, event, kickoff time) tuples
+    """
+
+    fixtures_df = fixtures_df[["code", "team_h", "team_a", "event", "kickoff_time"]]
+    fixtures_df = fixtures_df.drop_duplicates("code")
+
+    kickoff_times = pd.to_datetime(fixtures_df["kickoff_time"], utc=True)
+
+    schedules = {}
+    for (code, team_h, team_a, event), kickoff_time in zip(
+        fixtures_df[["code", "team_h", "team_a", "event"]].itertuples(index=False),
+        kickoff_times,
+    ):
+        fixture = (
+            int(code),
+            None if pd.isnull(event) else int(event),
+            None if pd.isnull(kickoff_time) else kickoff_time.isoformat(),
+        )
+        for team in [int(team_h), int(team_a)]:
+            schedules.setdefault(team, set()).add(fixture)
+
+    return schedules
+
+
+def get_elements_with_changed_fixtures(bootstrap_data, fixtures, stored_fixtures_df):
+    """
+    Get elements whose future fixtures differ from those in the fixtures table.
+
+    This includes every element of a team whose schedule changed, e.g. because a
+    fixture was played or rearranged, and elements that moved team or are new.
+
+    :param bootstrap_data: Data from `bootstrap-static` endpoint
+    :param fixtures: Data from `fixtures/?future=1` endpoint
+    :param stored_fixtures_df: Dataframe from `get_stored_fixtures`
+    :return: Tuple of an array of elements and an array of changed teams
+    """
+
+    schedules = get_team_schedules(
+        pd.DataFrame(
+            fixtures, columns=["code", "team_h", "team_a", "event", "kickoff_time"]
+        )
+    )
+    stored_schedules = get_team_schedules(stored_fixtures_df)
+
+    changed_teams = sorted(
+        [
+            i["id"]
+            for i in bootstrap_data["teams"]
+            if schedules.get(i["id"], set()) != stored_schedules.get(i["id"], set())
+        ]
+    )
+
+    stored_teams = dict(
+        zip(
+            stored_fixtures_df["element"],
+            stored_fixtures_df["team_h"].where(
+                stored_fixtures_df["is_home"], stored_fixtures_df["team_a"]
+            ),
+        )
+    )
+
+    elements = [
+        i["id"]
+        for i in bootstrap_data["elements"]
+        if i["team"] in changed_teams or stored_teams.get(i["id"]) != i["team"]
+    ]
+
+    return elements, changed_teams
+
+
+def split_element_history_df(element_history_df, sync_state_df):
+    """
+    Split fetched gameweek history into rows to append and elements to replace.
+
+    Rows after an element's last synced event are appended. If an element's rows up
+    to its last synced event no longer match the stored totals, all of its rows are
+    replaced instead.
+
+    :param element_history_df: Dataframe of fetched gameweek history
+    :param sync_state_df: Dataframe from `get_history_sync_state`
+    :return: Tuple of dataframe of rows to append and an array of elements to replace
+    """
+
+    if len(element_history_df) == 0:
+        return element_history_df, []
+
+    history_df = element_history_df.merge(
+        sync_state_df.rename(
+            columns={"minutes": "stored_minutes", "total_points": "stored_total_points"}
+        ),
+        on="element",
+        how="left",
+    )
+    history_df["last_event"] = history_df["last_event"].fillna(0)
+
+    synced_df = history_df[history_df["event"] <= history_df["last_event"]]
+    synced_totals_df = synced_df.groupby("element").agg(
+        minutes=("minutes", "sum"),
+        total_points=("total_points", "sum"),
+        stored_minutes=("stored_minutes", "first"),
+        stored_total_points=("stored_total_points", "first"),
+    )
+    replace_elements = sorted(
+        synced_totals_df[
+            (synced_totals_df["minutes"] != synced_totals_df["stored_minutes"])
+            | (
+                synced_totals_df["total_points"]
+                != synced_totals_df["stored_total_points"]
+            )
+        ].index.tolist()
+    )
+
+    is_after_last_event = history_df["event"] > history_df["last_event"]
+    is_replaced = history_df["element"].isin(replace_elements)
+    is_new = is_after_last_event | is_replaced
+
+    return element_history_df[is_new.values], replace_elements
+
+
+def sync_element_history_fixtures(client, max_workers=16, writer=None):
+    """
+    Bring gameweek history and future fixtures tables up to date incrementally.
+
+    Only elements that are behind the FPL API are fetched. New gameweek rows are
+    appended, elements with corrected history are merged in place, and fixtures are
+    merged only for elements whose schedule changed. Elements that fail to fetch are
+    left as they are and picked up by the next sync.
+
+    :param client: BigQuery client
+    :param max_workers: Maximum number of concurrent requests to the FPL API
+    :param writer: Batch writer for appended rows, defaults to a new history writer
+    :return: Report of the sync
+    """
+
+    start = time.perf_counter()
+    writer = writer or get_history_writer()
+
+    bootstrap_data = element_data.get_bootstrap()
+    fixtures = fpl.get_future_fixtures()
+
+    logger.info("getting sync state")
+    sync_state_df = get_history_sync_state(client)
+    stored_fixtures_df = get_stored_fixtures(client)
+
+    last_finished_event = get_last_finished_event(bootstrap_data)
+    history_elements = get_elements_to_sync(bootstrap_data, sync_state_df)
+    fixtures_elements, changed_teams = get_elements_with_changed_fixtures(
+        bootstrap_data, fixtures, stored_fixtures_df
+    )
+    elements = sorted(set(history_elements) | set(fixtures_elements))
+
+    logger.info(f"getting gameweek history and fixtures for {len(elements)} elements")
+    (
+        element_history_df,
+        element_fixtures_df,
+        fetch_report,
+    ) = element_data.get_bulk_element_history_fixture_dfs(
+        elements, max_workers=max_workers
+    )
+    failed = set([i["element"] for i in fetch_report["failed"]])
+
+    if len(element_history_df) != 0:
+        element_history_df = element_history_df[
+            element_history_df["element"].isin(set(history_elements) - failed)
+        ]
+    append_history_df, replace_elements = split_element_history_df(
+        element_history_df, sync_state_df
+    )
+
+    replace_fixtures_elements = sorted(set(fixtures_elements) - failed)
+    if len(element_fixtures_df) != 0:
+        element_fixtures_df = element_fixtures_df[
+            element_fixtures_df["element"].isin(replace_fixtures_elements)
+        ]
+
+    is_replaced = append_history_df["element"].isin(replace_elements)
+
+    logger.info(f"replacing gameweek history for {len(replace_elements)} elements")
+    utils.upsert_to_table(
+        "fpl",
+        HISTORY_TABLE,
+        append_history_df[is_replaced],
+        ["element", "fixture"],
+        client,
+        partitions=replace_elements,
+    )
+    logger.info(f"appending {(~is_replaced).sum()} gameweek history rows")
+    writer.write("fpl", HISTORY_TABLE, append_history_df[~is_replaced])
+    writer.flush()
+
+    checked_elements = sorted(set(history_elements) - failed)
+    if checked_elements:
+        logger.info(f"recording event {last_finished_event} as checked")
+        checked_df = sync_state_df.loc[
+            (sync_state_df["checked_event"] > 0)
+            & ~sync_state_df["element"].isin(checked_elements),
+            ["element", "checked_event"],
+        ]
+        checked_df = pd.concat(
+            [
+                checked_df,
+                pd.DataFrame(
+                    {"element": checked_elements, "checked_event": last_finished_event}
+                ),
+            ],
+            ignore_index=True,
+        )
+        utils.write_to_table(
+            "fpl",
+            CHECKED_TABLE,
+            checked_df.astype("int64"),
+            client,
+            write_disposition="WRITE_TRUNCATE",
+        )
+
+    logger.info(f"replacing fixtures for {len(replace_fixtures_elements)} elements")
+    utils.upsert_to_table(
+        "fpl",
+        FIXTURES_TABLE,
+        element_fixtures_df,
+        ["element", "code"],
+        client,
+        partitions=replace_fixtures_elements,
+    )
+
+    return {
+        "elements": len(elements),
+        "history_rows": len(append_history_df),
+        "replaced_history_elements": replace_elements,
+        "fixtures_rows": len(element_fixtures_df),
+        "changed_teams": changed_teams,
+        "failed": fetch_report["failed"],
+        "seconds": time.perf_counter() - start,
+    }
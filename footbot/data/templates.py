@@ -0,0 +1,198 @@
+import datetime
+import glob
+import os
+import re
+from collections import namedtuple
+
+from google.cloud import bigquery
+
+# SQL templates shipped with each footbot package
+SQL_GLOB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "*", "sql", "*.sql")
+
+# parameters are declared in a template's header, e.g. `-- @start_event INT64`
+DECLARATION_PATTERN = re.compile(r"^--\s*@(\w+)\s+([\w<>]+)\s*$", re.MULTILINE)
+PARAMETER_PATTERN = re.compile(r"@(\w+)")
+
+PARAMETER_TYPES = ["INT64", "FLOAT64", "STRING", "BOOL", "TIMESTAMP", "DATE"]
+# arrays of any parameter type, e.g. `ARRAY<INT64>`
+ARRAY_TYPE_PATTERN = re.compile(r"^ARRAY<(\w+)>$")
+
+Template = namedtuple("Template", ["name", "path", "sql", "parameters"])
+
+
+def compile_template(path):
+    """
+    Read a SQL template and check its parameters against its declarations.
+
+    :param path: Path of the SQL file
+    :return: Template with a dictionary of parameter types
+    """
+
+    with open(path, "r") as f:
+        sql = f.read()
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    parameters = dict(DECLARATION_PATTERN.findall(sql))
+
+    for parameter, parameter_type in parameters.items():
+        array_type = ARRAY_TYPE_PATTERN.match(parameter_type)
+        if array_type:
+            parameter_type = array_type.group(1)
+        if parameter_type not in PARAMETER_TYPES:
+            raise Exception(
+                f"`{name}` declares `@{parameter}` with unknown type `{parameter_type}`"
+            )
+
+    body = DECLARATION_PATTERN.sub("", sql)
+    referenced = set(PARAMETER_PATTERN.findall(body))
+
+    undeclared = referenced - set(parameters)
+    if undeclared:
+        raise Exception(
+            f"`{name}` references undeclared parameters {sorted(undeclared)}"
+        )
+
+    unused = set(parameters) - referenced
+    if unused:
+        raise Exception(f"`{name}` declares unused parameters {sorted(unused)}")
+
+    return Template(name, path, sql, parameters)
+
+
+def get_python_value(value):
+    """
+    Get the Python equivalent of a numpy scalar or array, as they are not serialisable.
+
+    :param value: Parameter value
+    :return: Python value, with arrays as lists
+    """
+
+    if isinstance(value, (list, tuple)):
+        return [get_python_value(i) for i in value]
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return value
+
+
+def get_query_parameter(name, parameter_type, value):
+    """
+    :param name: Parameter name
+    :param parameter_type: Declared parameter type, e.g. `INT64` or `ARRAY<INT64>`
+    :param value: Python value
+    :return: BigQuery query parameter
+    """
+
+    array_type = ARRAY_TYPE_PATTERN.match(parameter_type)
+    if array_type:
+        return bigquery.ArrayQueryParameter(name, array_type.group(1), value)
+    return bigquery.ScalarQueryParameter(name, parameter_type, value)
+
+
+def is_parameter_type(value, parameter_type):
+    """
+    Check whether a Python value can be passed as a query parameter of a type.
+
+    :param value: Python value
+    :param parameter_type: Declared parameter type, e.g. `INT64`
+    :return: Boolean
+    """
+
+    array_type = ARRAY_TYPE_PATTERN.match(parameter_type)
+    if array_type:
+        return isinstance(value, list) and all(
+            is_parameter_type(i, array_type.group(1)) for i in value
+        )
+    if parameter_type == "BOOL":
+        return isinstance(value, bool)
+    if isinstance(value, bool):
+        return False
+    if parameter_type == "INT64":
+        return isinstance(value, int)
+    if parameter_type == "FLOAT64":
+        return isinstance(value, (int, float))
+    if parameter_type == "STRING":
+        return isinstance(value, str)
+    if parameter_type == "TIMESTAMP":
+        return isinstance(value, datetime.datetime)
+    return isinstance(value, datetime.date) and not isinstance(value, datetime.datetime)
+
+
+class TemplateRegistry:
+    """
+    SQL templates compiled once, by name.
+
+    Templates take BigQuery query parameters rather than interpolated values, so
+    the SQL text of a template never changes and BigQuery can reuse cached results.
+    """
+
+    def __init__(self, paths=None):
+        """
+        :param paths: An array of SQL file paths, defaults to every shipped template
+        """
+        if paths is None:
+            paths = sorted(glob.glob(SQL_GLOB))
+
+        self.templates = {}
+        for path in paths:
+            template = compile_template(path)
+            if template.name in self.templates:
+                raise Exception(
+                    f"`{template.name}` is defined by both "
+                    f"{self.templates[template.name].path} and {path}"
+                )
+            self.templates[template.name] = template
+
+    def get(self, name):
+        """
+        Get a template by name, or by the path of its SQL file.
+
+        :param name: Template name, e.g. `train`
+        :return: Template
+        """
+
+        name = os.path.splitext(os.path.basename(name))[0]
+        if name not in self.templates:
+            raise Exception(f"`{name}` is not a known SQL template")
+        return self.templates[name]
+
+    def render(self, name, **values):
+        """
+        Bind parameter values to a template.
+
+        Values must name exactly the template's declared parameters and have Python
+        types matching their declared types.
+
+        :param name: Template name
+        :param values: Parameter values by name
+        :return: Tuple of template and an array of BigQuery query parameters
+        """
+
+        template = self.get(name)
+
+        missing = set(template.parameters) - set(values)
+        if missing:
+            raise Exception(f"`{template.name}` needs parameters {sorted(missing)}")
+
+        unexpected = set(values) - set(template.parameters)
+        if unexpected:
+            raise Exception(
+                f"`{template.name}` does not take parameters {sorted(unexpected)}"
+            )
+
+        values = {k: get_python_value(v) for k, v in values.items()}
+
+        for parameter, parameter_type in template.parameters.items():
+            value = values[parameter]
+            if value is not None and not is_parameter_type(value, parameter_type):
+                raise Exception(
+                    f"`{template.name}` takes `@{parameter}` as {parameter_type}, "
+                    f"not {type(value).__name__} {value!r}"
+                )
+
+        return template, [
+            get_query_parameter(k, t, values[k])
+            for k, t in sorted(template.parameters.items())
+        ]
+
+
+registry = TemplateRegistry()
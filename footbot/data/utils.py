@@ -1,18 +1,45 @@
 import datetime
+import functools
 import logging
 import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 
-import requests
 import unidecode as u
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
-from google.cloud import bigquery_storage_v1beta1
-from google.cloud import tasks_v2
 from google.protobuf import timestamp_pb2
 from six import BytesIO
 from six import StringIO
 
+from footbot.data import clients
+from footbot.data import fpl
+from footbot.data import metrics
+from footbot.data import templates
+from footbot.data.backends import LocalBackend
+from footbot.data.query_cache import QueryCache
+
 logger = logging.getLogger(__name__)
 
+# set FOOTBOT_BACKEND=local to read and write Parquet files under FOOTBOT_LOCAL_DIR
+LOCAL_DIR = "./snapshot"
+
+# tables and views read by the pipeline, exported for the local backend
+LOCAL_TABLES = [
+    "element_data_2122",
+    "element_gameweeks_2122",
+    "element_future_fixtures_2122",
+    "element_gameweeks_features_all_v01",
+    "element_gameweeks_prediction_features_2122_v01",
+    "element_gameweeks_predictions_2122_v02",
+    "element_gameweeks_predictions_2122_v02_current",
+]
+
+query_cache = QueryCache(disk_dir=os.environ.get("FOOTBOT_QUERY_CACHE_DIR"))
+
 
 def get_safe_web_name(web_name):
     """remove accents and casing from web name"""
@@ -44,56 +71,130 @@ def get_dict_keys(d, k):
     return dict(arr)
 
 
-def set_up_tasks(secrets_path="./secrets/service_account.json"):
-    """set up tasks client"""
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = secrets_path
-    return tasks_v2.CloudTasksClient()
+def set_up_tasks(secrets_path=clients.SECRETS_PATH):
+    """get shared tasks client"""
+    return clients.get_tasks_client(secrets_path)
+
+
+def set_up_bigquery(secrets_path=clients.SECRETS_PATH):
+    """get shared BigQuery client, or the local backend if configured"""
+    if os.environ.get("FOOTBOT_BACKEND") == "local":
+        return clients.get_local_backend(os.environ.get("FOOTBOT_LOCAL_DIR", LOCAL_DIR))
+    return clients.get_bigquery_client(secrets_path)
+
 
+def run_query(sql, client, job_config=None, label="query"):
+    """
+    Run SQL and return a dataframe, recording the job's cost and latency.
 
-def set_up_bigquery(secrets_path="./secrets/service_account.json"):
-    """set up BigQuery client"""
+    :param sql: SQL query
+    :param client: BigQuery client, or a backend
+    :param job_config: Optional query job config, e.g. with query parameters
+    :param label: Name the call is recorded under in `metrics.job_metrics`
+    :return: Dataframe of query results
+    """
+    return get_backend(client).query(sql, job_config=job_config, label=label)
 
-    logger.info("setting up BigQuery client")
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = secrets_path
-    return bigquery.Client()
 
+def run_query_batches(sql, client, job_config=None, label="query"):
+    """
+    Run SQL and yield its results a batch at a time, recording the job's cost and latency.
 
-def run_query(sql, client):
-    """run bigquery sql and return dataframe"""
-    bqstorage_client = bigquery_storage_v1beta1.BigQueryStorageClient()
-    return client.query(sql).to_dataframe(bqstorage_client=bqstorage_client)
+    Results are read from the Storage API a stream page at a time, so only one
+    batch is held as a dataframe before the caller processes it.
+
+    :param sql: SQL query
+    :param client: BigQuery client, or a backend
+    :param job_config: Optional query job config, e.g. with query parameters
+    :param label: Name the call is recorded under in `metrics.job_metrics`
+    :return: Generator of dataframes of query results
+    """
+    return get_backend(client).query_batches(sql, job_config=job_config, label=label)
 
 
-def run_templated_query(sql_file, replacement_dict, client):
+def run_templated_query(template, parameters, client, cache=None):
     """
-    Run a templated SQL query with specified replacements.
+    Run a SQL template from the registry with query parameters.
 
-    :param sql_file: Filename of SQL query
-    :param replacement_dict: Dictionary of parameters to replace in template
+    :param template: Template name, e.g. `train`, or the path of its SQL file
+    :param parameters: Dictionary of values for the template's parameters
     :param client: BigQuery client
+    :param cache: Optional QueryCache to serve results from while source tables are unchanged
     :return: Dataframe of query results
     """
-    with open(sql_file, "r") as sql_file:
-        sql = sql_file.read()
+    template, query_parameters = templates.registry.render(template, **parameters)
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+
+    if cache is not None:
+        return cache.get_df(
+            template.sql,
+            client,
+            functools.partial(run_query, label=template.name),
+            job_config=job_config,
+            parameters=parameters,
+        )
 
-    df = run_query(sql.format(**replacement_dict), client)
+    df = run_query(template.sql, client, job_config=job_config, label=template.name)
 
     return df
 
 
-def write_to_table(dataset, table, df, client, write_disposition="WRITE_APPEND"):
-    """write data to BigQuery table"""
-    try:
-        string_buffer = StringIO()
-        bytes_buffer = BytesIO()
+def run_templated_query_batches(template, parameters, client):
+    """
+    Run a SQL template from the registry and yield its results a batch at a time.
 
-        dataset_ref = client.dataset(dataset)
-        table_ref = dataset_ref.table(table)
+    :param template: Template name, e.g. `train`, or the path of its SQL file
+    :param parameters: Dictionary of values for the template's parameters
+    :param client: BigQuery client
+    :return: Generator of dataframes of query results
+    """
+    template, query_parameters = templates.registry.render(template, **parameters)
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
 
-        job_config = bigquery.LoadJobConfig()
-        job_config.source_format = "CSV"
-        job_config.skip_leading_rows = 1
-        job_config.write_disposition = write_disposition
+    return run_query_batches(
+        template.sql, client, job_config=job_config, label=template.name
+    )
+
+
+def export_local_tables(client, backend, tables=LOCAL_TABLES, dataset="fpl"):
+    """
+    Copy BigQuery tables to the local backend so the pipeline can run offline.
+
+    Views are exported as tables of their current results.
+
+    :param client: BigQuery client
+    :param backend: LocalBackend to write to
+    :param tables: An array of tables to export
+    :param dataset: BigQuery dataset
+    :return: Dictionary of rows exported per table
+    """
+
+    rows = {}
+    for table in tables:
+        logger.info(f"exporting {dataset}.{table}")
+        df = run_query(f"SELECT * FROM `footbot-001.{dataset}.{table}`", client)
+        backend.write_table(dataset, table, df, write_disposition="WRITE_TRUNCATE")
+        rows[table] = len(df)
+
+    return rows
+
+
+def get_load_file(df, source_format="CSV"):
+    """
+    Serialise a dataframe into a bytes buffer for a BigQuery load job.
+
+    CSV is written as text and parsed by BigQuery, so dtypes are lost.
+    Parquet is written column by column into a single buffer and keeps dtypes.
+
+    :param df: Dataframe to serialise
+    :param source_format: Either "CSV" or "PARQUET"
+    :return: Bytes buffer positioned at the start
+    """
+
+    bytes_buffer = BytesIO()
+
+    if source_format == "CSV":
+        string_buffer = StringIO()
 
         # to_csv writes out a string
         df.to_csv(string_buffer, index=False)
@@ -103,20 +204,475 @@ def write_to_table(dataset, table, df, client, write_disposition="WRITE_APPEND")
         # create bytes representation of string buffer
         # needs to be encoded as utf-8 for bigquery
         bytes_buffer.write(string_buffer.read().encode("utf-8"))
-        # move cursor to to beginning of bytes buffer
-        bytes_buffer.seek(0)
 
-        # load_table_from_file expects bytes
-        job = client.load_table_from_file(
-            bytes_buffer, table_ref, job_config=job_config
+    elif source_format == "PARQUET":
+        df = df.copy(deep=False)
+        # naive datetimes are UTC, mark them so they load as TIMESTAMP not DATETIME
+        for i in df.select_dtypes(include=["datetime"]).columns:
+            df[i] = df[i].dt.tz_localize("UTC")
+
+        df.to_parquet(
+            bytes_buffer,
+            engine="pyarrow",
+            index=False,
+            coerce_timestamps="us",
+            allow_truncated_timestamps=True,
+        )
+
+    else:
+        raise Exception("`source_format` must be one of CSV or PARQUET")
+
+    # move cursor to to beginning of bytes buffer
+    bytes_buffer.seek(0)
+
+    return bytes_buffer
+
+
+def write_to_table(
+    dataset,
+    table,
+    df,
+    client,
+    write_disposition="WRITE_APPEND",
+    source_format="CSV",
+    chunk_rows=None,
+    max_workers=1,
+    range_partitioning=None,
+    clustering_fields=None,
+):
+    """
+    Write a dataframe to a table, with a load job in BigQuery.
+
+    :param dataset: BigQuery dataset
+    :param table: BigQuery table
+    :param df: Dataframe to write
+    :param client: BigQuery client, or a backend
+    :param write_disposition: Either "WRITE_APPEND" or "WRITE_TRUNCATE"
+    :param source_format: Either "CSV" or "PARQUET"
+    :param chunk_rows: Optional maximum number of rows serialised per load job
+    :param max_workers: Number of chunks loaded in parallel
+    :param range_partitioning: Optional bigquery.RangePartitioning of the table
+    :param clustering_fields: Optional array of columns to cluster the table by
+    :return: Result of the load or copy job
+    """
+    return get_backend(client).write_table(
+        dataset,
+        table,
+        df,
+        write_disposition=write_disposition,
+        source_format=source_format,
+        chunk_rows=chunk_rows,
+        max_workers=max_workers,
+        range_partitioning=range_partitioning,
+        clustering_fields=clustering_fields,
+    )
+
+
+def iter_chunks(df, chunk_rows):
+    """
+    Split a dataframe into chunks of rows without copying.
+
+    :param df: Dataframe
+    :param chunk_rows: Maximum number of rows per chunk
+    :return: Generator of dataframes
+    """
+    for start in range(0, len(df), chunk_rows):
+        end = start + chunk_rows
+        yield df.iloc[start:end]
+
+
+def load_to_staging_table(
+    df,
+    staging_ref,
+    client,
+    write_disposition="WRITE_TRUNCATE",
+    source_format="CSV",
+    schema=None,
+):
+    """
+    Load a dataframe into a staging table, creating it if needed.
+
+    :param df: Dataframe to load
+    :param staging_ref: Reference to the staging table
+    :param client: BigQuery client
+    :param write_disposition: Either "WRITE_APPEND" or "WRITE_TRUNCATE"
+    :param source_format: Either "CSV" or "PARQUET"
+    :param schema: Schema for CSV loads, autodetected if not provided
+    :return: Result of the load job
+    """
+
+    job_config = bigquery.LoadJobConfig()
+    job_config.source_format = source_format
+    job_config.write_disposition = write_disposition
+    if source_format == "CSV":
+        job_config.skip_leading_rows = 1
+        if schema:
+            job_config.schema = schema
+        else:
+            job_config.autodetect = True
+
+    start = time.perf_counter()
+    bytes_buffer = get_load_file(df, source_format)
+    job = client.load_table_from_file(bytes_buffer, staging_ref, job_config=job_config)
+    result = job.result()
+
+    metrics.job_metrics.record(
+        f"load:{staging_ref.dataset_id}.staging",
+        time.perf_counter() - start,
+        job=job,
+        rows=len(df),
+    )
+    return result
+
+
+def write_chunks_to_table(
+    dataset,
+    table,
+    chunks,
+    client,
+    write_disposition="WRITE_APPEND",
+    source_format="CSV",
+    max_workers=1,
+):
+    """
+    Write a stream of dataframes to a BigQuery table with bounded memory.
+
+    Each chunk is serialised and loaded into a staging table as it is consumed,
+    with at most `max_workers` chunks in memory at once. Once every chunk has
+    loaded and the staging table holds the expected number of rows, it is copied
+    into the destination in a single copy job, so readers never see a partial
+    write for either `WRITE_APPEND` or `WRITE_TRUNCATE`.
+
+    :param dataset: BigQuery dataset
+    :param table: BigQuery table
+    :param chunks: An iterable of dataframes with the same columns
+    :param client: BigQuery client
+    :param write_disposition: Either "WRITE_APPEND" or "WRITE_TRUNCATE"
+    :param source_format: Either "CSV" or "PARQUET"
+    :param max_workers: Number of chunks loaded in parallel
+    :return: Result of the copy job
+    """
+
+    dataset_ref = client.dataset(dataset)
+    table_ref = dataset_ref.table(table)
+    staging_ref = dataset_ref.table(f"{table}_staging_{uuid.uuid4().hex[:8]}")
+
+    # csv carries no types, so the staging table takes the destination's schema
+    schema = None
+    if source_format == "CSV":
+        try:
+            schema = client.get_table(table_ref).schema
+        except NotFound:
+            pass
+
+    def load_chunk(chunk, chunk_write_disposition):
+        return load_to_staging_table(
+            chunk,
+            staging_ref,
+            client,
+            write_disposition=chunk_write_disposition,
+            source_format=source_format,
+            schema=schema,
         )
 
+    try:
+        chunks = iter(chunks)
+        rows = 0
+
+        # the first chunk creates the staging table
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return None
+        rows += len(first_chunk)
+        load_chunk(first_chunk, "WRITE_TRUNCATE")
+        del first_chunk
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = set()
+            for chunk in chunks:
+                if len(futures) >= max_workers:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                rows += len(chunk)
+                futures.add(executor.submit(load_chunk, chunk, "WRITE_APPEND"))
+                del chunk
+
+            for future in futures:
+                future.result()
+
+        staged_rows = client.get_table(staging_ref).num_rows
+        if staged_rows != rows:
+            raise Exception(
+                f"Staging table {staging_ref.table_id} has {staged_rows} rows, "
+                f"expected {rows}"
+            )
+
+        logger.info(f"copying {rows} staged rows to {dataset}.{table}")
+        job_config = bigquery.CopyJobConfig()
+        job_config.write_disposition = write_disposition
+        job = client.copy_table(staging_ref, table_ref, job_config=job_config)
+
         return job.result()
 
     except Exception as e:
         logger.error(e)
         raise e
 
+    finally:
+        client.delete_table(staging_ref, not_found_ok=True)
+
+
+def upsert_to_table(
+    dataset, table, df, keys, client, partition_key="element", partitions=None
+):
+    """
+    Replace the rows of a table for a set of partitions, with a single MERGE in BigQuery.
+
+    Rows that match on `keys` are updated, new rows are inserted, and rows of the
+    given partitions that are no longer present are deleted, e.g. fixtures that have
+    been played. Many elements can be refreshed in one statement by passing all of
+    their rows at once.
+
+    :param dataset: BigQuery dataset
+    :param table: BigQuery table
+    :param df: Dataframe with the same columns as the table
+    :param keys: An array of columns identifying a row, e.g. ["element", "fixture"],
+        or empty to replace every row of the partitions
+    :param client: BigQuery client, or a backend
+    :param partition_key: Column identifying the partitions being replaced
+    :param partitions: An array of partitions being replaced,
+        defaults to the values of `partition_key` in the dataframe
+    :return: Result of the merge query
+    """
+
+    if partitions is None:
+        partitions = df[partition_key].unique().tolist()
+    partitions = [int(i) for i in partitions]
+
+    if not partitions:
+        return None
+
+    return get_backend(client).upsert_table(
+        dataset, table, df, keys, partition_key, partitions
+    )
+
+
+class BigQueryBackend:
+    """
+    BigQuery behind the same `query`, `query_batches`, `write_table` and
+    `upsert_table` methods as `backends.LocalBackend`.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: BigQuery client
+        """
+        self.client = client
+
+    def query(self, sql, job_config=None, label="query"):
+        """
+        Run SQL and return a dataframe, recording the job's cost and latency.
+
+        :param sql: SQL query
+        :param job_config: Optional query job config, e.g. with query parameters
+        :param label: Name the call is recorded under in `metrics.job_metrics`
+        :return: Dataframe of query results
+        """
+        start = time.perf_counter()
+
+        bqstorage_client = clients.get_bqstorage_client()
+        job = self.client.query(sql, job_config=job_config)
+        rows = job.result()
+        converting = time.perf_counter()
+        df = rows.to_dataframe(bqstorage_client=bqstorage_client)
+        end = time.perf_counter()
+
+        metrics.job_metrics.record(
+            label,
+            end - start,
+            job=job,
+            rows=len(df),
+            to_dataframe_seconds=end - converting,
+        )
+        return df
+
+    def query_batches(self, sql, job_config=None, label="query"):
+        """
+        Run SQL and yield its results a Storage API stream page at a time,
+        recording the job's cost and latency once every batch is read.
+
+        :param sql: SQL query
+        :param job_config: Optional query job config, e.g. with query parameters
+        :param label: Name the call is recorded under in `metrics.job_metrics`
+        :return: Generator of dataframes of query results
+        """
+        start = time.perf_counter()
+        bqstorage_client = clients.get_bqstorage_client()
+        job = self.client.query(sql, job_config=job_config)
+        batches = job.result().to_dataframe_iterable(bqstorage_client=bqstorage_client)
+
+        return metrics.job_metrics.record_batches(label, batches, start, job=job)
+
+    def write_table(
+        self,
+        dataset,
+        table,
+        df,
+        write_disposition="WRITE_APPEND",
+        source_format="CSV",
+        chunk_rows=None,
+        max_workers=1,
+        range_partitioning=None,
+        clustering_fields=None,
+    ):
+        """
+        Write a dataframe to a table with a load job.
+
+        If `chunk_rows` is set and the dataframe is larger, it is written in chunks
+        with `write_chunks_to_table` so only a few chunks are serialised at a time.
+        Partitioning and clustering only apply to a table created by the load job.
+
+        :param dataset: BigQuery dataset
+        :param table: BigQuery table
+        :param df: Dataframe to write
+        :param write_disposition: Either "WRITE_APPEND" or "WRITE_TRUNCATE"
+        :param source_format: Either "CSV" or "PARQUET"
+        :param chunk_rows: Optional maximum number of rows serialised per load job
+        :param max_workers: Number of chunks loaded in parallel
+        :param range_partitioning: Optional bigquery.RangePartitioning of the table
+        :param clustering_fields: Optional array of columns to cluster the table by
+        :return: Result of the load or copy job
+        """
+
+        if chunk_rows and len(df) > chunk_rows:
+            if range_partitioning or clustering_fields:
+                raise Exception("chunked writes do not create partitioned tables")
+            return write_chunks_to_table(
+                dataset,
+                table,
+                iter_chunks(df, chunk_rows),
+                self.client,
+                write_disposition=write_disposition,
+                source_format=source_format,
+                max_workers=max_workers,
+            )
+
+        try:
+            dataset_ref = self.client.dataset(dataset)
+            table_ref = dataset_ref.table(table)
+
+            job_config = bigquery.LoadJobConfig()
+            job_config.source_format = source_format
+            job_config.write_disposition = write_disposition
+            if source_format == "CSV":
+                job_config.skip_leading_rows = 1
+            if range_partitioning:
+                job_config.range_partitioning = range_partitioning
+            if clustering_fields:
+                job_config.clustering_fields = clustering_fields
+
+            start = time.perf_counter()
+            bytes_buffer = get_load_file(df, source_format)
+
+            # load_table_from_file expects bytes
+            job = self.client.load_table_from_file(
+                bytes_buffer, table_ref, job_config=job_config
+            )
+            result = job.result()
+
+            metrics.job_metrics.record(
+                f"load:{dataset}.{table}",
+                time.perf_counter() - start,
+                job=job,
+                rows=len(df),
+            )
+            return result
+
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    def upsert_table(self, dataset, table, df, keys, partition_key, partitions):
+        """
+        Replace the rows of a table for a set of partitions with a single MERGE.
+
+        The dataframe is loaded into a staging table, then one MERGE updates rows
+        that match on `keys`, inserts new rows, and deletes rows of the partitions
+        that are no longer present.
+
+        :param dataset: BigQuery dataset
+        :param table: BigQuery table
+        :param df: Dataframe with the same columns as the table
+        :param keys: An array of columns identifying a row, or empty to replace
+            every row of the partitions
+        :param partition_key: Column identifying the partitions being replaced
+        :param partitions: An array of partitions being replaced
+        :return: Result of the merge query
+        """
+
+        dataset_ref = self.client.dataset(dataset)
+        table_ref = dataset_ref.table(table)
+        staging_ref = dataset_ref.table(f"{table}_staging_{uuid.uuid4().hex[:8]}")
+
+        # without keys no rows match, so the partitions' rows are deleted and reinserted
+        on = " AND ".join([f"T.{i} = S.{i}" for i in keys]) or "FALSE"
+        update = ", ".join(
+            [f"{i} = S.{i}" for i in df.columns if keys and i not in keys]
+        )
+        sql = f"""
+            MERGE `{table_ref.project}.{dataset}.{table}` T
+            USING `{staging_ref.project}.{dataset}.{staging_ref.table_id}` S
+            ON {on}
+            {f"WHEN MATCHED THEN UPDATE SET {update}" if update else ""}
+            WHEN NOT MATCHED BY TARGET THEN INSERT ROW
+            WHEN NOT MATCHED BY SOURCE AND T.{partition_key} IN UNNEST(@partitions)
+              THEN DELETE
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter("partitions", "INT64", partitions)
+            ]
+        )
+
+        try:
+            # staging takes the destination's schema so INSERT ROW lines up
+            load_to_staging_table(
+                df,
+                staging_ref,
+                self.client,
+                schema=self.client.get_table(table_ref).schema,
+            )
+
+            logger.info(f"merging {len(df)} rows into {dataset}.{table}")
+            start = time.perf_counter()
+            job = self.client.query(sql, job_config=job_config)
+            result = job.result()
+
+            metrics.job_metrics.record(
+                f"merge:{dataset}.{table}", time.perf_counter() - start, job=job
+            )
+            return result
+
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        finally:
+            self.client.delete_table(staging_ref, not_found_ok=True)
+
+
+def get_backend(client):
+    """
+    Get the backend a client's queries and writes go through.
+
+    :param client: BigQuery client, or a backend
+    :return: BigQueryBackend wrapping a BigQuery client, otherwise the backend itself
+    """
+    if isinstance(client, (BigQueryBackend, LocalBackend)):
+        return client
+    return BigQueryBackend(client)
+
 
 def create_cloud_task(
     task, queue, client, project="footbot-001", location="europe-west2", delay=None
@@ -138,10 +694,7 @@ def purge_cloud_queue(queue, client, project="footbot-001", location="europe-wes
 
 
 def check_next_event_deadlinetime():
-    bootstrap_request = requests.get(
-        "https://fantasy.premierleague.com/api/bootstrap-static/"
-    )
-    events = bootstrap_request.json()["events"]
+    events = fpl.get_bootstrap()["events"]
 
     deadlinetime_str = [i for i in events if i["is_next"]][0]["deadline_time"]
     deadlinetime = datetime.datetime.strptime(deadlinetime_str, "%Y-%m-%dT%H:%M:%SZ")
@@ -163,10 +716,7 @@ def get_current_event(bootstrap_data=None):
 
     if not bootstrap_data:
         logger.info("getting current event")
-        bootstrap_request = requests.get(
-            "https://fantasy.premierleague.com/api/bootstrap-static/"
-        )
-        bootstrap_data = bootstrap_request.json()
+        bootstrap_data = fpl.get_bootstrap()
 
     # if no events are current, current event is zero
     # season has yet to start
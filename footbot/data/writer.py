@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+from footbot.data import utils
+
+logger = logging.getLogger(__name__)
+
+
+class BigQueryWriteBackend:
+    """Append dataframes to BigQuery tables with a load job per write."""
+
+    def __init__(self, client=None):
+        """
+        :param client: BigQuery client, set up on first write if not provided
+        """
+        self.client = client
+
+    def write(self, dataset, table, df):
+        if self.client is None:
+            self.client = utils.set_up_bigquery()
+        utils.write_to_table(dataset, table, df, self.client)
+
+
+class MemoryWriteBackend:
+    """Hold written dataframes in memory, for tests and local runs."""
+
+    def __init__(self):
+        self.tables = {}
+
+    def write(self, dataset, table, df):
+        self.tables.setdefault((dataset, table), []).append(df)
+
+    def get_table(self, dataset, table):
+        dfs = self.tables.get((dataset, table), [])
+        return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
+
+class BatchWriter:
+    """
+    Buffer dataframes per destination table and write them in batches.
+
+    A table's buffer is flushed as one write when it reaches `max_rows` rows or
+    when its oldest dataframe is `max_seconds` old, checked as dataframes are
+    written, and every buffer is flushed when the writer is closed.
+    """
+
+    def __init__(
+        self,
+        backend,
+        max_rows=50000,
+        max_seconds=60,
+        clock=time.monotonic,
+        metrics=None,
+    ):
+        """
+        :param backend: Backend with a `write(dataset, table, df)` method
+        :param max_rows: Number of buffered rows at which a table is flushed
+        :param max_seconds: Age of the oldest buffered dataframe at which a table is flushed
+        :param clock: Function returning the current time in seconds
+        :param metrics: Optional deque to record flushed batches in, e.g. shared
+            by the writers of every sync
+        """
+        self.backend = backend
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.clock = clock
+
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.metrics = deque(maxlen=1000) if metrics is None else metrics
+
+    def write(self, dataset, table, df):
+        """
+        Add a dataframe to the buffer for a table, flushing it if a threshold is reached.
+
+        :param dataset: BigQuery dataset
+        :param table: BigQuery table
+        :param df: Dataframe to append to the table
+        """
+
+        if len(df) == 0:
+            return
+
+        key = (dataset, table)
+        with self.lock:
+            buffer = self.buffers.setdefault(
+                key, {"dfs": [], "rows": 0, "since": self.clock()}
+            )
+            buffer["dfs"].append(df)
+            buffer["rows"] += len(df)
+            is_due = self._is_due(buffer)
+
+        if is_due:
+            self.flush(dataset, table)
+
+    def flush(self, dataset=None, table=None):
+        """
+        Write buffered dataframes, for one table or for every table.
+
+        If a write fails, its dataframes are returned to the buffer before raising.
+
+        :param dataset: BigQuery dataset, flush every table if not provided
+        :param table: BigQuery table, flush every table if not provided
+        """
+
+        with self.lock:
+            if dataset is None:
+                keys = list(self.buffers)
+            else:
+                keys = [(dataset, table)] if (dataset, table) in self.buffers else []
+            buffers = [(k, self.buffers.pop(k)) for k in keys]
+
+        for i, (key, buffer) in enumerate(buffers):
+            try:
+                self._write(key, buffer)
+            except Exception as e:
+                logger.error(f"Unable to flush {key[0]}.{key[1]} with exception {e}")
+                self._restore(buffers[i:])
+                raise e
+
+    def flush_due(self):
+        """Flush every table whose buffer has reached a threshold."""
+
+        with self.lock:
+            keys = [k for k, b in self.buffers.items() if self._is_due(b)]
+
+        for dataset, table in keys:
+            self.flush(dataset, table)
+
+    def close(self):
+        """Flush every buffered table."""
+        self.flush()
+
+    def get_stats(self):
+        with self.lock:
+            buffered = {
+                f"{dataset}.{table}": b["rows"]
+                for (dataset, table), b in self.buffers.items()
+            }
+
+        return {"buffered_rows": buffered, "batches": list(self.metrics)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _is_due(self, buffer):
+        return (
+            buffer["rows"] >= self.max_rows
+            or self.clock() - buffer["since"] >= self.max_seconds
+        )
+
+    def _restore(self, buffers):
+        with self.lock:
+            for key, buffer in buffers:
+                existing = self.buffers.get(key)
+                if existing:
+                    buffer["dfs"] += existing["dfs"]
+                    buffer["rows"] += existing["rows"]
+                self.buffers[key] = buffer
+
+    def _write(self, key, buffer):
+        dataset, table = key
+        df = pd.concat(buffer["dfs"], ignore_index=True)
+
+        start = time.perf_counter()
+        self.backend.write(dataset, table, df)
+        seconds = time.perf_counter() - start
+
+        metrics = {
+            "table": f"{dataset}.{table}",
+            "dataframes": len(buffer["dfs"]),
+            "rows": len(df),
+            "bytes": int(df.memory_usage(deep=True).sum()),
+            "seconds": seconds,
+        }
+        self.metrics.append(metrics)
+        logger.info(
+            f"flushed {metrics['rows']} rows from {metrics['dataframes']} dataframes "
+            f"to {metrics['table']} in {seconds:.2f}s"
+        )
+
+
+# each sync or task buffers gameweek history in its own writer, so rows a failed
+# flush leaves behind are dropped with it rather than written by a later sync
+history_backend = BigQueryWriteBackend()
+history_metrics = deque(maxlen=1000)
+
+
+def get_history_writer():
+    """
+    Get a writer for the gameweek history of one sync or task.
+
+    :return: BatchWriter, recording its batches in `history_metrics`
+    """
+
+    return BatchWriter(
+        history_backend, max_rows=20000, max_seconds=120, metrics=history_metrics
+    )
@@ -3,10 +3,21 @@ import logging
 from flask import Flask
 from flask import request
 
+from footbot.data import clients
 from footbot.data import element_data
+from footbot.data import metrics
+from footbot.data import scheduler
+from footbot.data import sync
 from footbot.data import utils
+from footbot.data import writer
+from footbot.data.fpl import fpl_cache
+from footbot.data.fpl import fpl_scheduler
 from footbot.optimiser import team_selector
+from footbot.optimiser.predictions import prediction_loader
+from footbot.predictor import selection
+from footbot.predictor import snapshots
 from footbot.predictor import train_predict
+from footbot.predictor.artifacts import ArtifactStore
 
 log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.INFO, format=log_fmt)
@@ -15,8 +26,14 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# the fetch scheduler only paces requests within an instance, so history tasks are
+# also spread out at a fixed rate across every instance, after a delay that lets
+# the preceding deletes settle
+HISTORY_TASK_DELAY = 120
+HISTORY_TASKS_PER_SECOND = 2
 
-def create_update_element_history_fixtures_task(element, client):
+
+def create_update_element_history_fixtures_task(element, client, delay=None):
     logger.info(f"queueing element {element}")
 
     task = {
@@ -26,37 +43,32 @@ def create_update_element_history_fixtures_task(element, client):
         }
     }
 
-    utils.create_cloud_task(task, "update-element-history-fixtures", client, delay=120)
-
+    utils.create_cloud_task(
+        task, "update-element-history-fixtures", client, delay=delay
+    )
 
-def update_element_history_fixtures_worker(element, delete=False):
-    logger.info(f"setting up client for element {element}")
-    client = utils.set_up_bigquery()
 
+def update_element_history_fixtures_worker(element, writer=None):
     logger.info(f"getting element {element} gameweek history and fixtures")
-    (
-        element_history_df,
-        element_fixtures_df,
-    ) = element_data.get_element_history_fixture_dfs(element)
+    with fpl_scheduler.priority(scheduler.BACKGROUND):
+        (
+            element_history_df,
+            element_fixtures_df,
+        ) = element_data.get_element_history_fixture_dfs(element)
+
+    if writer is not None:
+        logger.info(f"buffering element {element} gameweek history and fixtures")
+        writer.write("fpl", "element_gameweeks_2122", element_history_df)
+        writer.write("fpl", "element_future_fixtures_2122", element_fixtures_df)
+        return
 
-    if delete:
-        logger.info(f"deleting element {element} gameweek history")
-        utils.run_query(
-            f"DELETE FROM `footbot-001.fpl.element_gameweeks_2122` WHERE element = {element}",
-            client,
-        )
+    logger.info(f"setting up client for element {element}")
+    client = utils.set_up_bigquery()
 
     logger.info(f"writing element {element} gameweek history")
     utils.write_to_table("fpl", "element_gameweeks_2122", element_history_df, client)
     logger.info(f"done writing element {element} gameweek history")
 
-    if delete:
-        logger.info(f"deleting element {element} fixtures")
-        utils.run_query(
-            f"DELETE FROM `footbot-001.fpl.element_future_fixtures_2122` WHERE element = {element}",
-            client,
-        )
-
     logger.info(f"writing element {element} fixtures")
     utils.write_to_table(
         "fpl", "element_future_fixtures_2122", element_fixtures_df, client
@@ -64,11 +76,133 @@ def update_element_history_fixtures_worker(element, delete=False):
     logger.info(f"done writing element {element} fixtures")
 
 
+def upsert_element_history_fixtures(elements, max_workers=16):
+    """
+    Refresh gameweek history and fixtures for some elements in place.
+
+    Each table is updated with a single MERGE covering every element, so rows of
+    other elements are untouched and readers never see the elements missing.
+
+    :param elements: An array of element identifiers
+    :param max_workers: Maximum number of concurrent requests to the FPL API
+    :return: Report of the fetch, including per element timings and failures
+    """
+
+    elements = [int(i) for i in elements]
+
+    (
+        element_history_df,
+        element_fixtures_df,
+        report,
+    ) = element_data.get_bulk_element_history_fixture_dfs(
+        elements, max_workers=max_workers
+    )
+    failed = set([i["element"] for i in report["failed"]])
+    elements = [i for i in elements if i not in failed]
+
+    client = utils.set_up_bigquery()
+
+    logger.info(f"merging gameweek history for {len(elements)} elements")
+    utils.upsert_to_table(
+        "fpl",
+        "element_gameweeks_2122",
+        element_history_df,
+        ["element", "fixture"],
+        client,
+        partitions=elements,
+    )
+    logger.info(f"merging fixtures for {len(elements)} elements")
+    utils.upsert_to_table(
+        "fpl",
+        "element_future_fixtures_2122",
+        element_fixtures_df,
+        ["element", "code"],
+        client,
+        partitions=elements,
+    )
+
+    return report
+
+
+def update_element_history_fixtures_bulk(max_workers=16):
+    """
+    Fetch gameweek history and fixtures for every element in one pass and replace tables.
+
+    Tables are only replaced if every element was fetched successfully.
+
+    :param max_workers: Maximum number of concurrent requests to the FPL API
+    :return: Report of the bulk fetch, including per element timings and failures
+    """
+
+    bootstrap_data = element_data.get_bootstrap()
+    elements = element_data.get_elements(bootstrap_data)
+
+    logger.info(f"getting gameweek history and fixtures for {len(elements)} elements")
+    (
+        element_history_df,
+        element_fixtures_df,
+        report,
+    ) = element_data.get_bulk_element_history_fixture_dfs(
+        elements, max_workers=max_workers
+    )
+    logger.info(
+        f"fetched {len(elements)} elements in {report['seconds']:.1f}s "
+        f"with {len(report['failed'])} failures"
+    )
+
+    if report["failed"]:
+        for failure in report["failed"]:
+            logger.error(
+                f"Unable to get element {failure['element']} "
+                f"with exception {failure['error']}"
+            )
+        return report
+
+    client = utils.set_up_bigquery()
+
+    logger.info("writing element gameweek history")
+    utils.write_to_table(
+        "fpl",
+        "element_gameweeks_2122",
+        element_history_df,
+        client,
+        write_disposition="WRITE_TRUNCATE",
+        chunk_rows=50000,
+        max_workers=4,
+    )
+    logger.info("writing element fixtures")
+    utils.write_to_table(
+        "fpl",
+        "element_future_fixtures_2122",
+        element_fixtures_df,
+        client,
+        write_disposition="WRITE_TRUNCATE",
+        chunk_rows=50000,
+        max_workers=4,
+    )
+    logger.info("done writing element gameweek history and fixtures")
+
+    return report
+
+
 @app.route("/")
 def home_route():
     return "Greetings!"
 
 
+@app.route("/stats")
+def stats_route():
+    return {
+        "clients": clients.get_stats(),
+        "fpl_cache": dict(fpl_cache.stats),
+        "fpl_scheduler": fpl_scheduler.get_stats(),
+        "query_cache": utils.query_cache.get_stats(),
+        "prediction_matrix": prediction_loader.get_stats(),
+        "warehouse": metrics.job_metrics.get_stats(),
+        "history_writer": {"batches": list(writer.history_metrics)},
+    }
+
+
 @app.route("/update_element_data")
 def update_element_data_route():
     logger.info("getting element data")
@@ -102,70 +236,193 @@ def update_element_history_fixtures_route():
     utils.run_query(
         "DELETE FROM `footbot-001.fpl.element_gameweeks_2122` WHERE true",
         big_query_client,
+        label="delete_history",
     )
     logger.info("deleting element fixtures")
     utils.run_query(
         "DELETE FROM `footbot-001.fpl.element_future_fixtures_2122` WHERE true",
         big_query_client,
+        label="delete_fixtures",
     )
 
     logger.info("queueing elements")
 
-    for element in elements:
-        create_update_element_history_fixtures_task(element, tasks_client)
+    for i, element in enumerate(elements):
+        create_update_element_history_fixtures_task(
+            element,
+            tasks_client,
+            delay=HISTORY_TASK_DELAY + i / HISTORY_TASKS_PER_SECOND,
+        )
 
     logger.info("elements queued")
 
     return "elements queued"
 
 
+@app.route("/update_element_history_fixtures_bulk")
+def update_element_history_fixtures_bulk_route():
+    max_workers = int(request.args.get("max_workers", 16))
+
+    report = update_element_history_fixtures_bulk(max_workers=max_workers)
+
+    summary = {
+        "elements": report["elements"],
+        "failed": report["failed"],
+        "seconds": report["seconds"],
+        "slowest": sorted(report["timings"], key=lambda x: -x["seconds"])[:10],
+    }
+
+    if report["failed"]:
+        return summary, 500
+
+    return summary
+
+
+@app.route("/sync_element_history_fixtures")
+def sync_element_history_fixtures_route():
+    max_workers = int(request.args.get("max_workers", 16))
+
+    client = utils.set_up_bigquery()
+    report = sync.sync_element_history_fixtures(client, max_workers=max_workers)
+    logger.info(
+        f"synced {report['elements']} elements in {report['seconds']:.1f}s "
+        f"with {len(report['failed'])} failures"
+    )
+
+    return report
+
+
 @app.route("/update_element_history_fixtures/<element>", methods=["POST"])
 def update_element_history_fixtures_element_route_post(element):
     try:
-        update_element_history_fixtures_worker(element)
+        # the task is only acknowledged once its rows are written, so Cloud Tasks
+        # retries it if the write fails or the instance shuts down first
+        with writer.get_history_writer() as task_writer:
+            update_element_history_fixtures_worker(element, writer=task_writer)
         return "lovely stuff"
     except Exception as e:
         logger.error(f"Unable to update element {element} with exception {e}")
-        return "bad news!"
+        return "bad news!", 500
 
 
 @app.route("/update_element_history_fixtures/<element>", methods=["PUT"])
 def update_element_history_fixtures_element_route_put(element):
     try:
-        update_element_history_fixtures_worker(element, delete=True)
+        report = upsert_element_history_fixtures([element])
+        if report["failed"]:
+            raise Exception(report["failed"][0]["error"])
         return "lovely stuff"
     except Exception as e:
         logger.error(f"Unable to update element {element} with exception {e}")
         return "bad news!"
 
 
+@app.route("/update_element_history_fixtures", methods=["PUT"])
+def update_element_history_fixtures_elements_route_put():
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get("elements"), list):
+        return "Data must contain a list of 'elements'", 400
+
+    report = upsert_element_history_fixtures(data["elements"])
+
+    summary = {
+        "elements": report["elements"],
+        "failed": report["failed"],
+        "seconds": report["seconds"],
+    }
+
+    if report["failed"]:
+        return summary, 500
+
+    return summary
+
+
 @app.route("/update_predictions")
 def update_predictions_route():
+    # score with the latest stored model, without getting training data, which is
+    # the incremental model if `incremental` is also set
+    predict_only = request.args.get("predict_only", "false").lower() == "true"
+    # update the incremental model with new gameweeks rather than refit
+    incremental = request.args.get("incremental", "false").lower() == "true"
+    # only rescore and replace elements whose features have changed
+    delta = request.args.get("delta", "false").lower() == "true"
+
     client = utils.set_up_bigquery()
 
-    predict_df = train_predict.get_predicted_points_df(
-        "./footbot/predictor/sql/train.sql",
-        "./footbot/predictor/sql/predict.sql",
-        client,
-    )
+    base_version = elements = None
+    if delta:
+        base_version = snapshots.get_current_version(client)
+
+    if base_version is not None:
+        predict_df, elements = train_predict.get_predicted_points_delta_df(
+            "train",
+            "predict",
+            client,
+            snapshots.get_snapshot_hashes_df(client, base_version),
+            store=ArtifactStore(),
+            predict_only=predict_only,
+            incremental=incremental,
+        )
+        if not elements:
+            return "predictions unchanged"
+
+        logger.info(f"replacing predictions of {len(elements)} elements")
+        message = f"predictions updated for {len(elements)} elements"
+    else:
+        predict_df = train_predict.get_predicted_points_df(
+            "train",
+            "predict",
+            client,
+            store=ArtifactStore(),
+            predict_only=predict_only,
+            incremental=incremental,
+        )
+        message = "predictions updated"
 
     logger.info("writing predictions")
-    utils.write_to_table(
-        "fpl",
-        "element_gameweeks_predictions_2122_v01",
-        predict_df,
-        client,
-        write_disposition="WRITE_TRUNCATE",
+    version = snapshots.save_snapshot(
+        predict_df, client, base_version=base_version, elements=elements
+    )
+    logger.info(f"done writing predictions, published snapshot {version}")
+
+    return message
+
+
+# selection runs within a request, so its budget leaves the rest of gunicorn's
+# 600s timeout for getting training data and storing the winner
+SELECTION_BUDGET_SECONDS = 240
+MAX_SELECTION_BUDGET_SECONDS = 300
+
+
+@app.route("/select_model")
+def select_model_route():
+    try:
+        budget_seconds = float(
+            request.args.get("budget_seconds", SELECTION_BUDGET_SECONDS)
+        )
+    except ValueError:
+        return "budget_seconds must be a number", 400
+
+    if not 0 < budget_seconds <= MAX_SELECTION_BUDGET_SECONDS:
+        return (
+            f"budget_seconds must be between 0 and {MAX_SELECTION_BUDGET_SECONDS}, "
+            "run `footbot select-model` for longer selections",
+            400,
+        )
+
+    client = utils.set_up_bigquery()
+
+    ranking = selection.run_model_selection(
+        client, store=ArtifactStore(), budget_seconds=budget_seconds
     )
-    logger.info("done writing predictions")
 
-    return "predictions updated"
+    return {"ranking": ranking.to_dict(orient="records")}
 
 
 @app.route("/optimise_team/<entry>", methods=["GET", "POST"])
 def optimise_team_route(entry, optimise_entry=team_selector.optimise_entry):
 
-    if request.data and request.content_type != 'application/json':
+    if request.data and request.content_type != "application/json":
         return "Request content-type must be application/json", 400
 
     login = password = None
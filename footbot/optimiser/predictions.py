@@ -0,0 +1,311 @@
+import copy
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from footbot.data import utils
+from footbot.predictor import snapshots
+
+logger = logging.getLogger(__name__)
+
+EVENTS = 38
+
+# tables whose last modified times make up the version of a matrix, along with
+# the published prediction snapshot
+SOURCE_TABLES = [
+    "footbot-001.fpl.element_data_2122",
+]
+
+
+class PredictionMatrix:
+    """
+    Predicted points of every element for every event, with element attributes.
+
+    Points are held in a dense elements × events array, so the average over any
+    window of events is a slice and a sum. Predictions may only cover events from
+    `start_event`, in which case earlier windows cannot be averaged.
+    """
+
+    def __init__(self, predictions_df, attributes_df, version=None, start_event=1):
+        """
+        :param predictions_df: Dataframe of `element`, `event`, `predicted_total_points`
+            and optionally `prediction_version`
+        :param attributes_df: Dataframe of current attributes per element, i.e.
+            `element`, `element_type`, `value`, `team`, `safe_web_name` and `prob_playing`
+        :param version: Identifier of the data the matrix was built from
+        :param start_event: First event of the predictions
+        """
+        self.version = version
+        self.start_event = start_event
+
+        self.elements = attributes_df["element"].to_numpy(dtype=np.int64)
+        self.element_type = attributes_df["element_type"].to_numpy(dtype=np.int64)
+        self.value = attributes_df["value"].to_numpy(dtype=np.int64)
+        self.team = attributes_df["team"].to_numpy(dtype=np.int64)
+        self.prob_playing = attributes_df["prob_playing"].to_numpy(dtype=np.float32)
+        self.safe_web_name = attributes_df["safe_web_name"].to_numpy(dtype=object)
+
+        self.points = np.zeros((len(self.elements), EVENTS), dtype=np.float32)
+        self.prediction_version = None
+        self._add_predictions(predictions_df)
+
+    def get_updated(self, predictions_df, version=None, elements=None):
+        """
+        Get a copy of the matrix with the predictions of some elements replaced.
+
+        :param predictions_df: Dataframe of every prediction of the replaced elements
+        :param version: Identifier of the data the copy is built from
+        :param elements: An array of replaced elements, including any no longer
+            predicted, defaults to the elements of `predictions_df`
+        :return: PredictionMatrix
+        """
+
+        if elements is None:
+            elements = predictions_df["element"]
+
+        matrix = copy.copy(self)
+        matrix.version = version
+        matrix.points = self.points.copy()
+
+        rows = pd.Series(self.elements).isin(elements).to_numpy()
+        matrix.points[rows] = 0
+        matrix._add_predictions(predictions_df)
+
+        return matrix
+
+    def _add_predictions(self, predictions_df):
+        # predictions of elements without attributes are dropped, like the SQL join
+        index = {e: i for i, e in enumerate(self.elements)}
+        rows = predictions_df["element"].map(index)
+        events = predictions_df["event"]
+        is_known = rows.notna() & events.between(1, EVENTS)
+
+        np.add.at(
+            self.points,
+            (
+                rows[is_known].to_numpy(dtype=np.int64),
+                events[is_known].to_numpy(dtype=np.int64) - 1,
+            ),
+            predictions_df.loc[is_known, "predicted_total_points"].to_numpy(
+                dtype=np.float32
+            ),
+        )
+
+        if "prediction_version" in predictions_df and len(predictions_df):
+            self.prediction_version = max(
+                self.prediction_version or 0,
+                int(predictions_df["prediction_version"].max()),
+            )
+
+    @property
+    def nbytes(self):
+        return sum(
+            i.nbytes
+            for i in [
+                self.points,
+                self.elements,
+                self.element_type,
+                self.value,
+                self.team,
+                self.prob_playing,
+                self.safe_web_name,
+            ]
+        )
+
+    def get_average_points(self, start_event, end_event):
+        """
+        Get each element's mean predicted points per event over a window,
+        weighted by its chance of playing.
+
+        :param start_event: First event of the window
+        :param end_event: Last event of the window
+        :return: Array of average points per element
+        """
+        if start_event > end_event:
+            raise Exception("start_event must not be after end_event")
+        if max(start_event, 1) < self.start_event:
+            raise Exception(f"predictions start at event {self.start_event}")
+
+        start, end = max(start_event, 1) - 1, min(end_event, EVENTS)
+        points = self.points[:, start:end]
+        return points.sum(axis=1) / (end_event - start_event + 1) * self.prob_playing
+
+    def get_players(self, start_event, end_event):
+        """
+        Get player data for the optimiser.
+
+        :param start_event: First event of the window
+        :param end_event: Last event of the window
+        :return: An array of dictionaries of player data, best first
+        """
+
+        average_points = self.get_average_points(start_event, end_event)
+        order = np.argsort(-average_points, kind="stable")
+
+        return [
+            {
+                "element": e,
+                "element_type": t,
+                "value": v,
+                "team": tm,
+                "average_points": p,
+                "safe_web_name": n,
+            }
+            for e, t, v, tm, p, n in zip(
+                self.elements[order].tolist(),
+                self.element_type[order].tolist(),
+                self.value[order].tolist(),
+                self.team[order].tolist(),
+                average_points[order].astype(float).tolist(),
+                self.safe_web_name[order].tolist(),
+            )
+        ]
+
+
+class PredictionMatrixLoader:
+    """
+    Hold the current prediction matrix, reloading it when a new prediction snapshot
+    is published or its source tables change.
+
+    The published snapshot and source tables are checked at most once every
+    `check_interval` seconds. If only the snapshot has changed, only the elements
+    with newer predictions are reloaded. Only predictions from the earliest event
+    asked for are loaded, so partitions of past events are not read.
+    """
+
+    def __init__(self, check_interval=60, cache=None, clock=time.monotonic):
+        """
+        :param check_interval: Seconds between checks of the source tables
+        :param cache: Optional QueryCache used to load the matrix
+        :param clock: Function returning the current time in seconds
+        """
+        self.check_interval = check_interval
+        self.cache = cache
+        self.clock = clock
+
+        self.matrix = None
+        self.checked = None
+        self.lock = threading.Lock()
+        self.stats = {
+            "loads": 0,
+            "load_seconds": 0.0,
+            "delta_loads": 0,
+            "delta_elements": 0,
+        }
+
+    def get_version(self, client):
+        snapshot_version = snapshots.get_current_version(client)
+        if snapshot_version is None:
+            raise Exception("no prediction snapshot has been published")
+
+        return (snapshot_version,) + tuple(
+            str(client.get_table(ref).modified) for ref in SOURCE_TABLES
+        )
+
+    def get(self, client, start_event=1):
+        """
+        Get the prediction matrix, loading it if it is missing or out of date.
+
+        :param client: BigQuery client
+        :param start_event: First event the matrix must hold predictions of
+        :return: PredictionMatrix
+        """
+
+        with self.lock:
+            now = self.clock()
+            covered = self.matrix is not None and self.matrix.start_event <= start_event
+            if (
+                covered
+                and self.checked is not None
+                and now - self.checked < self.check_interval
+            ):
+                return self.matrix
+
+            version = self.get_version(client)
+            self.checked = now
+            if not covered:
+                self.matrix = self.load(client, version, start_event)
+            elif self.matrix.version != version:
+                # versions are the snapshot version, then ordered like SOURCE_TABLES
+                if (
+                    self.matrix.prediction_version is not None
+                    and self.matrix.version[1:] == version[1:]
+                ):
+                    self.matrix = self.load_delta(client, version)
+                else:
+                    self.matrix = self.load(client, version, start_event)
+
+            return self.matrix
+
+    def load(self, client, version, start_event):
+        logger.info(
+            f"loading prediction matrix for version {version} from event {start_event}"
+        )
+        start = time.perf_counter()
+
+        matrix = PredictionMatrix(
+            utils.run_templated_query(
+                "element_predictions",
+                dict(snapshot_version=version[0], start_event=start_event),
+                client,
+                self.cache,
+            ),
+            utils.run_templated_query("element_attributes", {}, client, self.cache),
+            version=version,
+            start_event=start_event,
+        )
+
+        seconds = time.perf_counter() - start
+        self.stats["loads"] += 1
+        self.stats["load_seconds"] += seconds
+        logger.info(
+            f"loaded {len(matrix.elements)} elements in {seconds:.2f}s, "
+            f"using {matrix.nbytes} bytes"
+        )
+        return matrix
+
+    def load_delta(self, client, version):
+        logger.info(f"loading changed predictions for version {version}")
+        start = time.perf_counter()
+
+        predictions_df = utils.run_templated_query(
+            "element_predictions_delta",
+            dict(
+                snapshot_version=version[0],
+                base_version=self.matrix.version[0],
+                prediction_version=self.matrix.prediction_version,
+                start_event=self.matrix.start_event,
+            ),
+            client,
+            self.cache,
+        )
+        # elements no longer predicted come back as a row without an event
+        elements = predictions_df["element"].unique()
+        matrix = self.matrix.get_updated(
+            predictions_df[predictions_df["event"].notna()],
+            version=version,
+            elements=elements,
+        )
+
+        self.stats["delta_loads"] += 1
+        self.stats["delta_elements"] += len(elements)
+        logger.info(
+            f"reloaded {len(elements)} elements in {time.perf_counter() - start:.2f}s"
+        )
+        return matrix
+
+    def get_stats(self):
+        with self.lock:
+            matrix = self.matrix
+            return {
+                **self.stats,
+                "version": matrix and matrix.version,
+                "elements": matrix and len(matrix.elements),
+                "bytes": matrix and matrix.nbytes,
+            }
+
+
+prediction_loader = PredictionMatrixLoader(cache=utils.query_cache)
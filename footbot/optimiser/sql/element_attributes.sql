@@ -0,0 +1,21 @@
+SELECT
+  element,
+  element_type,
+  now_cost AS value,
+  team,
+  safe_web_name,
+  prob_playing
+FROM (
+  SELECT
+    element,
+    element_type,
+    now_cost,
+    team,
+    safe_web_name,
+    COALESCE(chance_of_playing_next_round,
+      100)/100 AS prob_playing,
+    ROW_NUMBER() OVER(PARTITION BY element ORDER BY datetime DESC) AS is_current,
+  FROM
+    `footbot-001.fpl.element_data_2122` )
+WHERE
+  is_current = 1
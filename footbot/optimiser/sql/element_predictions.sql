@@ -0,0 +1,12 @@
+-- @snapshot_version INT64
+-- @start_event INT64
+SELECT
+  element,
+  event,
+  predicted_total_points,
+  prediction_version
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version = @snapshot_version
+  AND event >= @start_event
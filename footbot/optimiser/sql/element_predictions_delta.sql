@@ -0,0 +1,43 @@
+-- @snapshot_version INT64
+-- @base_version INT64
+-- @prediction_version INT64
+-- @start_event INT64
+SELECT
+  element,
+  event,
+  predicted_total_points,
+  prediction_version
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version = @snapshot_version
+  AND event >= @start_event
+  AND element IN (
+  SELECT
+    element
+  FROM
+    `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+  WHERE
+    snapshot_version = @snapshot_version
+    AND event >= @start_event
+    AND prediction_version > @prediction_version)
+UNION ALL
+-- elements of the base snapshot no longer predicted, as a row without an event
+SELECT
+  DISTINCT element,
+  NULL AS event,
+  NULL AS predicted_total_points,
+  NULL AS prediction_version
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version = @base_version
+  AND event >= @start_event
+  AND element NOT IN (
+  SELECT
+    element
+  FROM
+    `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+  WHERE
+    snapshot_version = @snapshot_version
+    AND event >= @start_event)
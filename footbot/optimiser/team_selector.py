@@ -4,9 +4,11 @@ import cvxpy as cp
 import numpy as np
 import requests
 
+from footbot.data import fpl
+from footbot.data.scheduler import HIGH
 from footbot.data.utils import get_current_event
-from footbot.data.utils import run_templated_query
 from footbot.data.utils import set_up_bigquery
+from footbot.optimiser.predictions import prediction_loader
 
 logger = logging.getLogger(__name__)
 
@@ -284,12 +286,17 @@ def get_private_entry_data(entry, login, password):
     }
 
     logger.info("authenticating for entry")
-    resp = session.post("https://users.premierleague.com/accounts/login/", headers=headers, data=payload)
+    resp = session.post(
+        "https://users.premierleague.com/accounts/login/",
+        headers=headers,
+        data=payload,
+        timeout=fpl.fpl_client.timeout,
+    )
     resp.raise_for_status()
 
     logger.info("getting private entry data")
     private_data = session.get(
-        f"https://fantasy.premierleague.com/api/my-team/{entry}"
+        f"{fpl.FPL_API_URL}/my-team/{entry}", timeout=fpl.fpl_client.timeout
     ).json()
 
     return private_data
@@ -305,13 +312,18 @@ def get_public_entry_data(entry):
     :return: Dictionary of public entry data
     """
 
-    current_event = get_current_event()
+    # a user is waiting, so go ahead of background refreshes
+    with fpl.fpl_scheduler.priority(HIGH):
+        bootstrap_data = fpl.get_bootstrap()
+        current_event = get_current_event(bootstrap_data)
 
-    logger.info("getting entry data")
-    entry_request = requests.get(
-        f"https://fantasy.premierleague.com/api/entry/{entry}/event/{current_event}/picks/"
-    )
-    public_data = entry_request.json()
+        # picks for a finished event can no longer change
+        finished = any(
+            i["finished"] for i in bootstrap_data["events"] if i["id"] == current_event
+        )
+
+        logger.info("getting entry data")
+        public_data = fpl.get_entry_picks(entry, current_event, finished=finished)
 
     return public_data
 
@@ -374,11 +386,9 @@ def optimise_entry(
 
     logger.info("getting predictions")
     client = set_up_bigquery()
-    players = run_templated_query(
-        "./footbot/optimiser/sql/optimiser.sql",
-        dict(start_event=start_event, end_event=end_event),
-        client,
-    ).to_dict("records")
+    players = prediction_loader.get(client, start_event).get_players(
+        start_event, end_event
+    )
 
     if login and password:
         private_data = get_private_entry_data(entry, login, password)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import joblib
+import pandas as pd
+import sklearn
+from google.api_core.exceptions import NotFound
+
+from footbot.data import clients
+
+logger = logging.getLogger(__name__)
+
+# App Engine's filesystem is read-only other than /tmp, which is per instance, so
+# set FOOTBOT_ARTIFACT_BUCKET to a GCS bucket to share artifacts between instances
+ARTIFACT_DIR = os.path.join(tempfile.gettempdir(), "footbot", "artifacts")
+
+
+def get_fingerprint(train_df, features, hyperparameters):
+    """
+    Fingerprint the inputs of a model fit.
+
+    Two fits with the same fingerprint produce the same model, so a stored model
+    can be reused rather than refitted.
+
+    :param train_df: Training dataframe
+    :param features: Dictionary of feature names by kind, e.g. "categorical"
+    :param hyperparameters: Dictionary of model hyperparameters
+    :return: Hex digest
+    """
+
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            {
+                "columns": [[c, str(t)] for c, t in train_df.dtypes.items()],
+                "features": features,
+                "hyperparameters": hyperparameters,
+                "sklearn": sklearn.__version__,
+            },
+            sort_keys=True,
+        ).encode("utf-8")
+    )
+    digest.update(
+        pd.util.hash_pandas_object(train_df, index=False).to_numpy().tobytes()
+    )
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Fitted models stored with joblib, by fingerprint.
+
+    Each model is stored as `{name}/{fingerprint}.joblib` next to a JSON file of its
+    metadata, and `{name}/latest.json` points at the most recent one. Files are
+    written under a local directory and, if a GCS bucket is given, uploaded to it,
+    so every instance reads the same models. The local directory then caches
+    downloaded models, which never change once stored.
+    """
+
+    def __init__(self, root=None, bucket=None):
+        """
+        :param root: Artifact directory, defaults to FOOTBOT_ARTIFACT_DIR or a
+            directory under /tmp
+        :param bucket: Optional GCS bucket, or bucket name, defaults to
+            FOOTBOT_ARTIFACT_BUCKET
+        """
+        self.root = root or os.environ.get("FOOTBOT_ARTIFACT_DIR", ARTIFACT_DIR)
+
+        bucket = bucket or os.environ.get("FOOTBOT_ARTIFACT_BUCKET")
+        if isinstance(bucket, str):
+            bucket = clients.get_storage_client().bucket(bucket)
+        self.bucket = bucket
+
+    def get_path(self, name, filename):
+        return os.path.join(self.root, name, filename)
+
+    def exists(self, name, fingerprint):
+        filename = f"{fingerprint}.joblib"
+        if os.path.exists(self.get_path(name, filename)):
+            return True
+        return (
+            self.bucket is not None and self.bucket.blob(f"{name}/{filename}").exists()
+        )
+
+    def save(self, name, fingerprint, model, metadata):
+        """
+        Store a fitted model and make it the latest for its name.
+
+        A model that cannot be stored is logged rather than raised, as it can be
+        fitted again.
+
+        :param name: Model name, e.g. "points"
+        :param fingerprint: Fingerprint of the fit's inputs
+        :param model: Fitted model
+        :param metadata: Dictionary describing the model, e.g. its features
+        :return: Boolean of whether the model was stored
+        """
+
+        metadata = {**metadata, "fingerprint": fingerprint}
+        metadata_json = json.dumps(metadata, sort_keys=True).encode("utf-8")
+
+        try:
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+            # the pointer goes last, so it never names a model that is not stored
+            for filename, write in [
+                (f"{fingerprint}.joblib", lambda f: joblib.dump(model, f)),
+                (f"{fingerprint}.json", lambda f: f.write(metadata_json)),
+                ("latest.json", lambda f: f.write(metadata_json)),
+            ]:
+                self._upload(name, filename, write)
+        except Exception as e:
+            logger.warning(f"unable to save {name} model {fingerprint}: {e}")
+            return False
+
+        logger.info(f"saved {name} model {fingerprint}")
+        return True
+
+    def set_latest(self, name, fingerprint):
+        """
+        Make a stored model the latest for its name, e.g. when a fit reuses it.
+
+        A pointer that cannot be updated is logged rather than raised, like a save.
+
+        :param name: Model name
+        :param fingerprint: Fingerprint of the stored model
+        :return: Boolean of whether the pointer was updated
+        """
+
+        filename = f"{fingerprint}.json"
+        try:
+            self._download(name, filename)
+            with open(self.get_path(name, filename), "rb") as f:
+                metadata_json = f.read()
+            self._upload(name, "latest.json", lambda f: f.write(metadata_json))
+        except Exception as e:
+            logger.warning(f"unable to point at {name} model {fingerprint}: {e}")
+            return False
+
+        logger.info(f"pointed at {name} model {fingerprint}")
+        return True
+
+    def load(self, name, fingerprint=None):
+        """
+        Load a stored model.
+
+        :param name: Model name
+        :param fingerprint: Fingerprint of the model, defaults to the latest
+        :return: Tuple of model and metadata
+        """
+
+        filename = f"{fingerprint}.json" if fingerprint else "latest.json"
+        # another instance may have saved a newer latest model
+        self._download(name, filename, refresh=fingerprint is None)
+        try:
+            with open(self.get_path(name, filename), "r") as f:
+                metadata = json.load(f)
+        except OSError:
+            raise Exception(
+                f"no stored {name} model {fingerprint or ''} in {self.root}"
+            )
+
+        filename = f"{metadata['fingerprint']}.joblib"
+        self._download(name, filename)
+        model = joblib.load(self.get_path(name, filename))
+        logger.info(f"loaded {name} model {metadata['fingerprint']}")
+        return model, metadata
+
+    def _download(self, name, filename, refresh=False):
+        path = self.get_path(name, filename)
+        if self.bucket is None or (os.path.exists(path) and not refresh):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self.bucket.blob(f"{name}/{filename}").download_to_filename(tmp_path)
+        except NotFound:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+
+    def _upload(self, name, filename, write):
+        self._write(name, filename, write)
+        if self.bucket is not None:
+            self.bucket.blob(f"{name}/{filename}").upload_from_filename(
+                self.get_path(name, filename)
+            )
+
+    def _write(self, name, filename, write):
+        path = self.get_path(name, filename)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,509 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.train_predict import CATEGORICAL_FEATURES
+
+logger = logging.getLogger(__name__)
+
+FEATURES_NAME = "features"
+
+HISTORY_TABLE = "element_gameweeks_2122"
+FIXTURES_TABLE = "element_future_fixtures_2122"
+ELEMENT_TABLE = "element_data_2122"
+TRAIN_FEATURES_TABLE = "element_gameweeks_features_all_v01"
+PREDICT_FEATURES_TABLE = "element_gameweeks_prediction_features_2122_v01"
+
+SEASON = "2122"
+
+# statistics averaged over each element's previous fixtures
+ELEMENT_STATS = [
+    "total_points",
+    "minutes",
+    "goals_scored",
+    "assists",
+    "clean_sheets",
+    "goals_conceded",
+    "saves",
+    "bonus",
+    "bps",
+    "influence",
+    "creativity",
+    "threat",
+]
+
+# statistics averaged over each team's previous fixtures, for a team and its opponent
+TEAM_STATS = ["goals_scored", "goals_conceded"]
+
+# numbers of previous fixtures averaged over, e.g. `rolling_avg_minutes_element_p10`
+WINDOWS = [3, 10]
+
+# kick off hours in UTC
+EARLY_HOUR = 13
+LATE_HOUR = 16
+
+# statistics and identifiers kept in the training features table, and left out of
+# the model by `train.sql`
+TRAIN_COLUMNS = [
+    "goals_scored",
+    "assists",
+    "clean_sheets",
+    "goals_conceded",
+    "saves",
+    "minutes",
+    "element",
+    "element_all",
+    "safe_web_name",
+    "event",
+    "event_all",
+    "season",
+    "fixture",
+]
+
+
+def get_kickoff_features(kickoff_time):
+    """
+    Get the kick off categorical features of fixtures.
+
+    :param kickoff_time: Series of kick off times in UTC
+    :return: Dataframe of `was_sunday`, `was_weekday`, `was_late` and `was_early`
+    """
+
+    kickoff_time = pd.to_datetime(kickoff_time, utc=True)
+    return pd.DataFrame(
+        {
+            "was_sunday": (kickoff_time.dt.dayofweek == 6).to_numpy(),
+            "was_weekday": (kickoff_time.dt.dayofweek < 5).to_numpy(),
+            "was_late": (kickoff_time.dt.hour >= LATE_HOUR).to_numpy(),
+            "was_early": (kickoff_time.dt.hour < EARLY_HOUR).to_numpy(),
+        }
+    )
+
+
+def get_latest_element_df(element_df):
+    """
+    Get the latest team, position and name of each element.
+
+    :param element_df: Element data dataframe, optionally with a row per snapshot
+    :return: Dataframe with a row per element
+    """
+
+    if "datetime" in element_df:
+        element_df = element_df.sort_values("datetime", kind="stable")
+    return element_df.drop_duplicates("element", keep="last")[
+        ["element", "element_type", "team", "safe_web_name"]
+    ]
+
+
+def get_fixture_teams(history_df):
+    """
+    Get the team each gameweek history row was played for.
+
+    History rows only name the opponent, so a row's team is the opponent of the
+    other side of its fixture, and elements that have since transferred keep the
+    team they played for. Rows of fixtures without a row for the other side fall
+    back to the element's team in `team`.
+
+    :param history_df: Gameweek history dataframe with each element's latest `team`
+    :return: Array of teams
+    """
+
+    was_home = history_df["was_home"].to_numpy(dtype=bool)
+    sides = pd.DataFrame(
+        {
+            "fixture": history_df["fixture"].to_numpy(),
+            "was_home": ~was_home,
+            "fixture_team": history_df["opponent_team"].to_numpy(),
+        }
+    ).drop_duplicates(["fixture", "was_home"])
+
+    teams = (
+        pd.DataFrame(
+            {"fixture": history_df["fixture"].to_numpy(), "was_home": was_home}
+        )
+        .merge(sides, on=["fixture", "was_home"], how="left")["fixture_team"]
+        .to_numpy(dtype=np.float64, na_value=np.nan)
+    )
+    latest_teams = history_df["team"].to_numpy()
+
+    return np.where(np.isnan(teams), latest_teams, teams).astype(latest_teams.dtype)
+
+
+class RollingWindows:
+    """
+    The last observations of some statistics for each of a set of keys, e.g. elements.
+
+    Observations are held in an array of keys by observations by statistics, most
+    recent last and padded with NaN, so means over the windows of many keys are
+    computed at once.
+    """
+
+    def __init__(self, stats, size):
+        """
+        :param stats: An array of statistic names
+        :param size: Number of observations kept per key
+        """
+        self.stats = list(stats)
+        self.size = size
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.values = np.full((0, size, len(self.stats)), np.nan)
+
+    def get_values(self, keys):
+        """
+        :param keys: An array of keys
+        :return: Array of keys by observations by statistics, NaN for unseen keys
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        index = np.clip(np.searchsorted(self.keys, keys), 0, max(len(self.keys) - 1, 0))
+        found = (
+            self.keys[index] == keys if len(self.keys) else np.zeros(len(keys), bool)
+        )
+
+        values = np.full((len(keys), self.size, len(self.stats)), np.nan)
+        values[found] = self.values[index[found]]
+        return values
+
+    def get_means(self, keys, window):
+        """
+        Get the mean of each statistic over the last observations of each key.
+
+        :param keys: An array of keys
+        :param window: Number of observations
+        :return: Array of keys by statistics, NaN for keys without observations
+        """
+        start = self.size - window
+        values = self.get_values(keys)[:, start:, :]
+        observed = ~np.isnan(values)
+        counts = observed.sum(axis=1)
+        sums = np.where(observed, values, 0).sum(axis=1)
+        return np.divide(
+            sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0
+        )
+
+    def push(self, keys, values):
+        """
+        Add an observation for each of a set of distinct keys.
+
+        :param keys: An array of distinct keys
+        :param values: Array of keys by statistics
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(np.unique(keys)) != len(keys):
+            raise Exception("keys of an observation must be distinct")
+
+        new_keys = np.setdiff1d(keys, self.keys)
+        if len(new_keys):
+            all_keys = np.union1d(self.keys, new_keys)
+            all_values = np.full((len(all_keys), self.size, len(self.stats)), np.nan)
+            all_values[np.searchsorted(all_keys, self.keys)] = self.values
+            self.keys, self.values = all_keys, all_values
+
+        index = np.searchsorted(self.keys, keys)
+        self.values[index] = np.concatenate(
+            [self.values[index, 1:], np.asarray(values, dtype=np.float64)[:, None, :]],
+            axis=1,
+        )
+
+
+class FeatureEngine:
+    """
+    Rolling averages of element and team statistics over previous fixtures, computed
+    from gameweek history like the `element_gameweeks_features_all_v01` view.
+
+    Window state is kept between updates, so an update only computes the rows of
+    events after the last one seen. Teams of past fixtures are the teams elements
+    played for, and teams of future fixtures their current teams. Events and elements
+    restart at 1 every season, so `event_all` and `element_all` are offset by the
+    largest of earlier seasons.
+    """
+
+    def __init__(
+        self,
+        element_stats=ELEMENT_STATS,
+        team_stats=TEAM_STATS,
+        windows=WINDOWS,
+        event_offset=0,
+        element_offset=0,
+    ):
+        """
+        :param element_stats: An array of history statistics averaged per element
+        :param team_stats: An array of team statistics averaged per team
+        :param windows: An array of numbers of previous fixtures averaged over
+        :param event_offset: Largest `event_all` of earlier seasons
+        :param element_offset: Largest `element_all` of earlier seasons
+        """
+        self.windows = list(windows)
+        self.event_offset = event_offset
+        self.element_offset = element_offset
+        self.element_windows = RollingWindows(element_stats, max(self.windows))
+        self.team_windows = RollingWindows(team_stats, max(self.windows))
+        self.last_event = 0
+
+    def get_feature_names(self):
+        """
+        :return: An array of rolling feature names
+        """
+        names = []
+        for kind, windows in [
+            ("element", self.element_windows),
+            ("team", self.team_windows),
+            ("opponent", self.team_windows),
+        ]:
+            names += [
+                f"rolling_avg_{stat}_{kind}_p{window}"
+                for window in self.windows
+                for stat in windows.stats
+            ]
+        return names
+
+    def update(self, history_df, element_df, last_event=None):
+        """
+        Compute features of history rows after the last event seen, and add the rows
+        to the windows.
+
+        :param history_df: Gameweek history dataframe of one or more elements
+        :param element_df: Element data dataframe
+        :param last_event: Last event to add, defaults to the last in `history_df`,
+            e.g. the last finished event so an event in progress is added once complete
+        :return: Training features dataframe with a row per new history row
+        """
+
+        if last_event is None:
+            last_event = int(history_df["event"].max()) if len(history_df) else 0
+
+        df = history_df[
+            (history_df["event"] > self.last_event)
+            & (history_df["event"] <= last_event)
+        ]
+        df = df.merge(get_latest_element_df(element_df), on="element", how="inner")
+        df["team"] = get_fixture_teams(df)
+        df = df.sort_values(["kickoff_time", "fixture", "element"], kind="stable")
+        df = df.reset_index(drop=True)
+
+        was_home = df["was_home"].to_numpy(dtype=bool)
+        home_score = df["team_h_score"].to_numpy(dtype=np.float64, na_value=np.nan)
+        away_score = df["team_a_score"].to_numpy(dtype=np.float64, na_value=np.nan)
+        df["team_goals_scored"] = np.where(was_home, home_score, away_score)
+        df["team_goals_conceded"] = np.where(was_home, away_score, home_score)
+
+        team_df = df.drop_duplicates(["team", "fixture"])[
+            ["team", "fixture"] + [f"team_{i}" for i in self.team_windows.stats]
+        ].reset_index(drop=True)
+
+        element_features = self._roll(
+            df["element"].to_numpy(),
+            df[self.element_windows.stats].to_numpy(dtype=np.float64, na_value=np.nan),
+            self.element_windows,
+        )
+        team_features = self._roll(
+            team_df["team"].to_numpy(),
+            team_df[[f"team_{i}" for i in self.team_windows.stats]].to_numpy(),
+            self.team_windows,
+        )
+        self.last_event = max(self.last_event, last_event)
+
+        team_names = [
+            f"{stat}_p{window}"
+            for window in self.windows
+            for stat in self.team_windows.stats
+        ]
+        team_features = pd.DataFrame(team_features, columns=team_names).assign(
+            team=team_df["team"], fixture=team_df["fixture"]
+        )
+        own = df[["team", "fixture"]].merge(team_features, how="left")
+        opponent = (
+            df[["opponent_team", "fixture"]]
+            .rename(columns={"opponent_team": "team"})
+            .merge(team_features, how="left")
+        )
+
+        features_df = pd.DataFrame(
+            np.hstack(
+                [
+                    element_features,
+                    own[team_names].to_numpy(),
+                    opponent[team_names].to_numpy(),
+                ]
+            ),
+            columns=self.get_feature_names(),
+        )
+
+        df = pd.concat(
+            [df, get_kickoff_features(df["kickoff_time"]), features_df], axis=1
+        ).assign(
+            element_all=df["element"] + self.element_offset,
+            event_all=df["event"] + self.event_offset,
+            season=SEASON,
+        )
+        return df[
+            ["total_points"]
+            + CATEGORICAL_FEATURES
+            + self.get_feature_names()
+            + TRAIN_COLUMNS
+        ]
+
+    def get_prediction_features(self, fixtures_df, element_df):
+        """
+        Compute features of future fixtures from the windows' current state.
+
+        :param fixtures_df: Future fixtures dataframe of one or more elements
+        :param element_df: Element data dataframe
+        :return: Prediction features dataframe with a row per scheduled fixture
+        """
+
+        df = fixtures_df[fixtures_df["event"].notna()]
+        df = df.merge(
+            get_latest_element_df(element_df).drop(columns="team"),
+            on="element",
+            how="inner",
+        ).reset_index(drop=True)
+
+        is_home = df["is_home"].to_numpy(dtype=bool)
+        team = np.where(is_home, df["team_h"], df["team_a"]).astype(np.int64)
+        opponent_team = np.where(is_home, df["team_a"], df["team_h"]).astype(np.int64)
+
+        features = np.hstack(
+            [
+                np.hstack(
+                    [
+                        self.element_windows.get_means(df["element"], window)
+                        for window in self.windows
+                    ]
+                ),
+                np.hstack(
+                    [
+                        self.team_windows.get_means(team, window)
+                        for window in self.windows
+                    ]
+                ),
+                np.hstack(
+                    [
+                        self.team_windows.get_means(opponent_team, window)
+                        for window in self.windows
+                    ]
+                ),
+            ]
+        )
+
+        df = pd.concat(
+            [
+                df[["event", "element", "safe_web_name", "element_type"]],
+                get_kickoff_features(df["kickoff_time"]),
+                pd.DataFrame(features, columns=self.get_feature_names()),
+            ],
+            axis=1,
+        ).assign(
+            event=df["event"].astype(np.int64),
+            team=team,
+            opponent_team=opponent_team,
+            was_home=is_home,
+        )
+        return df[
+            ["event", "element", "safe_web_name"]
+            + CATEGORICAL_FEATURES
+            + self.get_feature_names()
+        ]
+
+    def _roll(self, keys, values, windows):
+        # a key's rows are added in order, so rows are taken a rank at a time, where
+        # a row's rank is the number of earlier rows of the same key
+        ranks = pd.Series(keys).groupby(keys).cumcount().to_numpy()
+        features = np.full((len(keys), len(self.windows) * len(windows.stats)), np.nan)
+
+        for rank in range(ranks.max() + 1 if len(ranks) else 0):
+            mask = ranks == rank
+            features[mask] = np.hstack(
+                [windows.get_means(keys[mask], window) for window in self.windows]
+            )
+            windows.push(keys[mask], values[mask])
+
+        return features
+
+
+def get_season_offsets(train_df, season=SEASON):
+    """
+    Get the offsets of a season's `event_all` and `element_all`, so both increase
+    across seasons.
+
+    :param train_df: Training features dataframe, of any seasons
+    :param season: Season being computed
+    :return: Tuple of the largest `event_all` and `element_all` of other seasons,
+        zeros if there are none
+    """
+
+    if not len(train_df):
+        return 0, 0
+
+    other_df = train_df[train_df["season"] != season]
+    if not len(other_df):
+        return 0, 0
+    return int(other_df["event_all"].max()), int(other_df["element_all"].max())
+
+
+def build_local_features(backend, store=None, last_event=None):
+    """
+    Compute the training and prediction features tables on the local backend.
+
+    The feature engine's window state is stored, so each run only computes the rows
+    of events added since the last run and appends them to the training table. A run
+    without stored state replaces the season's rows, keeping other seasons, and
+    numbers its events and elements on from theirs.
+
+    :param backend: LocalBackend holding the history, fixtures and element tables
+    :param store: Optional ArtifactStore for the window state
+    :param last_event: Last event to add to the training table, defaults to the last
+        in the history table
+    :return: Dictionary of rows computed, the last event and seconds taken
+    """
+
+    start = time.perf_counter()
+    store = store or ArtifactStore()
+
+    try:
+        engine, _ = store.load(FEATURES_NAME)
+    except Exception as e:
+        logger.info(e)
+        engine = None
+
+    replace_season = engine is None
+    if replace_season:
+        event_offset, element_offset = get_season_offsets(
+            backend.read_table("fpl", TRAIN_FEATURES_TABLE)
+        )
+        engine = FeatureEngine(event_offset=event_offset, element_offset=element_offset)
+
+    element_df = backend.read_table("fpl", ELEMENT_TABLE)
+    train_df = engine.update(
+        backend.read_table("fpl", HISTORY_TABLE), element_df, last_event
+    )
+    logger.info(f"computed features of {len(train_df)} history rows")
+    if replace_season:
+        # the table holds every season, so only this season's rows are replaced
+        backend.upsert_table(
+            "fpl", TRAIN_FEATURES_TABLE, train_df, [], "season", [SEASON]
+        )
+    else:
+        backend.write_table("fpl", TRAIN_FEATURES_TABLE, train_df)
+
+    predict_df = engine.get_prediction_features(
+        backend.read_table("fpl", FIXTURES_TABLE), element_df
+    )
+    logger.info(f"computed features of {len(predict_df)} future fixtures")
+    backend.write_table("fpl", PREDICT_FEATURES_TABLE, predict_df, "WRITE_TRUNCATE")
+
+    store.save(
+        FEATURES_NAME,
+        f"event_{engine.last_event}",
+        engine,
+        {"last_event": engine.last_event, "features": engine.get_feature_names()},
+    )
+
+    return {
+        "train_rows": len(train_df),
+        "predict_rows": len(predict_df),
+        "last_event": engine.last_event,
+        "seconds": time.perf_counter() - start,
+    }
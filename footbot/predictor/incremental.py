@@ -0,0 +1,278 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalLasso:
+    """
+    Mean imputation, standard scaling, one-hot encoding and a Lasso regression,
+    fitted from running aggregates so new rows can be added without a full refit.
+
+    Each row is expanded into a vector `u` of numerical values with missing values
+    set to zero, missing value indicators, one-hot categories and a constant.
+    The sums `u'u` and `u'y` are mergeable across batches of rows, and the imputer
+    means, scaler moments and the Lasso's Gram matrix are all derived from them.
+    Coefficients are fitted by coordinate descent on the Gram matrix, starting from
+    the previous coefficients.
+
+    Matches `train_predict.get_model` fitted on every row seen so far.
+    """
+
+    def __init__(
+        self,
+        numerical_features,
+        categorical_features,
+        alpha,
+        tol=1e-8,
+        max_iter=10000,
+    ):
+        """
+        :param numerical_features: An array of numerical feature names
+        :param categorical_features: An array of categorical feature names
+        :param alpha: Lasso regularisation strength
+        :param tol: Largest coefficient change, relative to the largest coefficient,
+            at which coordinate descent stops
+        :param max_iter: Maximum number of coordinate descent sweeps
+        """
+        self.numerical_features = list(numerical_features)
+        self.categorical_features = list(categorical_features)
+        self.alpha = alpha
+        self.tol = tol
+        self.max_iter = max_iter
+
+        self.categories = {i: [] for i in self.categorical_features}
+        self.uu = np.zeros((self.get_size(), self.get_size()))
+        self.uy = np.zeros(self.get_size())
+        self.last_event_all = 0
+
+        self.coef = {}
+        self.intercept = 0.0
+        self.iterations = 0
+
+    def get_size(self):
+        return (
+            2 * len(self.numerical_features)
+            + sum(len(i) for i in self.categories.values())
+            + 1
+        )
+
+    def get_columns(self):
+        """
+        :return: An array of keys of the fitted coefficients, numerical features
+            then a (feature, category) pair per one-hot column
+        """
+        return self.numerical_features + [
+            (f, c) for f in self.categorical_features for c in self.categories[f]
+        ]
+
+    def get_numerical_values(self, df):
+        return df[self.numerical_features].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    def get_one_hot(self, df):
+        blocks = []
+        for feature in self.categorical_features:
+            categories = self.categories[feature]
+            values = df[feature].to_numpy()
+            blocks.append(
+                (values[:, None] == np.array(categories, dtype=object)[None, :]).astype(
+                    np.float64
+                )
+            )
+        return np.hstack(blocks) if blocks else np.zeros((len(df), 0))
+
+    def partial_fit(self, df):
+        """
+        Add rows to the running aggregates and refit the coefficients.
+
+        :param df: Dataframe of `total_points`, features and optionally `event_all`
+        :return: self
+        """
+
+        return self.partial_fit_batches([df])
+
+    def partial_fit_batches(self, batches):
+        """
+        Add batches of rows to the running aggregates, then refit the coefficients once.
+
+        Only one batch is held in memory at a time.
+
+        :param batches: Iterable of dataframes of `total_points`, features and
+            optionally `event_all`
+        :return: self
+        """
+
+        rows = 0
+        for df in batches:
+            self._add(df)
+            rows += len(df)
+
+        if rows:
+            self._fit()
+        return self
+
+    def merge(self, other):
+        """
+        Add the running aggregates of a model fitted on other rows, and refit.
+
+        :param other: IncrementalLasso with the same features
+        :return: self
+        """
+
+        self._add_categories(other.categories)
+        uu, uy = other._expand(self.categories)
+        self.uu += uu
+        self.uy += uy
+        self.last_event_all = max(self.last_event_all, other.last_event_all)
+
+        self._fit()
+        return self
+
+    def get_means(self):
+        p = len(self.numerical_features)
+        n = self.uu[-1, -1]
+        missing = self.uu[p:, -1][:p]
+        observed = n - missing
+        sums = self.uu[:p, -1]
+        return np.divide(sums, observed, out=np.zeros(p), where=observed > 0)
+
+    def predict(self, df):
+        """
+        :param df: Dataframe of features
+        :return: Array of predicted total points
+        """
+        x = self.get_numerical_values(df)
+        x = np.where(np.isnan(x), self.means, x)
+        x = (x - self.means) / self.scales
+        design = np.hstack([x, self.get_one_hot(df)])
+        coef = np.array([self.coef.get(i, 0.0) for i in self.get_columns()])
+        return design @ coef + self.intercept
+
+    def _add(self, df):
+        if len(df) == 0:
+            return
+
+        self._add_categories(df)
+
+        x = self.get_numerical_values(df)
+        is_missing = np.isnan(x)
+        u = np.hstack(
+            [
+                np.where(is_missing, 0, x),
+                is_missing.astype(np.float64),
+                self.get_one_hot(df),
+                np.ones((len(df), 1)),
+            ]
+        )
+        y = df["total_points"].to_numpy(dtype=np.float64)
+
+        self.uu += u.T @ u
+        self.uy += u.T @ y
+        if "event_all" in df:
+            self.last_event_all = max(self.last_event_all, int(df["event_all"].max()))
+
+    def _add_categories(self, categories):
+        # `categories` is either a dataframe or a dictionary of category lists
+        updated = {}
+        for feature in self.categorical_features:
+            values = categories[feature]
+            if hasattr(values, "unique"):
+                values = values.unique().tolist()
+            updated[feature] = sorted(set(self.categories[feature]) | set(values))
+
+        if updated != self.categories:
+            self.uu, self.uy = self._expand(updated)
+            self.categories = updated
+
+    def _expand(self, categories):
+        # positions of this model's vector entries in a vector with more categories
+        p = len(self.numerical_features)
+        positions = list(range(2 * p))
+        offset = 2 * p
+        for feature in self.categorical_features:
+            index = {c: i for i, c in enumerate(categories[feature])}
+            positions += [offset + index[c] for c in self.categories[feature]]
+            offset += len(categories[feature])
+        positions.append(offset)
+
+        uu = np.zeros((offset + 1, offset + 1))
+        uu[np.ix_(positions, positions)] = self.uu
+        uy = np.zeros(offset + 1)
+        uy[positions] = self.uy
+        return uu, uy
+
+    def _fit(self):
+        p = len(self.numerical_features)
+        size = self.get_size()
+        n = self.uu[-1, -1]
+
+        # map u to z, the imputed numerical values, one-hot columns and constant
+        self.means = self.get_means()
+        transform = np.zeros((size - p, size))
+        transform[np.arange(p), np.arange(p)] = 1
+        transform[np.arange(p), p + np.arange(p)] = self.means
+        transform[np.arange(p, size - p), np.arange(2 * p, size)] = 1
+
+        zz = transform @ self.uu @ transform.T
+        zy = transform @ self.uy
+
+        mean_z = zz[:-1, -1] / n
+        mean_y = zy[-1] / n
+
+        variances = np.diag(zz)[:p] / n - mean_z[:p] ** 2
+        self.scales = np.sqrt(np.clip(variances, 0, None))
+        self.scales[self.scales < 10 * np.finfo(np.float64).eps] = 1.0
+
+        # centred Gram matrix and correlations of the scaled design
+        d = np.concatenate([1 / self.scales, np.ones(size - 2 * p - 1)])
+        gram = (zz[:-1, :-1] - n * np.outer(mean_z, mean_z)) * np.outer(d, d)
+        corr = (zy[:-1] - n * mean_z * mean_y) * d
+
+        columns = self.get_columns()
+        w = np.array([self.coef.get(i, 0.0) for i in columns])
+        w, self.iterations = coordinate_descent(
+            gram, corr, n * self.alpha, w, self.tol, self.max_iter
+        )
+
+        # numerical columns of the scaled design have zero mean
+        self.intercept = mean_y - mean_z[p:] @ w[p:]
+        self.coef = dict(zip(columns, w.tolist()))
+
+
+def coordinate_descent(gram, corr, penalty, w, tol, max_iter):
+    """
+    Minimise `w'Gw / 2 - c'w + penalty * |w|_1` by cyclic coordinate descent.
+
+    :param gram: Gram matrix G
+    :param corr: Correlation vector c
+    :param penalty: L1 penalty
+    :param w: Starting coefficients
+    :param tol: Largest coefficient change, relative to the largest coefficient,
+        at which to stop
+    :param max_iter: Maximum number of sweeps
+    :return: Tuple of coefficients and number of sweeps
+    """
+
+    w = w.copy()
+    gw = gram @ w
+    diagonal = np.diag(gram)
+
+    for iteration in range(1, max_iter + 1):
+        max_change = 0.0
+        for j in range(len(w)):
+            if diagonal[j] <= 0:
+                continue
+            rho = corr[j] - gw[j] + diagonal[j] * w[j]
+            new = np.sign(rho) * max(abs(rho) - penalty, 0) / diagonal[j]
+            change = new - w[j]
+            if change != 0:
+                gw += gram[:, j] * change
+                w[j] = new
+                max_change = max(max_change, abs(change))
+
+        if max_change <= tol * max(np.abs(w).max(), 1e-12):
+            return w, iteration
+
+    logger.info(f"coordinate descent did not converge in {max_iter} sweeps")
+    return w, max_iter
@@ -0,0 +1,318 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Lasso
+
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.artifacts import get_fingerprint
+from footbot.predictor.train_predict import SELECTION_NAME
+from footbot.predictor.train_predict import get_features
+from footbot.predictor.train_predict import get_model
+from footbot.predictor.train_predict import get_train_df
+
+logger = logging.getLogger(__name__)
+
+# evaluated from most to least regularised, so a feature subset can stop early
+# once weaker regularisation stops helping
+ALPHAS = [0.02, 0.01, 0.005, 0.002, 0.001, 0.0005, 0.0002]
+
+# features left out of each candidate feature subset
+FEATURE_SUBSETS = {
+    "all": [],
+    "no_kickoff": ["was_sunday", "was_weekday", "was_late", "was_early"],
+    "no_opponent": ["opponent_team"],
+    "no_teams": ["team", "opponent_team"],
+}
+
+
+def get_folds(events, n_folds=4, min_train_events=38):
+    """
+    Get time ordered cross validation folds grouped by event.
+
+    Each fold validates on a block of consecutive events and trains on every
+    event before it, so a model is never scored on events older than its training data.
+
+    :param events: An array of the event of each row, e.g. `event_all`
+    :param n_folds: Number of folds
+    :param min_train_events: Number of events always used for training only
+    :return: An array of (training row mask, validation row mask) tuples
+    """
+
+    events = np.asarray(events)
+    unique_events = np.unique(events)
+    validation_events = unique_events[min_train_events:]
+    if len(validation_events) < n_folds:
+        raise Exception(
+            f"{len(unique_events)} events is not enough for {n_folds} folds "
+            f"after {min_train_events} training events"
+        )
+
+    return [
+        (events < block[0], np.isin(events, block))
+        for block in np.array_split(validation_events, n_folds)
+    ]
+
+
+def get_fold_matrices(train_df, features, folds, directory):
+    """
+    Pre-process each fold once and save its matrices for candidates to share.
+
+    Imputation, scaling and one-hot encoding are fitted on the fold's training rows.
+    They act column by column, so a feature subset is a column selection of the
+    saved matrices rather than a new encoding.
+
+    :param train_df: Training dataframe, target first
+    :param features: Dictionary of categorical and numerical feature names
+    :param folds: An array of (training row mask, validation row mask) tuples
+    :param directory: Directory to save a joblib file per fold in
+    :return: An array of fold file paths
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    x = train_df.drop("total_points", axis=1)
+    y = train_df["total_points"].to_numpy(dtype=np.float64)
+
+    paths = []
+    for i, (train_mask, validation_mask) in enumerate(folds):
+        path = os.path.join(directory, f"fold_{i}.joblib")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+
+        preprocess = get_model(features).named_steps["pre-process features"]
+        x_train = preprocess.fit_transform(x[train_mask])
+        x_validation = preprocess.transform(x[validation_mask])
+
+        # the feature of each pre-processed column
+        encoder = preprocess.named_transformers_["preprocess categorical features"]
+        column_features = list(features["numerical"]) + [
+            feature
+            for feature, categories in zip(features["categorical"], encoder.categories_)
+            for _ in categories
+        ]
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(
+            {
+                "x_train": x_train,
+                "y_train": y[train_mask],
+                "x_validation": x_validation,
+                "y_validation": y[validation_mask],
+                "column_features": np.array(column_features),
+            },
+            tmp_path,
+        )
+        os.replace(tmp_path, path)
+
+    return paths
+
+
+def evaluate_fold(path, alpha, excluded_features, deadline):
+    """
+    Fit a candidate on one fold and score it on the fold's validation rows.
+
+    Runs in a worker process, so it takes a fold file rather than matrices.
+
+    :param path: Fold file path
+    :param alpha: Lasso regularisation strength
+    :param excluded_features: An array of feature names to leave out
+    :param deadline: Wall clock time after which the fold is skipped
+    :return: Dictionary of the squared error and fit time, None if skipped
+    """
+
+    if time.time() > deadline:
+        return None
+
+    start = time.perf_counter()
+    fold = joblib.load(path, mmap_mode="r")
+    columns = ~np.isin(fold["column_features"], excluded_features)
+
+    model = Lasso(alpha=alpha)
+    model.fit(fold["x_train"][:, columns], fold["y_train"])
+    predicted = model.predict(fold["x_validation"][:, columns])
+
+    return {
+        "mean_squared_error": float(np.mean((predicted - fold["y_validation"]) ** 2)),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def select_model(
+    train_df,
+    alphas=ALPHAS,
+    feature_subsets=FEATURE_SUBSETS,
+    n_folds=4,
+    min_train_events=38,
+    budget_seconds=600,
+    patience=2,
+    max_workers=None,
+    cache_dir=None,
+    clock=time.time,
+):
+    """
+    Rank alphas and feature subsets by time ordered cross validation.
+
+    Candidates are evaluated a round per alpha, every feature subset and fold of a
+    round in parallel over a process pool. A feature subset stops once its error
+    has not improved for `patience` rounds, and no round starts after the budget.
+
+    :param train_df: Training dataframe, target first, with `event_all`
+    :param alphas: An array of alphas, most regularised first
+    :param feature_subsets: Dictionary of excluded feature names by subset name
+    :param n_folds: Number of folds
+    :param min_train_events: Number of events always used for training only
+    :param budget_seconds: Wall clock budget for evaluating candidates
+    :param patience: Number of rounds without improvement before a subset stops
+    :param max_workers: Number of processes, defaults to the number of cores
+    :param cache_dir: Optional directory to keep fold matrices in between runs
+    :param clock: Function returning the wall clock time
+    :return: Dataframe of evaluated candidates, best first
+    """
+
+    deadline = clock() + budget_seconds
+
+    events = train_df["event_all"].to_numpy()
+    train_df = train_df.drop("event_all", axis=1)
+    features = get_features(train_df)
+    folds = get_folds(events, n_folds, min_train_events)
+
+    fingerprint = get_fingerprint(
+        train_df, features, {"n_folds": n_folds, "min_train_events": min_train_events}
+    )
+    directory = os.path.join(cache_dir or tempfile.mkdtemp(), fingerprint)
+    if cache_dir is not None and os.path.isdir(cache_dir):
+        # fold matrices of older training data are never used again
+        for name in os.listdir(cache_dir):
+            if name != fingerprint:
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    logger.info("pre-processing folds")
+    paths = get_fold_matrices(train_df, features, folds, directory)
+
+    results = []
+    best = {subset: np.inf for subset in feature_subsets}
+    rounds_without_improvement = {subset: 0 for subset in feature_subsets}
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for alpha in alphas:
+                subsets = [
+                    subset
+                    for subset in feature_subsets
+                    if rounds_without_improvement[subset] < patience
+                ]
+                if not subsets:
+                    break
+                remaining_seconds = deadline - clock()
+                if remaining_seconds < 0:
+                    logger.info(f"stopping at alpha {alpha}, out of time")
+                    break
+
+                futures = {
+                    subset: [
+                        executor.submit(
+                            evaluate_fold,
+                            path,
+                            alpha,
+                            feature_subsets[subset],
+                            time.time() + remaining_seconds,
+                        )
+                        for path in paths
+                    ]
+                    for subset in subsets
+                }
+
+                for subset, subset_futures in futures.items():
+                    scores = [i.result() for i in subset_futures]
+                    if any(i is None for i in scores):
+                        continue
+
+                    errors = [i["mean_squared_error"] for i in scores]
+                    results.append(
+                        {
+                            "subset": subset,
+                            "alpha": alpha,
+                            "mean_squared_error": float(np.mean(errors)),
+                            "std_squared_error": float(np.std(errors)),
+                            "seconds": sum(i["seconds"] for i in scores),
+                        }
+                    )
+
+                    if results[-1]["mean_squared_error"] < best[subset]:
+                        best[subset] = results[-1]["mean_squared_error"]
+                        rounds_without_improvement[subset] = 0
+                    else:
+                        rounds_without_improvement[subset] += 1
+    finally:
+        if cache_dir is None:
+            shutil.rmtree(os.path.dirname(directory), ignore_errors=True)
+
+    if not results:
+        raise Exception(f"no candidate evaluated within {budget_seconds}s")
+
+    return (
+        pd.DataFrame(results)
+        .sort_values(["mean_squared_error", "alpha"], ascending=[True, False])
+        .reset_index(drop=True)
+    )
+
+
+def save_selection(ranking, train_df, store, feature_subsets=FEATURE_SUBSETS):
+    """
+    Store the best candidate so model fits use its alpha and features.
+
+    :param ranking: Dataframe of evaluated candidates, best first
+    :param train_df: Training dataframe the candidates were evaluated on
+    :param store: ArtifactStore
+    :param feature_subsets: Dictionary of excluded feature names by subset name
+    :return: Dictionary of the selection's metadata
+    """
+
+    winner = ranking.iloc[0]
+    selection = {
+        "hyperparameters": {"alpha": float(winner["alpha"])},
+        "excluded_features": feature_subsets[winner["subset"]],
+    }
+    fingerprint = get_fingerprint(
+        train_df, get_features(train_df.drop("event_all", axis=1)), selection
+    )
+
+    metadata = {
+        **selection,
+        "subset": winner["subset"],
+        "mean_squared_error": float(winner["mean_squared_error"]),
+        "ranking": ranking.head(10).to_dict(orient="records"),
+    }
+    store.save(SELECTION_NAME, fingerprint, selection, metadata)
+    logger.info(f"selected alpha {winner['alpha']} with {winner['subset']} features")
+
+    return metadata
+
+
+def run_model_selection(client, store=None, **kwargs):
+    """
+    Select a model on every training row and store the winner.
+
+    :param client: BigQuery client
+    :param store: Optional ArtifactStore, defaults to FOOTBOT_ARTIFACT_DIR
+    :param kwargs: Keyword arguments of `select_model`
+    :return: Dataframe of evaluated candidates, best first
+    """
+
+    store = store or ArtifactStore()
+
+    logger.info("getting training dataset")
+    train_df = get_train_df("train_incremental", dict(last_event_all=0), client)
+
+    kwargs.setdefault("cache_dir", os.path.join(store.root, "selection_folds"))
+    ranking = select_model(train_df, **kwargs)
+    save_selection(ranking, train_df, store)
+
+    return ranking
@@ -0,0 +1,199 @@
+import logging
+import time
+
+import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from footbot.data import metrics
+from footbot.data import utils
+
+logger = logging.getLogger(__name__)
+
+# every prediction run appends an immutable snapshot, tagged with its version
+SNAPSHOTS_TABLE = "element_gameweeks_predictions_2122_v02"
+# a single row naming the snapshot readers should use
+CURRENT_TABLE = "element_gameweeks_predictions_2122_v02_current"
+
+# one partition per event, so reads of an event window only scan its partitions
+RANGE_PARTITIONING = bigquery.RangePartitioning(
+    field="event", range_=bigquery.PartitionRange(start=1, end=39, interval=1)
+)
+# a partition holds every kept snapshot, so cluster on the version before the element
+CLUSTERING_FIELDS = ["snapshot_version", "element"]
+
+# snapshots are kept for a day after they are superseded, e.g. to publish one again
+RETENTION_SECONDS = 24 * 60 * 60
+
+
+def get_current_version(client):
+    """
+    Get the version of the published snapshot.
+
+    :param client: BigQuery client
+    :return: Snapshot version, None if no snapshot has been published
+    """
+
+    try:
+        df = utils.run_templated_query("current_prediction_snapshot", {}, client)
+    except NotFound as e:
+        logger.info(f"no snapshot has been published: {e}")
+        return None
+
+    if not len(df):
+        return None
+    return int(df["snapshot_version"][0])
+
+
+def get_snapshot_df(client, version=None):
+    """
+    Get every prediction of a snapshot.
+
+    :param client: BigQuery client
+    :param version: Snapshot version, defaults to the published snapshot
+    :return: Prediction dataframe, None if there is no snapshot
+    """
+
+    if version is None:
+        version = get_current_version(client)
+    if version is None:
+        return None
+
+    return utils.run_templated_query(
+        "prediction_snapshot", dict(snapshot_version=version), client
+    )
+
+
+def get_snapshot_hashes_df(client, version):
+    """
+    Get the feature hash of every prediction of a snapshot, without its other columns.
+
+    :param client: BigQuery client
+    :param version: Snapshot version
+    :return: Dataframe of `element`, `event` and `feature_hash`
+    """
+
+    return utils.run_templated_query(
+        "prediction_snapshot_hashes", dict(snapshot_version=version), client
+    )
+
+
+def write_snapshot(
+    predict_df, client, dataset="fpl", clock=time.time, base_version=None, elements=None
+):
+    """
+    Append a new snapshot of predictions without publishing it.
+
+    Given a base snapshot, `predict_df` only holds the predictions of the replaced
+    elements, and the base snapshot's rows of every other element are copied into
+    the new snapshot by a query, so unchanged rows are not uploaded again. Readers
+    only see a snapshot once it is published, so never see one partly written.
+
+    :param predict_df: Prediction dataframe
+    :param client: BigQuery client
+    :param dataset: BigQuery dataset
+    :param clock: Function returning the current time in seconds
+    :param base_version: Optional version of the snapshot being updated
+    :param elements: An array of elements replaced in the base snapshot, including
+        any no longer predicted
+    :return: Snapshot version
+    """
+
+    version = int(clock() * 1000)
+
+    logger.info(f"writing {len(predict_df)} predictions as snapshot {version}")
+    utils.write_to_table(
+        dataset,
+        SNAPSHOTS_TABLE,
+        predict_df.assign(snapshot_version=version),
+        client,
+        write_disposition="WRITE_APPEND",
+        source_format="PARQUET",
+        range_partitioning=RANGE_PARTITIONING,
+        clustering_fields=CLUSTERING_FIELDS,
+    )
+
+    if base_version is not None:
+        logger.info(f"copying predictions of other elements from {base_version}")
+        utils.run_templated_query(
+            "copy_prediction_snapshot",
+            dict(
+                snapshot_version=version,
+                base_version=base_version,
+                elements=[int(i) for i in elements],
+            ),
+            client,
+        )
+
+    return version
+
+
+def publish_snapshot(version, client, dataset="fpl"):
+    """
+    Point readers at a snapshot.
+
+    The pointer is replaced by a single `WRITE_TRUNCATE` load job, so readers see
+    either the previous snapshot or this one.
+
+    :param version: Snapshot version
+    :param client: BigQuery client
+    :param dataset: BigQuery dataset
+    """
+
+    logger.info(f"publishing snapshot {version}")
+    utils.write_to_table(
+        dataset,
+        CURRENT_TABLE,
+        pd.DataFrame({"snapshot_version": [version]}),
+        client,
+        write_disposition="WRITE_TRUNCATE",
+        source_format="PARQUET",
+    )
+
+
+def delete_old_snapshots(
+    version, client, retention_seconds=RETENTION_SECONDS, dataset="fpl"
+):
+    """
+    Delete snapshots older than the retention period, other than the published one.
+
+    :param version: Version of the latest snapshot
+    :param client: BigQuery client
+    :param retention_seconds: Seconds a superseded snapshot is kept for
+    :param dataset: BigQuery dataset
+    """
+
+    utils.run_templated_query(
+        "delete_prediction_snapshots",
+        dict(oldest_version=version - retention_seconds * 1000),
+        client,
+    )
+
+
+def save_snapshot(
+    predict_df,
+    client,
+    retention_seconds=RETENTION_SECONDS,
+    base_version=None,
+    elements=None,
+):
+    """
+    Write a snapshot of predictions, publish it and delete expired snapshots.
+
+    :param predict_df: Prediction dataframe
+    :param client: BigQuery client
+    :param retention_seconds: Seconds a superseded snapshot is kept for
+    :param base_version: Optional version of the snapshot being updated, see
+        `write_snapshot`
+    :param elements: An array of elements replaced in the base snapshot
+    :return: Snapshot version
+    """
+
+    with metrics.stage_profiler.stage("save_snapshot", rows=len(predict_df)):
+        version = write_snapshot(
+            predict_df, client, base_version=base_version, elements=elements
+        )
+        publish_snapshot(version, client)
+        delete_old_snapshots(version, client, retention_seconds)
+
+    return version
@@ -0,0 +1,12 @@
+-- @snapshot_version INT64
+-- @base_version INT64
+-- @elements ARRAY<INT64>
+INSERT INTO
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+SELECT
+  * REPLACE(@snapshot_version AS snapshot_version)
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version = @base_version
+  AND element NOT IN UNNEST(@elements)
@@ -0,0 +1,4 @@
+SELECT
+  snapshot_version
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02_current`
@@ -0,0 +1,10 @@
+-- @oldest_version INT64
+DELETE FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version < @oldest_version
+  AND snapshot_version != (
+  SELECT
+    snapshot_version
+  FROM
+    `footbot-001.fpl.element_gameweeks_predictions_2122_v02_current`)
@@ -1,6 +1,7 @@
+-- @current_event INT64
 SELECT
   *
 FROM
   `footbot-001.fpl.element_gameweeks_prediction_features_2122_v01`
 WHERE
-  event > {current_event} -- future events
\ No newline at end of file
+  event > @current_event -- future events
\ No newline at end of file
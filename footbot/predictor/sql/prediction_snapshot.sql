@@ -0,0 +1,7 @@
+-- @snapshot_version INT64
+SELECT
+  * EXCEPT(snapshot_version)
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version = @snapshot_version
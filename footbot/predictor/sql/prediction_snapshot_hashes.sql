@@ -0,0 +1,9 @@
+-- @snapshot_version INT64
+SELECT
+  element,
+  event,
+  feature_hash
+FROM
+  `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+WHERE
+  snapshot_version = @snapshot_version
@@ -1,5 +1,10 @@
+import itertools
 import logging
+import time
 
+import joblib
+import numpy as np
+import pandas as pd
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.linear_model import Lasso
@@ -7,36 +12,151 @@ from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.preprocessing import StandardScaler
 
+from footbot.data import metrics
 from footbot.data import utils
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.artifacts import get_fingerprint
+from footbot.predictor.incremental import IncrementalLasso
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = "points"
+INCREMENTAL_MODEL_NAME = "points_incremental"
+SELECTION_NAME = "points_selection"
 
-def get_predicted_points_df(train_sql_file, predict_sql_file, client):
-    current_event = utils.get_current_event()
+CATEGORICAL_FEATURES = [
+    "element_type",
+    "team",
+    "opponent_team",
+    "was_home",
+    "was_sunday",
+    "was_weekday",
+    "was_late",
+    "was_early",
+]
 
-    logger.info("getting training dataset")
-    train_df = utils.run_templated_query(train_sql_file, {}, client)
-    logger.info("getting prediction dataset")
-    predict_df = utils.run_templated_query(
-        predict_sql_file, dict(current_event=current_event), client
-    )
+HYPERPARAMETERS = {"alpha": 0.0020}
+
+# columns of prediction rows that are not features
+PREDICTION_COLUMNS = ["event", "element", "safe_web_name"]
+
+
+def get_features(train_df, excluded_features=()):
+    """
+    Get the features of a training dataframe by kind.
+
+    :param train_df: Training dataframe, target first
+    :param excluded_features: An array of feature names to leave out of the model
+    :return: Dictionary of categorical and numerical feature names
+    """
 
     categorical_features = [
-        "element_type",
-        "team",
-        "opponent_team",
-        "was_home",
-        "was_sunday",
-        "was_weekday",
-        "was_late",
-        "was_early",
+        i for i in CATEGORICAL_FEATURES if i not in excluded_features
     ]
-
     numerical_features = [
-        i for i in train_df.columns[1:] if i not in categorical_features
+        i
+        for i in train_df.columns[1:]
+        if i not in CATEGORICAL_FEATURES and i not in excluded_features
     ]
 
+    return {"categorical": categorical_features, "numerical": numerical_features}
+
+
+def get_downcast_df(df):
+    """
+    Downcast a dataframe's numerical columns as it is loaded.
+
+    Floats become float32 and integers, including the codes of categorical
+    features such as `team`, the smallest integer type that holds them.
+
+    :param df: Dataframe, e.g. from `to_dataframe`
+    :return: Dataframe with downcast columns
+    """
+
+    df = df.copy()
+    for column, dtype in df.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            continue
+        if pd.api.types.is_float_dtype(dtype):
+            df[column] = df[column].astype(np.float32)
+        elif pd.api.types.is_integer_dtype(dtype) and not isinstance(
+            dtype, pd.api.extensions.ExtensionDtype
+        ):
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+
+    return df
+
+
+def get_train_batches(template, parameters, client):
+    """
+    Get training data a downcast batch at a time, so a full float64 frame is never built.
+
+    :param template: Name of the training data template
+    :param parameters: Dictionary of values for the template's parameters
+    :param client: BigQuery client
+    :return: Generator of downcast dataframes
+    """
+
+    for df in utils.run_templated_query_batches(template, parameters, client):
+        yield get_downcast_df(df)
+
+
+def get_train_df(template, parameters, client):
+    """
+    Get training data, downcast a batch at a time as it is read.
+
+    :param template: Name of the training data template
+    :param parameters: Dictionary of values for the template's parameters
+    :param client: BigQuery client
+    :return: Downcast dataframe
+    """
+
+    with metrics.stage_profiler.stage("train_query") as stats:
+        batches = list(get_train_batches(template, parameters, client))
+        if not batches:
+            raise Exception(f"{template} returned no training rows")
+
+        train_df = pd.concat(batches, ignore_index=True)
+        stats["rows"] = len(train_df)
+
+    return train_df
+
+
+def get_selection(store=None):
+    """
+    Get the hyperparameters and excluded features chosen by the latest model selection.
+
+    :param store: Optional ArtifactStore holding the selection
+    :return: Tuple of hyperparameters and an array of excluded features, the
+        defaults if nothing has been selected
+    """
+
+    if store is None:
+        return HYPERPARAMETERS, []
+
+    try:
+        _, metadata = store.load(SELECTION_NAME)
+    except Exception as e:
+        logger.info(e)
+        return HYPERPARAMETERS, []
+
+    return metadata["hyperparameters"], metadata["excluded_features"]
+
+
+def get_model(features, hyperparameters=HYPERPARAMETERS):
+    """
+    Get an unfitted model of total points.
+
+    Features are pre-processed into a dense float32 matrix, half the size of a
+    float64 one. The one-hot block is encoded sparse and only densified as the
+    blocks are stacked. Lasso's sparse solver does not converge on float32
+    features, so the stacked matrix is kept dense.
+
+    :param features: Dictionary of categorical and numerical feature names
+    :param hyperparameters: Dictionary of model hyperparameters
+    :return: Pipeline of pre-processing and a Lasso regression
+    """
+
     numerical_transformer = Pipeline(
         [
             ("impute missing values", SimpleImputer()),
@@ -49,29 +169,323 @@ def get_predicted_points_df(train_sql_file, predict_sql_file, client):
             (
                 "preprocess numerical features",
                 numerical_transformer,
-                numerical_features,
+                features["numerical"],
             ),
             (
                 "preprocess categorical features",
-                OneHotEncoder(handle_unknown="ignore"),
-                categorical_features,
+                OneHotEncoder(handle_unknown="ignore", dtype=np.float32),
+                features["categorical"],
             ),
-        ]
+        ],
+        sparse_threshold=0,
     )
 
-    model = Pipeline(
+    return Pipeline(
         [
             ("pre-process features", preprocess),
-            ("predictive model", Lasso(alpha=0.0020)),
+            ("predictive model", Lasso(**hyperparameters)),
         ]
     )
 
+
+def get_fitted_model(
+    train_df, store=None, hyperparameters=HYPERPARAMETERS, excluded_features=()
+):
+    """
+    Get a model fitted to training data, reusing a stored model if the training
+    data, features and hyperparameters are unchanged.
+
+    :param train_df: Training dataframe, target first
+    :param store: Optional ArtifactStore to load and save fitted models
+    :param hyperparameters: Dictionary of model hyperparameters
+    :param excluded_features: An array of feature names to leave out of the model
+    :return: Tuple of fitted model and dictionary of features
+    """
+
+    features = get_features(train_df, excluded_features)
+    fingerprint = get_fingerprint(train_df, features, hyperparameters)
+
+    if store is not None and store.exists(MODEL_NAME, fingerprint):
+        model, metadata = store.load(MODEL_NAME, fingerprint)
+        # training data may have gone back to an earlier state, so the reused model
+        # becomes the latest, as a fit would
+        store.set_latest(MODEL_NAME, fingerprint)
+        return model, metadata["features"]
+
     logger.info("fitting model")
-    model.fit(train_df.drop("total_points", axis=1), train_df["total_points"])
+    model = get_model(features, hyperparameters)
+    # the steps are fitted in turn, as `Pipeline.fit` would, so each can be profiled
+    with metrics.stage_profiler.stage("column_transformer_fit", rows=len(train_df)):
+        x = model.named_steps["pre-process features"].fit_transform(
+            train_df.drop("total_points", axis=1)
+        )
+    with metrics.stage_profiler.stage("lasso_fit", rows=len(train_df)):
+        model.named_steps["predictive model"].fit(x, train_df["total_points"])
+
+    if store is not None:
+        store.save(
+            MODEL_NAME,
+            fingerprint,
+            model,
+            {
+                "features": features,
+                "hyperparameters": hyperparameters,
+                "rows": len(train_df),
+            },
+        )
+
+    return model, features
+
+
+def get_incremental_model(
+    client, store=None, hyperparameters=HYPERPARAMETERS, excluded_features=()
+):
+    """
+    Get a model updated with training rows newer than the last event it was trained on.
+
+    The model is trained from scratch if there is no stored model, or if the
+    features or hyperparameters have changed.
+
+    :param client: BigQuery client
+    :param store: Optional ArtifactStore to load and save the model
+    :param hyperparameters: Dictionary of model hyperparameters
+    :param excluded_features: An array of feature names to leave out of the model
+    :return: IncrementalLasso
+    """
+
+    store = store or ArtifactStore()
+    try:
+        model, _ = store.load(INCREMENTAL_MODEL_NAME)
+    except Exception as e:
+        logger.info(e)
+        model = None
+
+    if model is not None and model.alpha != hyperparameters["alpha"]:
+        model = None
 
-    logger.info("making predictions")
-    predict_df["predicted_total_points"] = model.predict(
-        predict_df.drop(["event", "element", "safe_web_name"], axis=1)
+    last_event_all = model.last_event_all if model is not None else 0
+    logger.info(f"getting training rows after event {last_event_all}")
+    batches = get_train_batches(
+        "train_incremental", dict(last_event_all=last_event_all), client
     )
+    train_df = next(batches, None)
+
+    if train_df is None:
+        if model is None:
+            raise Exception("train_incremental returned no training rows")
+        return model
+
+    features = get_features(train_df.drop("event_all", axis=1), excluded_features)
+
+    if model is not None and (
+        model.numerical_features != features["numerical"]
+        or model.categorical_features != features["categorical"]
+    ):
+        logger.info("features have changed, training from scratch")
+        model = None
+        batches.close()
+        batches = get_train_batches("train_incremental", dict(last_event_all=0), client)
+        train_df = next(batches)
+
+    if model is None:
+        model = IncrementalLasso(
+            features["numerical"], features["categorical"], hyperparameters["alpha"]
+        )
+
+    model.partial_fit_batches(itertools.chain([train_df], batches))
+    logger.info(f"updated model to event {model.last_event_all}")
+    store.save(
+        INCREMENTAL_MODEL_NAME,
+        f"event_all_{model.last_event_all}",
+        model,
+        {
+            "features": features,
+            "hyperparameters": hyperparameters,
+            "last_event_all": model.last_event_all,
+        },
+    )
+
+    return model
+
+
+def get_points_model(
+    train_template, client, store=None, predict_only=False, incremental=False
+):
+    """
+    Get a model of total points.
+
+    :param train_template: Name of the training data template
+    :param client: BigQuery client
+    :param store: Optional ArtifactStore to load and save fitted models
+    :param predict_only: Whether to load the latest stored model without getting
+        training data, the incremental model if `incremental`
+    :param incremental: Whether to update the incremental model with new rows
+        rather than fit to every row
+    :return: Fitted model
+    """
+
+    if predict_only:
+        name = INCREMENTAL_MODEL_NAME if incremental else MODEL_NAME
+        model, _ = (store or ArtifactStore()).load(name)
+        return model
+
+    hyperparameters, excluded_features = get_selection(store)
+
+    if incremental:
+        return get_incremental_model(client, store, hyperparameters, excluded_features)
+
+    logger.info("getting training dataset")
+    train_df = get_train_df(train_template, {}, client)
+    model, _ = get_fitted_model(train_df, store, hyperparameters, excluded_features)
+    return model
+
+
+def get_feature_hashes(predict_df, model):
+    """
+    Hash each prediction row's features together with the model scoring it.
+
+    A row's hash only changes if its prediction could, e.g. after team news or a
+    fixture moving, or when the model is refitted.
+
+    :param predict_df: Prediction dataframe
+    :param model: Fitted model
+    :return: Array of int64 hashes
+    """
+
+    return (
+        pd.util.hash_pandas_object(
+            predict_df.drop(columns=PREDICTION_COLUMNS, errors="ignore").assign(
+                model=joblib.hash(model)
+            ),
+            index=False,
+        )
+        .to_numpy()
+        .view(np.int64)
+    )
+
+
+def get_prediction_features_df(predict_template, client, model, current_event=None):
+    """
+    Get the features of every future element and event, with their hashes.
+
+    :param predict_template: Name of the prediction data template
+    :param client: BigQuery client
+    :param model: Fitted model the rows will be scored with
+    :param current_event: Event after which rows are predicted, defaults to the
+        current event
+    :return: Prediction dataframe with `feature_hash`
+    """
+
+    if current_event is None:
+        current_event = utils.get_current_event()
+
+    logger.info("getting prediction dataset")
+    with metrics.stage_profiler.stage("predict_query") as stats:
+        predict_df = get_downcast_df(
+            utils.run_templated_query(
+                predict_template, dict(current_event=current_event), client
+            )
+        )
+        stats["rows"] = len(predict_df)
+    with metrics.stage_profiler.stage("feature_hash", rows=len(predict_df)):
+        predict_df["feature_hash"] = get_feature_hashes(predict_df, model)
+
+    return predict_df
+
+
+def predict_points(predict_df, model):
+    """
+    Score prediction rows, stamping them with a version that increases with each run.
+
+    :param predict_df: Prediction dataframe with `feature_hash`
+    :param model: Fitted model
+    :return: Prediction dataframe with `predicted_total_points` and `prediction_version`
+    """
+
+    logger.info(f"making {len(predict_df)} predictions")
+    with metrics.stage_profiler.stage("predict", rows=len(predict_df)):
+        x = predict_df.drop(PREDICTION_COLUMNS + ["feature_hash"], axis=1)
+        # sklearn refuses to predict no rows
+        predict_df["predicted_total_points"] = (
+            model.predict(x) if len(x) else np.zeros(0, dtype=np.float32)
+        )
+    predict_df["prediction_version"] = time.time_ns() // 1000000
 
     return predict_df
+
+
+def get_predicted_points_df(
+    train_template,
+    predict_template,
+    client,
+    store=None,
+    predict_only=False,
+    incremental=False,
+):
+    """
+    Predict total points for future events.
+
+    :param train_template: Name of the training data template
+    :param predict_template: Name of the prediction data template
+    :param client: BigQuery client
+    :param store: Optional ArtifactStore to load and save fitted models
+    :param predict_only: Whether to score with the latest stored model without
+        getting training data, the incremental model if `incremental`
+    :param incremental: Whether to update the incremental model with new rows
+        rather than fit to every row
+    :return: Prediction dataframe with `predicted_total_points`
+    """
+
+    model = get_points_model(train_template, client, store, predict_only, incremental)
+    predict_df = get_prediction_features_df(predict_template, client, model)
+
+    return predict_points(predict_df, model)
+
+
+def get_predicted_points_delta_df(
+    train_template,
+    predict_template,
+    client,
+    snapshot_df,
+    store=None,
+    predict_only=False,
+    incremental=False,
+):
+    """
+    Predict total points for future events of elements whose features have changed.
+
+    An element has changed if any of its rows is new, has a different hash or is no
+    longer predicted, e.g. after team news, a postponement or a refit. Every row of
+    a changed element is scored, so its rows of the snapshot can be replaced together.
+
+    :param train_template: Name of the training data template
+    :param predict_template: Name of the prediction data template
+    :param client: BigQuery client
+    :param snapshot_df: Dataframe of at least `element`, `event` and `feature_hash`
+        of the published predictions
+    :param store: Optional ArtifactStore to load and save fitted models
+    :param predict_only: Whether to score with the latest stored model without
+        getting training data, the incremental model if `incremental`
+    :param incremental: Whether to update the incremental model with new rows
+        rather than fit to every row
+    :return: Tuple of prediction dataframe of changed elements and an array of
+        the changed elements
+    """
+
+    model = get_points_model(train_template, client, store, predict_only, incremental)
+    predict_df = get_prediction_features_df(predict_template, client, model)
+
+    keys = ["element", "event", "feature_hash"]
+    rows_df = predict_df[keys].merge(
+        snapshot_df[keys].astype(predict_df[keys].dtypes.to_dict()),
+        how="outer",
+        indicator=True,
+    )
+    elements = sorted(
+        int(i) for i in rows_df.loc[rows_df["_merge"] != "both", "element"].unique()
+    )
+    logger.info(f"features of {len(elements)} elements have changed")
+
+    predict_df = predict_df[predict_df["element"].isin(elements)].reset_index(drop=True)
+
+    return predict_points(predict_df, model), elements
@@ -5,9 +5,14 @@ setup(
     version='0.1.0',
     packages=[
         'footbot',
+        'footbot.benchmark',
         'footbot.data',
         'footbot.optimiser',
         'footbot.predictor'
     ],
+    package_data={
+        'footbot.optimiser': ['sql/*.sql'],
+        'footbot.predictor': ['sql/*.sql']
+    },
     install_requires=open('requirements.txt').readlines()
 )
@@ -30,6 +30,7 @@ let
       google_cloud_tasks
       google_cloud_bigquery_storage
       click
+      duckdb
 
       pytest
       isort
@@ -0,0 +1,141 @@
+import pandas as pd
+import pytest
+from google.cloud import bigquery
+
+from footbot.data import utils
+from footbot.data.backends import LocalBackend
+from footbot.data.backends import translate_sql
+from footbot.data.query_cache import QueryCache
+
+pytest.importorskip("duckdb")
+
+
+def test_translate_sql():
+    assert translate_sql(
+        "SELECT * EXCEPT(a, b) FROM `footbot-001.fpl.t` WHERE event > @current_event"
+    ) == ("SELECT * EXCLUDE(a, b) FROM fpl.t WHERE event > $current_event")
+
+
+def test_local_backend_runs_queries_and_writes(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    df = pd.DataFrame({"element": [1, 1, 2], "fixture": [1, 2, 1], "points": [2, 6, 1]})
+
+    utils.write_to_table("fpl", "history", df, backend)
+    utils.write_to_table("fpl", "history", df.iloc[:1], backend)
+    assert len(backend.read_table("fpl", "history")) == 4
+
+    utils.write_to_table(
+        "fpl", "history", df, backend, write_disposition="WRITE_TRUNCATE"
+    )
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("element", "INT64", 1)]
+    )
+    result = utils.run_query(
+        "SELECT * EXCEPT(fixture) FROM `footbot-001.fpl.history` "
+        "WHERE element = @element ORDER BY points",
+        backend,
+        job_config=job_config,
+    )
+    assert result.to_dict("records") == [
+        {"element": 1, "points": 2},
+        {"element": 1, "points": 6},
+    ]
+
+    # fixture 2 of element 1 is no longer present, element 3 is new
+    utils.upsert_to_table(
+        "fpl",
+        "history",
+        pd.DataFrame({"element": [1, 3], "fixture": [1, 1], "points": [3, 4]}),
+        ["element", "fixture"],
+        backend,
+    )
+    result = utils.run_query(
+        "SELECT * FROM `footbot-001.fpl.history` ORDER BY element, fixture", backend
+    )
+    assert result.values.tolist() == [[1, 1, 3], [2, 1, 1], [3, 1, 4]]
+
+    utils.run_query("DELETE FROM `footbot-001.fpl.history` WHERE element = 2", backend)
+    assert backend.read_table("fpl", "history")["element"].tolist() == [1, 3]
+    assert backend.get_table("footbot-001.fpl.history").num_rows == 2
+
+
+def test_local_backend_runs_templates_with_cache(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.write_table(
+        "fpl",
+        "element_gameweeks_predictions_2122_v02",
+        pd.DataFrame(
+            {
+                "element": [1, 1, 2, 2, 1],
+                "event": [3, 4, 3, 4, 3],
+                "predicted_total_points": [2.0, 4.0, 1.0, 1.0, 100.0],
+                "prediction_version": 1,
+                "snapshot_version": [2, 2, 2, 2, 1],
+            }
+        ),
+    )
+
+    cache = QueryCache()
+    for _ in range(2):
+        df = utils.run_templated_query(
+            "element_predictions",
+            dict(snapshot_version=2, start_event=4),
+            backend,
+            cache=cache,
+        )
+
+    assert df.sort_values("element").to_dict("records") == [
+        {
+            "element": 1,
+            "event": 4,
+            "predicted_total_points": 4.0,
+            "prediction_version": 1,
+        },
+        {
+            "element": 2,
+            "event": 4,
+            "predicted_total_points": 1.0,
+            "prediction_version": 1,
+        },
+    ]
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_local_backend_query_batches(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.write_table("fpl", "history", pd.DataFrame({"event_all": range(10)}))
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("event", "INT64", 3)]
+    )
+    batches = list(
+        backend.query_batches(
+            "SELECT * FROM `footbot-001.fpl.history` WHERE event_all > @event",
+            job_config=job_config,
+            batch_rows=4,
+        )
+    )
+
+    assert [len(i) for i in batches] == [4, 2]
+    assert pd.concat(batches)["event_all"].tolist() == list(range(4, 10))
+
+
+def test_local_backend_replaces_partitions_without_keys(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.write_table(
+        "fpl",
+        "predictions",
+        pd.DataFrame({"element": [1, 1, 2], "event": [3, 4, 3], "points": [1, 2, 3]}),
+    )
+
+    utils.upsert_to_table(
+        "fpl",
+        "predictions",
+        pd.DataFrame({"element": [1, 1], "event": [4, 4], "points": [5, 6]}),
+        [],
+        backend,
+        partitions=[1, 3],
+    )
+
+    df = backend.read_table("fpl", "predictions").sort_values(["element", "points"])
+    assert df.values.tolist() == [[1, 4, 5], [1, 4, 6], [2, 3, 3]]
@@ -0,0 +1,83 @@
+import json
+from unittest.mock import Mock
+
+from footbot.data.cache import FplCache
+
+
+def get_response(payload, status_code=200, headers={}):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers
+    response.content = json.dumps(payload).encode("utf-8")
+    return response
+
+
+def test_fpl_cache_serves_fresh_response():
+    clock = Mock(return_value=0)
+    get = Mock(return_value=get_response({"a": 1}))
+    cache = FplCache(ttls=[(r"/bootstrap-static/", 10)], get=get, clock=clock)
+
+    assert cache.get_json("https://x/bootstrap-static/") == {"a": 1}
+    clock.return_value = 9
+    assert cache.get_json("https://x/bootstrap-static/") == {"a": 1}
+
+    assert get.call_count == 1
+    assert cache.stats == {"hits": 1, "misses": 1, "revalidated": 0}
+
+
+def test_fpl_cache_revalidates_stale_response():
+    clock = Mock(return_value=0)
+    get = Mock(
+        return_value=get_response(
+            {"a": 1}, headers={"ETag": "abc", "Last-Modified": "yesterday"}
+        )
+    )
+    cache = FplCache(default_ttl=10, get=get, clock=clock)
+    cache.get_json("https://x/y/")
+
+    clock.return_value = 11
+    get.return_value = get_response(None, status_code=304)
+    assert cache.get_json("https://x/y/") == {"a": 1}
+    get.assert_called_with(
+        "https://x/y/",
+        headers={"If-None-Match": "abc", "If-Modified-Since": "yesterday"},
+    )
+    assert cache.stats["revalidated"] == 1
+
+
+def test_fpl_cache_ttl_override_and_eviction():
+    clock = Mock(return_value=0)
+    get = Mock(side_effect=lambda url, headers: get_response({"url": url}))
+    cache = FplCache(default_ttl=10, max_entries=2, get=get, clock=clock)
+
+    cache.get_json("https://x/1/", ttl=None)
+    cache.get_json("https://x/2/")
+    cache.get_json("https://x/3/")
+    assert list(cache.entries) == ["https://x/2/", "https://x/3/"]
+
+    cache.get_json("https://x/4/", ttl=None)
+    clock.return_value = 10**9
+    cache.get_json("https://x/4/")
+    assert get.call_count == 4
+
+
+def test_fpl_cache_disk_tier(tmp_path):
+    get = Mock(return_value=get_response({"a": 1}))
+    FplCache(disk_dir=str(tmp_path), get=get, clock=lambda: 0).get_json("https://x/")
+
+    get.reset_mock()
+    cache = FplCache(disk_dir=str(tmp_path), get=get, clock=lambda: 0)
+    assert cache.get_json("https://x/") == {"a": 1}
+    get.assert_not_called()
+
+
+def test_fpl_cache_holds_every_element_summary():
+    get = Mock(side_effect=lambda url, headers: get_response({}))
+    cache = FplCache(get=get, clock=lambda: 0)
+
+    for _ in range(2):
+        for element in range(1, 801):
+            cache.get_json(f"https://fpl/element-summary/{element}/")
+
+    assert get.call_count == 800
+    assert cache.stats["hits"] == 800
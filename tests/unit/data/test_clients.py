@@ -0,0 +1,36 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+from footbot.data import clients
+
+
+def test_get_client_reuses_client():
+    clients.reset()
+    factory = Mock(side_effect=lambda: object())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda _: clients.get_client("test", factory), range(20))
+        )
+
+    assert factory.call_count == 1
+    assert all(i is results[0] for i in results)
+
+    stats = clients.get_stats()["test"]
+    assert stats["created"] == 1
+    assert stats["reused"] == 19
+
+
+def test_reset():
+    factory = Mock(side_effect=lambda: object())
+    first = clients.get_client("test_reset", factory)
+    clients.reset()
+    assert clients.get_client("test_reset", factory) is not first
+    assert factory.call_count == 2
+
+
+def test_set_credentials(monkeypatch):
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+    clients.set_credentials("./test.json")
+    assert os.environ["GOOGLE_APPLICATION_CREDENTIALS"] == "./test.json"
@@ -1,6 +1,8 @@
+import pandas as pd
 import pytest
 
 from footbot.data.element_data import get_bootstrap
+from footbot.data.element_data import get_bulk_element_history_fixture_dfs
 from footbot.data.element_data import get_element_df
 
 
@@ -13,3 +15,23 @@ def test_get_element_df(bootstrap_data):
     element_df = get_element_df(bootstrap_data)
     assert len(element_df) != 0
     assert "id" not in element_df.columns
+
+
+def test_get_bulk_element_history_fixture_dfs():
+    def fetch(element):
+        if element == 3:
+            raise Exception("bad element")
+        return (
+            pd.DataFrame({"element": [element, element], "event": [1, 2]}),
+            pd.DataFrame({"element": [element], "event": [3]}),
+        )
+
+    history_df, fixtures_df, report = get_bulk_element_history_fixture_dfs(
+        [1, 2, 3], max_workers=2, fetch=fetch
+    )
+    assert len(history_df) == 4
+    assert len(fixtures_df) == 2
+    assert report["elements"] == 3
+    assert [i["element"] for i in report["failed"]] == [3]
+    assert "bad element" in report["failed"][0]["error"]
+    assert [i["element"] for i in report["timings"]] == [1, 2, 3]
@@ -0,0 +1,69 @@
+from unittest.mock import Mock
+
+import pytest
+import requests
+
+from footbot.data.fpl import FplClient
+from footbot.data.scheduler import FetchScheduler
+
+
+def get_response(status_code, headers={}):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers
+    return response
+
+
+def test_fpl_client_retries_transient_failures():
+    sleeps = []
+    client = FplClient(retries=3, backoff=1, sleep=sleeps.append)
+    client.session.get = Mock(
+        side_effect=[
+            requests.ConnectionError("reset"),
+            get_response(503),
+            get_response(429, {"Retry-After": "7"}),
+            get_response(200),
+        ]
+    )
+
+    assert client.get("https://x/").status_code == 200
+    assert client.session.get.call_count == 4
+    assert 0 <= sleeps[0] <= 1
+    assert 0 <= sleeps[1] <= 2
+    assert sleeps[2] == 7
+    client.session.get.assert_called_with(
+        "https://x/", headers=None, timeout=client.timeout
+    )
+
+
+def test_fpl_client_gives_up():
+    client = FplClient(retries=1, sleep=lambda x: None)
+
+    client.session.get = Mock(return_value=get_response(500))
+    assert client.get("https://x/").status_code == 500
+    assert client.session.get.call_count == 2
+
+    client.session.get = Mock(side_effect=requests.Timeout("slow"))
+    with pytest.raises(requests.Timeout):
+        client.get("https://x/")
+
+
+def test_fpl_client_does_not_retry_client_errors():
+    client = FplClient(retries=3, sleep=lambda x: None)
+    client.session.get = Mock(return_value=get_response(404))
+    assert client.get("https://x/").status_code == 404
+    assert client.session.get.call_count == 1
+
+
+def test_fpl_client_reports_to_scheduler():
+    scheduler = FetchScheduler(rate=100, concurrency=4)
+    client = FplClient(retries=1, scheduler=scheduler, sleep=lambda x: None)
+    client.session.get = Mock(side_effect=[get_response(429), get_response(200)])
+
+    assert client.get("https://x/").status_code == 200
+
+    stats = scheduler.get_stats()
+    assert stats["admitted"] == 2
+    assert stats["back_offs"] == 1
+    assert stats["successes"] == 1
+    assert stats["in_flight"] == 0
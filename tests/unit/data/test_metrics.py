@@ -0,0 +1,130 @@
+import datetime
+from unittest.mock import Mock
+from unittest.mock import patch
+
+import pandas as pd
+from google.cloud import bigquery
+
+from footbot.data import metrics
+from footbot.data import utils
+from footbot.data.metrics import JobMetrics
+from footbot.data.metrics import StageProfiler
+from footbot.data.metrics import get_job_stats
+
+
+def get_job():
+    return Mock(
+        spec=bigquery.QueryJob,
+        job_id="abc",
+        created=datetime.datetime(2021, 8, 1, 12, 0, 0),
+        started=datetime.datetime(2021, 8, 1, 12, 0, 2),
+        total_bytes_processed=100,
+        total_bytes_billed=10485760,
+        slot_millis=50,
+        cache_hit=False,
+    )
+
+
+def test_get_job_stats():
+    assert get_job_stats(get_job()) == {
+        "job_id": "abc",
+        "queue_seconds": 2.0,
+        "bytes_processed": 100,
+        "bytes_billed": 10485760,
+        "slot_millis": 50,
+        "cache_hit": False,
+    }
+    # load jobs have no query statistics
+    load_job = Mock(spec=bigquery.LoadJob, job_id="def", created=None, started=None)
+    assert get_job_stats(load_job) == {
+        "job_id": "def",
+        "queue_seconds": None,
+        "bytes_processed": None,
+        "bytes_billed": None,
+        "slot_millis": None,
+        "cache_hit": None,
+    }
+    assert set(get_job_stats(None).values()) == {None}
+
+
+def test_job_metrics_totals_per_label():
+    job_metrics = JobMetrics(max_recent=2)
+
+    job_metrics.record("optimiser", 1.5, job=get_job(), rows=10)
+    job_metrics.record("optimiser", 0.5, job=get_job(), rows=10)
+    job_metrics.record("load:fpl.t", 2.0, rows=5)
+
+    stats = job_metrics.get_stats()
+    assert stats["totals"]["optimiser"] == {
+        "calls": 2,
+        "cache_hits": 0,
+        "max_seconds": 1.5,
+        "seconds": 2.0,
+        "queue_seconds": 4.0,
+        "to_dataframe_seconds": 0,
+        "bytes_processed": 200,
+        "bytes_billed": 20971520,
+        "slot_millis": 100,
+        "rows": 20,
+    }
+    assert stats["totals"]["load:fpl.t"]["rows"] == 5
+    assert [i["label"] for i in stats["recent"]] == ["optimiser", "load:fpl.t"]
+
+
+def test_run_query_records_job():
+    job = get_job()
+    job.result = Mock()
+    job.result.return_value.to_dataframe = Mock(
+        return_value=pd.DataFrame({"a": [1, 2]})
+    )
+    client = Mock()
+    client.query = Mock(return_value=job)
+    metrics.job_metrics.clear()
+
+    with patch("footbot.data.utils.clients.get_bqstorage_client"):
+        df = utils.run_query("SELECT 1", client, label="test")
+
+    assert len(df) == 2
+    stats = metrics.job_metrics.get_stats()["recent"][-1]
+    assert stats["label"] == "test"
+    assert stats["job_id"] == "abc"
+    assert stats["rows"] == 2
+    assert stats["to_dataframe_seconds"] <= stats["seconds"]
+
+
+def test_run_query_batches_records_job_once_read():
+    job = get_job()
+    job.result = Mock()
+    job.result.return_value.to_dataframe_iterable = Mock(
+        return_value=[pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [3]})]
+    )
+    client = Mock()
+    client.query = Mock(return_value=job)
+    metrics.job_metrics.clear()
+
+    with patch("footbot.data.utils.clients.get_bqstorage_client"):
+        batches = utils.run_query_batches("SELECT 1", client, label="test")
+        assert [len(i) for i in batches] == [2, 1]
+
+    stats = metrics.job_metrics.get_stats()["recent"]
+    assert len(stats) == 1
+    assert stats[0]["rows"] == 3
+    assert stats[0]["job_id"] == "abc"
+
+
+def test_stage_profiler_only_records_within_a_profile():
+    profiler = StageProfiler()
+    with profiler.stage("ignored", rows=1) as stats:
+        stats["rows"] = 2
+
+    with profiler.profile(trace_memory=True) as stages:
+        with profiler.stage("a", rows=3):
+            pass
+        with profiler.stage("b") as stats:
+            stats["rows"] = [0] * 1000
+
+    assert list(stages) == ["a", "b"]
+    assert stages["a"]["rows"] == 3
+    assert stages["b"]["seconds"] >= 0
+    assert stages["b"]["peak_traced_bytes"] >= 8000
+    assert profiler.stages is None
@@ -0,0 +1,81 @@
+import datetime
+from unittest.mock import Mock
+
+import pandas as pd
+
+from footbot.data.query_cache import QueryCache
+
+SQL = "SELECT * FROM `p.d.view` JOIN `p.d.predictions` USING (element)"
+
+
+def get_client(modified):
+    def get_table(ref):
+        table = Mock()
+        if ref == "p.d.view":
+            table.table_type = "VIEW"
+            table.view_query = "SELECT * FROM `p.d.history`"
+        else:
+            table.table_type = "TABLE"
+            table.modified = modified[ref]
+        return table
+
+    client = Mock()
+    client.get_table = Mock(side_effect=get_table)
+    return client
+
+
+def test_query_cache_serves_results_until_source_tables_change():
+    modified = {
+        "p.d.history": datetime.datetime(2021, 8, 1),
+        "p.d.predictions": datetime.datetime(2021, 8, 1),
+    }
+    client = get_client(modified)
+    clock = Mock(return_value=0)
+    run_query = Mock(
+        return_value=pd.DataFrame({"element": [1, 2], "points": [3.0, 4.5]})
+    )
+    cache = QueryCache(freshness_ttl=10, clock=clock)
+
+    assert cache.get_source_tables(SQL, client) == ["p.d.history", "p.d.predictions"]
+
+    pd.testing.assert_frame_equal(
+        cache.get_df(SQL, client, run_query), run_query.return_value
+    )
+    pd.testing.assert_frame_equal(
+        cache.get_df(SQL, client, run_query), run_query.return_value
+    )
+    assert run_query.call_count == 1
+
+    # table metadata is reused within the freshness TTL
+    modified["p.d.history"] = datetime.datetime(2021, 8, 2)
+    cache.get_df(SQL, client, run_query)
+    assert run_query.call_count == 1
+
+    clock.return_value = 11
+    cache.get_df(SQL, client, run_query)
+    assert run_query.call_count == 2
+
+    assert cache.get_stats()["hits"] == 2
+    assert cache.get_stats()["misses"] == 2
+
+
+def test_query_cache_evicts_and_persists(tmp_path):
+    client = get_client({"p.d.predictions": datetime.datetime(2021, 8, 1)})
+    run_query = Mock(
+        side_effect=lambda sql, client, job_config: pd.DataFrame({"sql": [sql] * 100})
+    )
+    cache = QueryCache(max_bytes=1, disk_dir=str(tmp_path))
+
+    for i in range(3):
+        cache.get_df(f"SELECT {i} FROM `p.d.predictions`", client, run_query)
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 1
+    assert stats["evictions"] == 2
+    assert len(list(tmp_path.glob("*.parquet"))) == 3
+
+    cache = QueryCache(disk_dir=str(tmp_path))
+    df = cache.get_df("SELECT 0 FROM `p.d.predictions`", client, run_query)
+    assert df["sql"][0] == "SELECT 0 FROM `p.d.predictions`"
+    assert run_query.call_count == 3
+    assert cache.get_stats()["disk_hits"] == 1
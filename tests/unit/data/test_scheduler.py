@@ -0,0 +1,88 @@
+import threading
+import time
+
+from footbot.data.scheduler import BACKGROUND
+from footbot.data.scheduler import HIGH
+from footbot.data.scheduler import FetchScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fetch_scheduler_backs_off_and_recovers():
+    clock = Clock()
+    scheduler = FetchScheduler(
+        rate=10, concurrency=8, min_rate=1, rate_increase=1, cooldown=1, clock=clock
+    )
+
+    scheduler.record(0.1, 429)
+    assert scheduler.rate == 5
+    assert scheduler.concurrency == 4
+    assert scheduler.get_stats()["backing_off"]
+
+    # responses already in flight do not back off again within the cooldown
+    scheduler.record(0.1, 503)
+    assert scheduler.rate == 5
+
+    clock.now = 1.5
+    assert not scheduler.get_stats()["backing_off"]
+    scheduler.record(5.0, 200)
+    assert scheduler.rate == 2.5
+    assert scheduler.concurrency == 2
+
+    clock.now = 3
+    scheduler.record(0.1, error=True)
+    scheduler.record(0.1, 200)
+    scheduler.record(0.1, 200)
+    assert scheduler.rate == 3.25
+    assert scheduler.concurrency == 3
+    assert scheduler.get_stats()["back_offs"] == 3
+
+
+def test_fetch_scheduler_limits_rate():
+    scheduler = FetchScheduler(rate=20, concurrency=8)
+
+    start = time.monotonic()
+    for _ in range(30):
+        with scheduler.slot():
+            pass
+
+    # a burst of one second of tokens, then the rest at 20 per second
+    assert time.monotonic() - start >= 0.4
+    assert scheduler.get_stats()["admitted"] == 30
+
+
+def test_fetch_scheduler_admits_by_priority():
+    scheduler = FetchScheduler(rate=1000, concurrency=1)
+    admitted = []
+
+    def fetch(name, priority):
+        with scheduler.priority(priority):
+            with scheduler.slot():
+                admitted.append(name)
+
+    scheduler.acquire()
+    threads = [
+        threading.Thread(target=fetch, args=("history", BACKGROUND)),
+        threading.Thread(target=fetch, args=("picks", HIGH)),
+    ]
+    for thread in threads:
+        thread.start()
+        while scheduler.get_stats()["queue_depth"] < threads.index(thread) + 1:
+            time.sleep(0.001)
+
+    assert scheduler.get_stats()["queue_depth_by_priority"] == {
+        HIGH: 1,
+        1: 0,
+        BACKGROUND: 1,
+    }
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+
+    assert admitted == ["picks", "history"]
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from footbot.data.schema import ELEMENT_HISTORY_FIELDS
+from footbot.data.schema import Field
+from footbot.data.schema import parse_records
+
+
+def test_parse_records():
+    fields = [
+        Field("element", "int16", source="id"),
+        Field("event", "int16"),
+        Field("chance", "int16", nullable=True),
+        Field("form", "float32", nullable=True),
+        Field("special", "bool"),
+        Field("status", "category"),
+        Field("news", "str"),
+        Field("news_added", "datetime", nullable=True),
+    ]
+    records = [
+        {
+            "id": 1,
+            "chance": None,
+            "form": "1.5",
+            "special": False,
+            "status": "a",
+            "news": "",
+            "news_added": None,
+        },
+        {
+            "id": 2,
+            "chance": 75,
+            "form": None,
+            "special": True,
+            "status": "i",
+            "news": "Knee injury",
+            "news_added": "2021-08-13T19:00:00Z",
+        },
+    ]
+
+    df = parse_records(records, fields, values={"event": 3})
+
+    assert list(df.columns) == [i.name for i in fields]
+    assert df["element"].dtype == np.int16
+    assert df["event"].tolist() == [3, 3]
+    assert df["chance"].dtype == "Int16"
+    assert df["chance"].isna().tolist() == [True, False]
+    assert df["form"].dtype == np.float32
+    assert df["form"].iloc[0] == 1.5
+    assert np.isnan(df["form"].iloc[1])
+    assert df["special"].dtype == bool
+    assert df["status"].dtype == "category"
+    assert df["news_added"].iloc[1] == pd.Timestamp("2021-08-13 19:00:00")
+
+
+def test_parse_records_not_nullable():
+    with pytest.raises(Exception) as e:
+        parse_records([{"a": None}], [Field("a", "int16")])
+    assert "`a` contains nulls but is not nullable" in str(e.value)
+
+
+def test_parse_records_rename_and_empty():
+    df = parse_records([], ELEMENT_HISTORY_FIELDS)
+    assert len(df) == 0
+    assert "event" in df.columns
+    assert "round" not in df.columns
@@ -0,0 +1,204 @@
+from unittest.mock import Mock
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from footbot.data.sync import get_elements_to_sync
+from footbot.data.sync import get_elements_with_changed_fixtures
+from footbot.data.sync import get_history_sync_state
+from footbot.data.sync import get_last_finished_event
+from footbot.data.sync import split_element_history_df
+from footbot.data.sync import sync_element_history_fixtures
+
+bootstrap_data = {
+    "events": [
+        {"id": 1, "finished": True},
+        {"id": 2, "finished": True},
+        {"id": 3, "finished": False},
+    ],
+    "teams": [{"id": 1}, {"id": 2}, {"id": 3}],
+    "elements": [
+        {"id": 1, "team": 1, "minutes": 180, "total_points": 10},
+        {"id": 2, "team": 2, "minutes": 90, "total_points": 3},
+        {"id": 3, "team": 3, "minutes": 0, "total_points": 0},
+        {"id": 4, "team": 3, "minutes": 90, "total_points": 6},
+    ],
+}
+
+sync_state_df = pd.DataFrame(
+    {
+        "element": [1, 2, 4],
+        "last_event": [2, 2, 1],
+        "minutes": [180, 90, 90],
+        "total_points": [10, 2, 6],
+        "checked_event": [2, 0, 0],
+    }
+)
+
+
+def test_get_last_finished_event():
+    assert get_last_finished_event(bootstrap_data) == 2
+    assert get_last_finished_event({"events": [{"id": 1, "finished": False}]}) == 0
+
+
+def test_get_elements_to_sync():
+    # 1 is up to date, 2 has changed points, 3 is new, 4 is behind
+    assert get_elements_to_sync(bootstrap_data, sync_state_df) == [2, 3, 4]
+
+    # 4 had no fixture in event 2, but was checked after it finished
+    checked_df = sync_state_df.assign(checked_event=[2, 0, 2])
+    assert get_elements_to_sync(bootstrap_data, checked_df) == [2, 3]
+
+
+def test_get_elements_with_changed_fixtures():
+    fixtures = [
+        {"code": 10, "team_h": 1, "team_a": 2, "event": 3, "kickoff_time": None},
+        {
+            "code": 11,
+            "team_h": 3,
+            "team_a": 1,
+            "event": 4,
+            "kickoff_time": "2021-08-13T19:00:00Z",
+        },
+    ]
+    stored_fixtures_df = pd.DataFrame(
+        {
+            "element": [1, 1, 2, 4],
+            "code": [10, 11, 10, 11],
+            "team_h": [1, 3, 1, 3],
+            "team_a": [2, 1, 2, 1],
+            "event": [3, 5, 3, 5],
+            "kickoff_time": pd.to_datetime([None, None, None, None]),
+            "is_home": [True, False, False, True],
+        }
+    )
+
+    elements, changed_teams = get_elements_with_changed_fixtures(
+        bootstrap_data, fixtures, stored_fixtures_df
+    )
+    # fixture 11 moved, so teams 1 and 3 changed, 2 is unchanged
+    assert changed_teams == [1, 3]
+    assert elements == [1, 3, 4]
+
+
+def test_split_element_history_df():
+    element_history_df = pd.DataFrame(
+        {
+            "element": [1, 1, 1, 2, 2, 2, 3],
+            "event": [1, 2, 3, 1, 2, 3, 3],
+            "minutes": [90, 90, 90, 0, 90, 90, 0],
+            "total_points": [5, 5, 2, 0, 3, 1, 0],
+        }
+    )
+
+    append_df, replace_elements = split_element_history_df(
+        element_history_df, sync_state_df
+    )
+    # 2 had a points correction, so all of its rows are replaced
+    assert replace_elements == [2]
+    assert append_df[["element", "event"]].values.tolist() == [
+        [1, 3],
+        [2, 1],
+        [2, 2],
+        [2, 3],
+        [3, 3],
+    ]
+
+
+def test_sync_drops_rows_of_a_failed_flush():
+    history_df = pd.DataFrame(
+        {
+            "element": [4],
+            "fixture": [2],
+            "event": [2],
+            "minutes": [0],
+            "total_points": [0],
+        }
+    )
+    stored_fixtures_df = pd.DataFrame(
+        columns=[
+            "element",
+            "code",
+            "team_h",
+            "team_a",
+            "event",
+            "kickoff_time",
+            "is_home",
+        ]
+    )
+    backend = Mock()
+    backend.write.side_effect = [Exception("quota exceeded"), None]
+
+    with patch("footbot.data.sync.element_data") as element_data, patch(
+        "footbot.data.sync.fpl.get_future_fixtures", return_value=[]
+    ), patch(
+        "footbot.data.sync.get_history_sync_state", return_value=sync_state_df
+    ), patch(
+        "footbot.data.sync.get_stored_fixtures", return_value=stored_fixtures_df
+    ), patch(
+        "footbot.data.sync.utils.upsert_to_table"
+    ), patch(
+        "footbot.data.sync.utils.write_to_table"
+    ) as write_to_table, patch(
+        "footbot.data.writer.history_backend", backend
+    ):
+        element_data.get_bootstrap.return_value = bootstrap_data
+        element_data.get_bulk_element_history_fixture_dfs.return_value = (
+            history_df,
+            pd.DataFrame(),
+            {"failed": []},
+        )
+
+        with pytest.raises(Exception, match="quota exceeded"):
+            sync_element_history_fixtures(Mock())
+        # elements are only recorded as checked once their rows are written
+        write_to_table.assert_not_called()
+        # the next sync fetches the rows again, so writes them only once
+        sync_element_history_fixtures(Mock())
+
+    assert len(backend.write.call_args[0][2]) == 1
+    checked_df = write_to_table.call_args[0][2]
+    assert dict(zip(checked_df["element"], checked_df["checked_event"])) == {
+        1: 2,
+        2: 2,
+        3: 2,
+        4: 2,
+    }
+
+
+def test_get_history_sync_state(tmp_path):
+    pytest.importorskip("duckdb")
+    from footbot.data.backends import LocalBackend
+
+    backend = LocalBackend(str(tmp_path))
+    backend.write_table(
+        "fpl",
+        "element_gameweeks_2122",
+        pd.DataFrame(
+            {
+                "element": [1, 1, 2],
+                "event": [1, 2, 1],
+                "minutes": [90, 90, 0],
+                "total_points": [2, 6, 0],
+            }
+        ),
+    )
+    # no sync has recorded checked events yet
+    state_df = get_history_sync_state(backend).sort_values("element")
+    assert state_df["checked_event"].tolist() == [0, 0]
+
+    # element 3 has never had a fixture
+    backend.write_table(
+        "fpl",
+        "element_gameweeks_checked_2122",
+        pd.DataFrame({"element": [2, 3], "checked_event": [2, 2]}),
+    )
+    state_df = get_history_sync_state(backend).sort_values("element")
+    assert state_df.to_dict("list") == {
+        "element": [1, 2, 3],
+        "last_event": [2, 1, 0],
+        "minutes": [180, 0, 0],
+        "total_points": [8, 0, 0],
+        "checked_event": [0, 2, 2],
+    }
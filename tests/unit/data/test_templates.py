@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from footbot.data.templates import TemplateRegistry
+from footbot.data.templates import compile_template
+from footbot.data.templates import registry
+
+
+def write_sql(tmp_path, name, sql):
+    path = tmp_path / f"{name}.sql"
+    path.write_text(sql)
+    return str(path)
+
+
+def test_registry_compiles_shipped_templates():
+    assert {"element_predictions", "predict", "train"} <= set(registry.templates)
+    assert registry.get("element_predictions").parameters == {
+        "snapshot_version": "INT64",
+        "start_event": "INT64",
+    }
+    assert registry.get("./footbot/predictor/sql/predict.sql").name == "predict"
+
+    for template in registry.templates.values():
+        assert "{" not in template.sql
+
+
+def test_compile_template_checks_declarations(tmp_path):
+    path = write_sql(tmp_path, "a", "-- @x INT64\nSELECT @x, @y")
+    with pytest.raises(Exception, match="undeclared parameters \\['y'\\]"):
+        compile_template(path)
+
+    path = write_sql(tmp_path, "b", "-- @x INT64\n-- @y INT64\nSELECT @x")
+    with pytest.raises(Exception, match="unused parameters \\['y'\\]"):
+        compile_template(path)
+
+    path = write_sql(tmp_path, "c", "-- @x INTEGER\nSELECT @x")
+    with pytest.raises(Exception, match="unknown type"):
+        compile_template(path)
+
+
+def test_render(tmp_path):
+    path = write_sql(tmp_path, "a", "-- @x INT64\n-- @y STRING\nSELECT @x, @y")
+    templates = TemplateRegistry([path])
+
+    template, parameters = templates.render("a", x=np.int64(3), y="z")
+    assert template.name == "a"
+    assert [(p.name, p.type_, p.value) for p in parameters] == [
+        ("x", "INT64", 3),
+        ("y", "STRING", "z"),
+    ]
+    assert type(parameters[0].value) is int
+
+    with pytest.raises(Exception, match="needs parameters \\['y'\\]"):
+        templates.render("a", x=1)
+    with pytest.raises(Exception, match="does not take parameters \\['w'\\]"):
+        templates.render("a", x=1, y="z", w=0)
+    with pytest.raises(Exception, match="not a known SQL template"):
+        templates.render("b")
+
+    with pytest.raises(Exception, match="takes `@x` as INT64, not str '3'"):
+        templates.render("a", x="3", y="z")
+    with pytest.raises(Exception, match="takes `@x` as INT64, not bool"):
+        templates.render("a", x=True, y="z")
+    with pytest.raises(Exception, match="takes `@y` as STRING, not float"):
+        templates.render("a", x=1, y=np.float64(1.5))
+
+
+def test_render_arrays(tmp_path):
+    path = write_sql(tmp_path, "a", "-- @x ARRAY<INT64>\nSELECT 1 IN UNNEST(@x)")
+    templates = TemplateRegistry([path])
+
+    _, parameters = templates.render("a", x=np.array([1, 2]))
+    assert (parameters[0].name, parameters[0].array_type) == ("x", "INT64")
+    assert parameters[0].values == [1, 2]
+    assert type(parameters[0].values[0]) is int
+
+    with pytest.raises(Exception, match="takes `@x` as ARRAY<INT64>"):
+        templates.render("a", x=[1, "2"])
+
+
+def test_shipped_call_sites_bind_to_their_templates():
+    # parameters passed by the pipeline's call sites
+    for name, values in [
+        ("current_prediction_snapshot", {}),
+        ("prediction_snapshot", dict(snapshot_version=1)),
+        ("prediction_snapshot_hashes", dict(snapshot_version=1)),
+        ("delete_prediction_snapshots", dict(oldest_version=1)),
+        (
+            "copy_prediction_snapshot",
+            dict(snapshot_version=2, base_version=1, elements=[1]),
+        ),
+        ("element_predictions", dict(snapshot_version=1, start_event=1)),
+        (
+            "element_predictions_delta",
+            dict(
+                snapshot_version=2, base_version=1, prediction_version=0, start_event=1
+            ),
+        ),
+        ("element_attributes", {}),
+        ("predict", dict(current_event=1)),
+        ("train", {}),
+    ]:
+        registry.render(name, **values)
@@ -1,5 +1,215 @@
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+import pytest
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from footbot.data.backends import LocalBackend
+from footbot.data.utils import BigQueryBackend
+from footbot.data.utils import get_backend
+from footbot.data.utils import get_load_file
 from footbot.data.utils import get_safe_web_name
+from footbot.data.utils import iter_chunks
+from footbot.data.utils import upsert_to_table
+from footbot.data.utils import write_chunks_to_table
+from footbot.data.utils import write_to_table
 
 
 def test_get_safe_web_name():
     assert get_safe_web_name("abć") == "abc"
+
+
+def test_get_backend(tmp_path):
+    pytest.importorskip("duckdb")
+
+    client = Mock()
+    backend = get_backend(client)
+    assert isinstance(backend, BigQueryBackend)
+    assert backend.client is client
+    assert get_backend(backend) is backend
+
+    local_backend = LocalBackend(str(tmp_path))
+    assert get_backend(local_backend) is local_backend
+
+
+def test_get_load_file():
+    df = pd.DataFrame(
+        {
+            "element": np.array([1, 2], dtype=np.int16),
+            "form": np.array([1.5, np.nan], dtype=np.float32),
+            "kickoff_time": pd.to_datetime(["2021-08-13 19:00:00", None]),
+        }
+    )
+
+    csv = get_load_file(df, "CSV").read().decode("utf-8")
+    assert csv.splitlines()[0] == "element,form,kickoff_time"
+
+    parquet_df = pd.read_parquet(get_load_file(df, "PARQUET"))
+    assert parquet_df["element"].dtype == np.int16
+    assert parquet_df["form"].dtype == np.float32
+    assert str(parquet_df["kickoff_time"].dt.tz) == "UTC"
+
+    with pytest.raises(Exception) as e:
+        get_load_file(df, "JSON")
+    assert "`source_format` must be one of CSV or PARQUET" in str(e.value)
+
+
+def get_job(job_type):
+    return Mock(spec=job_type, job_id="abc", created=None, started=None)
+
+
+def get_query_job():
+    job = get_job(bigquery.QueryJob)
+    job.configure_mock(
+        total_bytes_processed=100, total_bytes_billed=0, slot_millis=1, cache_hit=False
+    )
+    return job
+
+
+class FakeClient:
+    def __init__(self):
+        self.rows = {}
+        self.copies = []
+        self.loaded_chunks = []
+
+    def dataset(self, dataset):
+        return bigquery.DatasetReference("footbot-001", dataset)
+
+    def get_table(self, table_ref):
+        if table_ref.table_id not in self.rows:
+            raise NotFound(table_ref.table_id)
+        return Mock(schema=[], num_rows=self.rows[table_ref.table_id])
+
+    def load_table_from_file(self, file_obj, table_ref, job_config):
+        if job_config.source_format == "CSV":
+            rows = len(pd.read_csv(file_obj))
+        else:
+            rows = len(pd.read_parquet(file_obj))
+        self.loaded_chunks.append(rows)
+        if job_config.write_disposition == "WRITE_TRUNCATE":
+            self.rows[table_ref.table_id] = 0
+        self.rows[table_ref.table_id] = self.rows.get(table_ref.table_id, 0) + rows
+        return get_job(bigquery.LoadJob)
+
+    def copy_table(self, source_ref, table_ref, job_config):
+        self.copies.append((source_ref.table_id, table_ref.table_id))
+        self.rows[table_ref.table_id] = self.rows[source_ref.table_id]
+        return get_job(bigquery.CopyJob)
+
+    def delete_table(self, table_ref, not_found_ok=False):
+        del self.rows[table_ref.table_id]
+
+
+def test_write_to_table_chunked():
+    client = FakeClient()
+    df = pd.DataFrame({"element": range(25)})
+
+    write_to_table(
+        "fpl",
+        "predictions",
+        df,
+        client,
+        write_disposition="WRITE_TRUNCATE",
+        source_format="PARQUET",
+        chunk_rows=10,
+        max_workers=2,
+    )
+
+    assert sorted(client.loaded_chunks) == [5, 10, 10]
+    assert client.copies[0][0].startswith("predictions_staging_")
+    assert client.copies[0][1] == "predictions"
+    # staging table is removed
+    assert client.rows == {"predictions": 25}
+
+
+def test_write_to_table_partitioned():
+    client = Mock()
+    client.load_table_from_file.return_value = get_job(bigquery.LoadJob)
+    range_partitioning = bigquery.RangePartitioning(
+        field="event", range_=bigquery.PartitionRange(start=1, end=39, interval=1)
+    )
+
+    write_to_table(
+        "fpl",
+        "predictions",
+        pd.DataFrame({"element": [1], "event": [3]}),
+        client,
+        source_format="PARQUET",
+        range_partitioning=range_partitioning,
+        clustering_fields=["element"],
+    )
+
+    job_config = client.load_table_from_file.call_args.kwargs["job_config"]
+    assert job_config.range_partitioning.field == "event"
+    assert job_config.clustering_fields == ["element"]
+
+    with pytest.raises(Exception, match="partitioned"):
+        write_to_table(
+            "fpl",
+            "predictions",
+            pd.DataFrame({"element": range(3), "event": 3}),
+            client,
+            chunk_rows=2,
+            range_partitioning=range_partitioning,
+        )
+
+
+def test_write_chunks_to_table_consistency_check():
+    client = FakeClient()
+    client.load_table_from_file = Mock(return_value=get_job(bigquery.LoadJob))
+    client.get_table = Mock(return_value=Mock(num_rows=1))
+    client.delete_table = Mock()
+
+    with pytest.raises(Exception) as e:
+        write_chunks_to_table(
+            "fpl",
+            "predictions",
+            iter_chunks(pd.DataFrame({"element": range(4)}), 2),
+            client,
+            source_format="PARQUET",
+        )
+    assert "has 1 rows, expected 4" in str(e.value)
+    client.delete_table.assert_called_once()
+
+
+def test_upsert_to_table():
+    client = FakeClient()
+    client.rows["element_gameweeks_2122"] = 10
+    client.query = Mock(return_value=get_query_job())
+    df = pd.DataFrame({"element": [1, 1, 2], "fixture": [1, 2, 3], "minutes": 90})
+
+    upsert_to_table("fpl", "element_gameweeks_2122", df, ["element", "fixture"], client)
+
+    sql = client.query.call_args[0][0]
+    assert "MERGE `footbot-001.fpl.element_gameweeks_2122` T" in sql
+    assert "ON T.element = S.element AND T.fixture = S.fixture" in sql
+    assert "UPDATE SET minutes = S.minutes" in sql
+    assert "WHEN NOT MATCHED BY SOURCE AND T.element IN UNNEST(@partitions)" in sql
+
+    job_config = client.query.call_args[1]["job_config"]
+    assert job_config.query_parameters[0].values == [1, 2]
+    # staging table is removed
+    assert client.rows == {"element_gameweeks_2122": 10}
+
+
+def test_upsert_to_table_no_partitions():
+    client = Mock()
+    df = pd.DataFrame({"element": [], "fixture": []})
+    assert upsert_to_table("fpl", "a", df, ["element", "fixture"], client) is None
+    client.query.assert_not_called()
+
+
+def test_upsert_to_table_replaces_partitions_without_keys():
+    client = FakeClient()
+    client.rows["element_gameweeks_2122"] = 10
+    client.query = Mock(return_value=get_query_job())
+    df = pd.DataFrame({"element": [1, 1], "event": [3, 3], "points": [1.0, 2.0]})
+
+    upsert_to_table("fpl", "element_gameweeks_2122", df, [], client)
+
+    sql = client.query.call_args[0][0]
+    assert "ON FALSE" in sql
+    assert "UPDATE SET" not in sql
+    assert "WHEN NOT MATCHED BY SOURCE AND T.element IN UNNEST(@partitions)" in sql
@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+from footbot.data.writer import BatchWriter
+from footbot.data.writer import MemoryWriteBackend
+from footbot.data.writer import get_history_writer
+
+
+def get_df(n):
+    return pd.DataFrame({"element": range(n)})
+
+
+def test_batch_writer_flushes_on_rows():
+    backend = MemoryWriteBackend()
+    writer = BatchWriter(backend, max_rows=5, max_seconds=100, clock=lambda: 0)
+
+    writer.write("fpl", "a", get_df(2))
+    writer.write("fpl", "b", get_df(2))
+    assert backend.tables == {}
+
+    writer.write("fpl", "a", get_df(3))
+    assert len(backend.get_table("fpl", "a")) == 5
+    assert ("fpl", "b") not in backend.tables
+    assert writer.metrics[0]["rows"] == 5
+    assert writer.metrics[0]["dataframes"] == 2
+
+    writer.close()
+    assert len(backend.get_table("fpl", "b")) == 2
+    assert writer.get_stats()["buffered_rows"] == {}
+
+
+def test_batch_writer_flushes_on_time():
+    now = [0]
+    backend = MemoryWriteBackend()
+    writer = BatchWriter(backend, max_rows=100, max_seconds=10, clock=lambda: now[0])
+
+    writer.write("fpl", "a", get_df(1))
+    writer.flush_due()
+    assert backend.tables == {}
+
+    now[0] = 10
+    writer.flush_due()
+    assert len(backend.get_table("fpl", "a")) == 1
+
+
+def test_batch_writer_keeps_rows_on_failure():
+    class FailingBackend(MemoryWriteBackend):
+        def write(self, dataset, table, df):
+            raise Exception("quota exceeded")
+
+    writer = BatchWriter(FailingBackend(), max_rows=100)
+    writer.write("fpl", "a", get_df(3))
+
+    with pytest.raises(Exception):
+        writer.flush()
+    assert writer.get_stats()["buffered_rows"] == {"fpl.a": 3}
+
+    writer.backend = MemoryWriteBackend()
+    writer.flush()
+    assert len(writer.backend.get_table("fpl", "a")) == 3
+
+
+def test_get_history_writer_shares_metrics_only():
+    first = get_history_writer()
+    second = get_history_writer()
+
+    assert first is not second
+    assert first.buffers is not second.buffers
+    assert first.metrics is second.metrics
@@ -1,18 +1,25 @@
+-- @start_event INT64
+-- @end_event INT64
 WITH
   predictions AS (
   SELECT
     element,
-    SUM(predicted_total_points)/({end_event} - {start_event} + 1) AS average_points
+    SUM(predicted_total_points)/(@end_event - @start_event + 1) AS average_points
   FROM (
     SELECT
       element,
       event,
       predicted_total_points
     FROM
-      `footbot-001.fpl.element_gameweeks_predictions_2122_v01` )
-  WHERE
-    event BETWEEN {start_event}
-    AND {end_event}
+      `footbot-001.fpl.element_gameweeks_predictions_2122_v02`
+    WHERE
+      event BETWEEN @start_event
+      AND @end_event
+      AND snapshot_version = (
+      SELECT
+        snapshot_version
+      FROM
+        `footbot-001.fpl.element_gameweeks_predictions_2122_v02_current`) )
   GROUP BY
     1 ),
   --------------------------------------------------------------------------------------------------------------------------------------------------------------
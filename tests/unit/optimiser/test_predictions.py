@@ -0,0 +1,202 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from google.cloud import bigquery
+
+from footbot.data.backends import LocalBackend
+from footbot.data.templates import TemplateRegistry
+from footbot.optimiser.predictions import PredictionMatrix
+from footbot.optimiser.predictions import PredictionMatrixLoader
+from footbot.predictor.snapshots import publish_snapshot
+from footbot.predictor.snapshots import write_snapshot
+
+# the optimiser's former query, kept as an oracle for the prediction matrix
+OPTIMISER_SQL = os.path.join(os.path.dirname(__file__), "optimiser.sql")
+
+PREDICTIONS_DF = pd.DataFrame(
+    {
+        "element": [1, 1, 2, 2, 3],
+        "event": [3, 4, 3, 5, 3],
+        "predicted_total_points": [2.0, 4.0, 1.0, 3.0, 9.0],
+        "prediction_version": 1,
+    }
+)
+
+ELEMENT_DATA_DF = pd.DataFrame(
+    {
+        "element": [1, 2, 2],
+        "element_type": [1, 2, 2],
+        "now_cost": [50, 60, 65],
+        "team": [1, 2, 2],
+        "safe_web_name": ["a", "b", "b"],
+        "chance_of_playing_next_round": [None, 50.0, 50.0],
+        "datetime": pd.to_datetime(["2021-08-01", "2021-08-01", "2021-08-02"]),
+    }
+)
+
+
+def test_prediction_matrix():
+    attributes_df = pd.DataFrame(
+        {
+            "element": [1, 2],
+            "element_type": [1, 2],
+            "value": [50, 65],
+            "team": [1, 2],
+            "safe_web_name": ["a", "b"],
+            "prob_playing": [1.0, 0.5],
+        }
+    )
+    matrix = PredictionMatrix(PREDICTIONS_DF, attributes_df, version="v1")
+
+    # element 3 has no attributes
+    assert matrix.points.shape == (2, 38)
+    np.testing.assert_allclose(matrix.get_average_points(3, 4), [3.0, 0.25])
+    np.testing.assert_allclose(matrix.get_average_points(5, 40), [0.0, 1.5 / 36])
+    assert matrix.nbytes >= 2 * 38 * 4
+
+    assert [p["element"] for p in matrix.get_players(3, 5)] == [1, 2]
+    assert [p["element"] for p in matrix.get_players(5, 5)] == [2, 1]
+    assert matrix.get_players(3, 3)[0] == {
+        "element": 1,
+        "element_type": 1,
+        "value": 50,
+        "team": 1,
+        "average_points": 2.0,
+        "safe_web_name": "a",
+    }
+
+    with pytest.raises(Exception):
+        matrix.get_average_points(5, 4)
+
+    # predictions of earlier events were not loaded
+    matrix = PredictionMatrix(PREDICTIONS_DF, attributes_df, start_event=3)
+    np.testing.assert_allclose(matrix.get_average_points(3, 4), [3.0, 0.25])
+    with pytest.raises(Exception, match="predictions start at event 3"):
+        matrix.get_average_points(2, 4)
+
+
+def test_prediction_matrix_get_updated():
+    attributes_df = pd.DataFrame(
+        {
+            "element": [1, 2],
+            "element_type": [1, 2],
+            "value": [50, 65],
+            "team": [1, 2],
+            "safe_web_name": ["a", "b"],
+            "prob_playing": [1.0, 1.0],
+        }
+    )
+    matrix = PredictionMatrix(PREDICTIONS_DF, attributes_df, version="v1")
+    assert matrix.prediction_version == 1
+
+    # element 2's predictions are replaced, its event 5 prediction is removed
+    updated = matrix.get_updated(
+        pd.DataFrame(
+            {
+                "element": [2],
+                "event": [4],
+                "predicted_total_points": [7.0],
+                "prediction_version": [2],
+            }
+        ),
+        version="v2",
+    )
+
+    assert updated.version == "v2"
+    assert updated.prediction_version == 2
+    np.testing.assert_allclose(
+        updated.points[:, 2:5], [[2.0, 4.0, 0.0], [0.0, 7.0, 0.0]]
+    )
+    np.testing.assert_allclose(matrix.points[1, 2:5], [1.0, 0.0, 3.0])
+
+
+def test_prediction_matrix_loader_matches_optimiser_sql(tmp_path):
+    pytest.importorskip("duckdb")
+
+    backend = LocalBackend(str(tmp_path))
+    publish_snapshot(write_snapshot(PREDICTIONS_DF, backend, clock=lambda: 1), backend)
+    backend.write_table("fpl", "element_data_2122", ELEMENT_DATA_DF)
+
+    clock = [0]
+    loader = PredictionMatrixLoader(check_interval=10, clock=lambda: clock[0])
+    matrix = loader.get(backend)
+    assert matrix.version[0] == 1000
+
+    optimiser = TemplateRegistry([OPTIMISER_SQL])
+    for start_event, end_event in [(1, 38), (3, 4), (4, 5)]:
+        template, query_parameters = optimiser.render(
+            "optimiser", start_event=start_event, end_event=end_event
+        )
+        expected = backend.query(
+            template.sql, bigquery.QueryJobConfig(query_parameters=query_parameters)
+        )
+        actual = pd.DataFrame(matrix.get_players(start_event, end_event))
+        pd.testing.assert_frame_equal(
+            actual, expected, check_dtype=False, check_exact=False
+        )
+
+    # a newly published snapshot is picked up once the check interval has passed
+    version = write_snapshot(
+        PREDICTIONS_DF.assign(predicted_total_points=0.0, prediction_version=2),
+        backend,
+        clock=lambda: 2,
+    )
+    assert loader.get(backend) is matrix
+    publish_snapshot(version, backend)
+
+    assert loader.get(backend) is matrix
+    clock[0] = 11
+    assert loader.get(backend) is not matrix
+    assert loader.get_stats()["loads"] == 1
+    assert loader.get_stats()["delta_loads"] == 1
+    assert loader.get(backend).get_average_points(1, 38).sum() == 0
+
+    # only predictions from the first event asked for are loaded, a later window
+    # is served from the loaded matrix and an earlier one reloads it
+    publish_snapshot(write_snapshot(PREDICTIONS_DF, backend, clock=lambda: 3), backend)
+    loader = PredictionMatrixLoader(check_interval=10, clock=lambda: clock[0])
+    matrix = loader.get(backend, start_event=4)
+    assert matrix.start_event == 4
+    assert not matrix.points[:, :3].any()
+    np.testing.assert_allclose(matrix.get_average_points(4, 5), [2.0, 0.75])
+    assert loader.get(backend, start_event=5) is matrix
+    assert loader.get(backend, start_event=3).start_event == 3
+    assert loader.get_stats()["loads"] == 2
+
+    # a change of element data reloads every element
+    backend.write_table("fpl", "element_data_2122", ELEMENT_DATA_DF)
+    os.utime(backend.get_path("fpl", "element_data_2122"), (2, 2))
+    clock[0] = 22
+    loader.get(backend, start_event=3)
+    assert loader.get_stats()["loads"] == 3
+
+
+def test_prediction_matrix_loader_clears_elements_no_longer_predicted(tmp_path):
+    pytest.importorskip("duckdb")
+
+    backend = LocalBackend(str(tmp_path))
+    base = write_snapshot(PREDICTIONS_DF, backend, clock=lambda: 1)
+    publish_snapshot(base, backend)
+    backend.write_table("fpl", "element_data_2122", ELEMENT_DATA_DF)
+
+    clock = [0]
+    loader = PredictionMatrixLoader(check_interval=10, clock=lambda: clock[0])
+    assert loader.get(backend).get_average_points(3, 5)[1] > 0
+
+    # element 1 is rescored and element 2 is no longer predicted
+    version = write_snapshot(
+        PREDICTIONS_DF[PREDICTIONS_DF["element"] == 1].assign(prediction_version=2),
+        backend,
+        clock=lambda: 2,
+        base_version=base,
+        elements=[1, 2],
+    )
+    publish_snapshot(version, backend)
+    clock[0] = 11
+
+    matrix = loader.get(backend)
+    assert loader.get_stats()["delta_loads"] == 1
+    assert loader.get_stats()["delta_elements"] == 2
+    np.testing.assert_allclose(matrix.get_average_points(3, 5), [2.0, 0.0])
@@ -0,0 +1,81 @@
+import os
+
+from google.api_core.exceptions import NotFound
+
+from footbot.predictor.artifacts import ArtifactStore
+
+
+class FakeBlob:
+    def __init__(self, objects, name):
+        self.objects = objects
+        self.name = name
+
+    def exists(self):
+        return self.name in self.objects
+
+    def upload_from_filename(self, path):
+        with open(path, "rb") as f:
+            self.objects[self.name] = f.read()
+
+    def download_to_filename(self, path):
+        if self.name not in self.objects:
+            raise NotFound(self.name)
+        with open(path, "wb") as f:
+            f.write(self.objects[self.name])
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+
+    def blob(self, name):
+        return FakeBlob(self.objects, name)
+
+
+def test_artifact_store_shares_models_through_bucket(tmp_path):
+    bucket = FakeBucket()
+    store = ArtifactStore(str(tmp_path / "a"), bucket=bucket)
+    assert store.save("points", "abc", {"alpha": 0.1}, {"rows": 1})
+    assert sorted(bucket.objects) == [
+        "points/abc.joblib",
+        "points/abc.json",
+        "points/latest.json",
+    ]
+
+    # another instance, with nothing on its own disk
+    other = ArtifactStore(str(tmp_path / "b"), bucket=bucket)
+    assert other.exists("points", "abc")
+    assert not other.exists("points", "def")
+    model, metadata = other.load("points")
+    assert model == {"alpha": 0.1}
+    assert metadata == {"fingerprint": "abc", "rows": 1}
+
+    # the latest model is read from the bucket, not the local copy
+    store.save("points", "def", {"alpha": 0.2}, {"rows": 2})
+    model, metadata = other.load("points")
+    assert metadata["fingerprint"] == "def"
+
+
+def test_artifact_store_logs_failed_saves(tmp_path):
+    root = tmp_path / "read-only"
+    root.write_text("not a directory")
+
+    store = ArtifactStore(str(root))
+    assert not store.save("points", "abc", {"alpha": 0.1}, {"rows": 1})
+    assert not os.path.isdir(root)
+
+
+def test_artifact_store_sets_latest_through_bucket(tmp_path):
+    bucket = FakeBucket()
+    store = ArtifactStore(str(tmp_path / "a"), bucket=bucket)
+    store.save("points", "abc", {"alpha": 0.1}, {"rows": 1})
+    store.save("points", "def", {"alpha": 0.2}, {"rows": 2})
+
+    other = ArtifactStore(str(tmp_path / "b"), bucket=bucket)
+    assert other.set_latest("points", "abc")
+    model, metadata = store.load("points")
+    assert model == {"alpha": 0.1}
+    assert metadata["fingerprint"] == "abc"
+
+    assert not other.set_latest("points", "missing")
+    assert store.load("points")[1]["fingerprint"] == "abc"
@@ -0,0 +1,254 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from footbot.data import utils
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.features import FeatureEngine
+from footbot.predictor.features import RollingWindows
+from footbot.predictor.features import build_local_features
+from footbot.predictor.features import get_kickoff_features
+from footbot.predictor.train_predict import CATEGORICAL_FEATURES
+
+
+def get_history_fixture_element_dfs(events=12, seed=0):
+    rng = np.random.default_rng(seed)
+    element_df = pd.DataFrame(
+        {
+            "element": np.arange(1, 9),
+            "element_type": [1, 2, 3, 4] * 2,
+            "team": np.repeat([1, 2, 3, 4], 2),
+            "safe_web_name": [f"player {i}" for i in range(1, 9)],
+        }
+    )
+
+    fixtures = []
+    for event in range(1, events + 1):
+        kickoff = pd.Timestamp("2021-08-14 14:00", tz="UTC") + pd.Timedelta(
+            days=7 * (event - 1)
+        )
+        pairs = [(1, 2), (3, 4)] if event % 2 else [(2, 3), (4, 1)]
+        if event == 5:
+            # a double gameweek for teams 1 and 2
+            pairs.append((2, 1))
+        for i, (team_h, team_a) in enumerate(pairs):
+            fixtures.append(
+                {
+                    "fixture": len(fixtures) + 1,
+                    "event": event,
+                    "team_h": team_h,
+                    "team_a": team_a,
+                    "kickoff_time": kickoff + pd.Timedelta(days=i),
+                    "team_h_score": int(rng.integers(0, 4)),
+                    "team_a_score": int(rng.integers(0, 4)),
+                }
+            )
+
+    history = []
+    for fixture in fixtures:
+        for element, team in element_df[["element", "team"]].to_numpy():
+            if team not in (fixture["team_h"], fixture["team_a"]):
+                continue
+            was_home = team == fixture["team_h"]
+            history.append(
+                {
+                    "element": element,
+                    "fixture": fixture["fixture"],
+                    "opponent_team": fixture["team_a" if was_home else "team_h"],
+                    "total_points": int(rng.integers(0, 10)),
+                    "was_home": was_home,
+                    "kickoff_time": fixture["kickoff_time"],
+                    "team_h_score": fixture["team_h_score"],
+                    "team_a_score": fixture["team_a_score"],
+                    "event": fixture["event"],
+                    "minutes": int(rng.integers(0, 91)),
+                    **{
+                        i: int(rng.integers(0, 3))
+                        for i in [
+                            "goals_scored",
+                            "assists",
+                            "clean_sheets",
+                            "goals_conceded",
+                            "saves",
+                            "bonus",
+                            "bps",
+                        ]
+                    },
+                    **{
+                        i: rng.uniform(0, 50)
+                        for i in ["influence", "creativity", "threat"]
+                    },
+                }
+            )
+    history_df = pd.DataFrame(history)
+
+    future_df = pd.DataFrame(
+        {
+            "element": [1, 3, 5],
+            "team_h": [1, 3, 3],
+            "team_a": [2, 1, 4],
+            "event": [events + 1, events + 1, None],
+            "kickoff_time": pd.to_datetime(["2022-01-02 16:30"] * 3, utc=True),
+            "is_home": [True, False, True],
+        }
+    )
+
+    return history_df, future_df, element_df
+
+
+def test_rolling_windows():
+    windows = RollingWindows(["a", "b"], 3)
+
+    assert np.isnan(windows.get_means([1], 2)).all()
+
+    windows.push([2, 1], [[1.0, 10.0], [2.0, 20.0]])
+    windows.push([1], [[4.0, np.nan]])
+    windows.push([1], [[6.0, 60.0]])
+    windows.push([1], [[8.0, 80.0]])
+
+    np.testing.assert_allclose(
+        windows.get_means([1, 2, 3], 2), [[7.0, 70.0], [1.0, 10.0], [np.nan, np.nan]]
+    )
+    np.testing.assert_allclose(windows.get_means([1], 3), [[6.0, 70.0]])
+
+    with pytest.raises(Exception):
+        windows.push([1, 1], [[1.0, 1.0], [1.0, 1.0]])
+
+
+def test_get_kickoff_features():
+    df = get_kickoff_features(
+        pd.Series(pd.to_datetime(["2021-08-14 11:30", "2021-08-15 16:30"], utc=True))
+    )
+
+    assert df.to_dict("list") == {
+        "was_sunday": [False, True],
+        "was_weekday": [False, False],
+        "was_late": [False, True],
+        "was_early": [True, False],
+    }
+
+
+def test_feature_engine_matches_grouped_rolling_means():
+    history_df, _, element_df = get_history_fixture_element_dfs()
+
+    df = FeatureEngine().update(history_df, element_df)
+
+    assert len(df) == len(history_df)
+    assert (
+        list(df.columns[: len(CATEGORICAL_FEATURES) + 1])
+        == ["total_points"] + CATEGORICAL_FEATURES
+    )
+
+    df = df.sort_values(["element", "fixture"])
+    expected = (
+        df.groupby("element")["total_points"]
+        .transform(lambda x: x.shift(1).rolling(3, min_periods=1).mean())
+        .to_numpy()
+    )
+    np.testing.assert_allclose(
+        df["rolling_avg_total_points_element_p3"].to_numpy(), expected
+    )
+
+    # fixture 4 is team 4 against team 1, whose only previous fixtures are 2 and 1
+    row = df[(df["element"] == 1) & (df["fixture"] == 4)].iloc[0]
+    fixture_scores = history_df.drop_duplicates("fixture").set_index("fixture")
+    assert row["opponent_team"] == 4
+    assert (
+        row["rolling_avg_goals_scored_team_p3"] == fixture_scores.loc[1, "team_h_score"]
+    )
+    assert (
+        row["rolling_avg_goals_scored_opponent_p3"]
+        == fixture_scores.loc[2, "team_a_score"]
+    )
+
+
+def test_feature_engine_updates_incrementally():
+    history_df, future_df, element_df = get_history_fixture_element_dfs()
+
+    engine = FeatureEngine()
+    full_df = engine.update(history_df, element_df)
+
+    incremental_engine = FeatureEngine()
+    first_df = incremental_engine.update(history_df, element_df, last_event=5)
+    assert first_df["event"].max() == 5
+    second_df = incremental_engine.update(history_df, element_df)
+    assert incremental_engine.update(history_df, element_df).empty
+
+    pd.testing.assert_frame_equal(
+        pd.concat([first_df, second_df], ignore_index=True), full_df
+    )
+    pd.testing.assert_frame_equal(
+        incremental_engine.get_prediction_features(future_df, element_df),
+        engine.get_prediction_features(future_df, element_df),
+    )
+
+
+def test_feature_engine_keeps_teams_of_transferred_elements():
+    history_df, _, element_df = get_history_fixture_element_dfs()
+    # element 1 has since moved from team 1 to team 3
+    transferred_df = element_df.assign(
+        team=np.where(element_df["element"] == 1, 3, element_df["team"])
+    )
+
+    pd.testing.assert_frame_equal(
+        FeatureEngine().update(history_df, transferred_df),
+        FeatureEngine().update(history_df, element_df),
+    )
+
+
+def test_build_local_features(tmp_path):
+    pytest.importorskip("duckdb")
+    from footbot.data.backends import LocalBackend
+
+    history_df, future_df, element_df = get_history_fixture_element_dfs()
+    backend = LocalBackend(str(tmp_path / "snapshot"))
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    backend.write_table(
+        "fpl", "element_gameweeks_2122", history_df[history_df["event"] <= 8]
+    )
+    backend.write_table("fpl", "element_future_fixtures_2122", future_df)
+    backend.write_table("fpl", "element_data_2122", element_df)
+    # rows of an earlier season
+    backend.write_table(
+        "fpl",
+        "element_gameweeks_features_all_v01",
+        FeatureEngine().update(history_df, element_df, 1).assign(season="2021"),
+    )
+
+    assert build_local_features(backend, store)["last_event"] == 8
+    backend.write_table(
+        "fpl", "element_gameweeks_2122", history_df, write_disposition="WRITE_TRUNCATE"
+    )
+    report = build_local_features(backend, store)
+    assert report["last_event"] == 12
+    assert report["train_rows"] == (history_df["event"] > 8).sum()
+    assert report["predict_rows"] == 2
+
+    # rebuilding without stored state replaces this season's rows only
+    build_local_features(backend, ArtifactStore(str(tmp_path / "empty")))
+    features_df = backend.read_table("fpl", "element_gameweeks_features_all_v01")
+    assert features_df["season"].value_counts().to_dict() == {
+        "2122": len(history_df),
+        "2021": (history_df["event"] == 1).sum(),
+    }
+    # events and elements of this season are numbered on from the earlier season's
+    this_season = features_df["season"] == "2122"
+    assert features_df.loc[~this_season, "event_all"].max() == 1
+    assert features_df.loc[this_season, "event_all"].min() == 2
+    assert (
+        features_df.loc[this_season, "event_all"]
+        == features_df.loc[this_season, "event"] + 1
+    ).all()
+    assert (
+        features_df.loc[this_season, "element_all"]
+        == features_df.loc[this_season, "element"]
+        + features_df.loc[~this_season, "element_all"].max()
+    ).all()
+
+    train_df = utils.run_templated_query("train", {}, backend)
+    assert train_df.columns[0] == "total_points"
+    assert "event" not in train_df
+    assert (train_df["rolling_avg_minutes_element_p10"] >= 45).all()
+
+    predict_df = utils.run_templated_query("predict", dict(current_event=12), backend)
+    assert list(predict_df.columns[3:]) == list(train_df.columns[1:])
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+
+import numpy as np
+
+from footbot.benchmark.training import get_training_df
+from footbot.benchmark.training import run_incremental_benchmark
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.incremental import IncrementalLasso
+from footbot.predictor.train_predict import CATEGORICAL_FEATURES
+from footbot.predictor.train_predict import get_features
+from footbot.predictor.train_predict import get_incremental_model
+from footbot.predictor.train_predict import get_model
+
+
+def get_incremental_lasso(df):
+    features = get_features(df.drop("event_all", axis=1))
+    return IncrementalLasso(features["numerical"], CATEGORICAL_FEATURES, 0.002)
+
+
+def test_incremental_lasso_matches_full_refit():
+    df = get_training_df(seasons=1, rows_per_event=50, features=6)
+    # a team that only appears in the latest events
+    df.loc[df["event_all"] > 30, "team"] = 21
+
+    model = get_incremental_lasso(df)
+    for event_all in range(1, 39):
+        model.partial_fit(df[df["event_all"] == event_all])
+    assert model.last_event_all == 38
+    assert model.categories["team"] == list(range(1, 22))
+
+    x = df.drop(["total_points", "event_all"], axis=1)
+    full_model = get_model(
+        get_features(df.drop("event_all", axis=1)),
+        {"alpha": 0.002, "tol": 1e-10, "max_iter": 100000},
+    )
+    full_model.fit(x, df["total_points"])
+
+    # one-hot coefficients are only unique up to a shift into the intercept
+    np.testing.assert_allclose(
+        [model.coef[i] for i in model.numerical_features],
+        full_model.named_steps["predictive model"].coef_[
+            : len(model.numerical_features)
+        ],
+        atol=1e-6,
+    )
+    np.testing.assert_allclose(model.predict(x), full_model.predict(x), atol=1e-6)
+
+
+def test_incremental_lasso_merge():
+    df = get_training_df(seasons=1, rows_per_event=20, features=4)
+    df.loc[df["event_all"] > 19, "team"] = 21
+    early_df = df[df["event_all"] <= 19]
+    late_df = df[df["event_all"] > 19]
+
+    model = get_incremental_lasso(df).partial_fit(df)
+    merged = get_incremental_lasso(df).partial_fit(late_df)
+    merged.merge(get_incremental_lasso(df).partial_fit(early_df))
+
+    np.testing.assert_allclose(merged.uu, model.uu)
+    np.testing.assert_allclose(merged.predict(df), model.predict(df), atol=1e-6)
+    assert merged.last_event_all == 38
+
+
+def test_get_incremental_model_pulls_new_rows(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    df = get_training_df(seasons=1, rows_per_event=20, features=4)
+    calls = []
+
+    def run_templated_query_batches(template, parameters, client):
+        calls.append(parameters["last_event_all"])
+        for event_all in range(parameters["last_event_all"] + 1, available + 1):
+            yield df[df["event_all"] == event_all]
+
+    with patch(
+        "footbot.predictor.train_predict.utils.run_templated_query_batches",
+        side_effect=run_templated_query_batches,
+    ), patch.object(
+        IncrementalLasso, "_fit", autospec=True, side_effect=IncrementalLasso._fit
+    ) as fit:
+        available = 30
+        assert get_incremental_model(None, store).last_event_all == 30
+        available = 31
+        model = get_incremental_model(None, store)
+        # no new rows
+        assert get_incremental_model(None, store).last_event_all == 31
+
+    assert calls == [0, 30, 31]
+    # coefficients are refitted once per update, not once per batch
+    assert fit.call_count == 2
+    assert model.last_event_all == 31
+    full_model = get_incremental_lasso(df).partial_fit(df[df["event_all"] <= 31])
+    np.testing.assert_allclose(model.predict(df), full_model.predict(df), atol=1e-6)
+
+
+def test_run_incremental_benchmark():
+    results = run_incremental_benchmark(seasons=1, rows_per_event=100, features=5)
+
+    assert results["rows"] == 3800
+    assert results["new_rows"] == 100
+    assert results["max_coef_difference"] < 1e-3
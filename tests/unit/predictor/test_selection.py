@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+from footbot.benchmark.training import get_training_df
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.selection import get_fold_matrices
+from footbot.predictor.selection import get_folds
+from footbot.predictor.selection import save_selection
+from footbot.predictor.selection import select_model
+from footbot.predictor.train_predict import get_features
+from footbot.predictor.train_predict import get_selection
+
+
+def test_get_folds():
+    events = np.repeat(np.arange(1, 11), 3)
+
+    folds = get_folds(events, n_folds=3, min_train_events=4)
+
+    assert len(folds) == 3
+    for train_mask, validation_mask in folds:
+        assert events[train_mask].max() < events[validation_mask].min()
+    assert [sorted(set(events[v])) for _, v in folds] == [
+        [5, 6],
+        [7, 8],
+        [9, 10],
+    ]
+
+    with pytest.raises(Exception):
+        get_folds(events, n_folds=7, min_train_events=4)
+
+
+def test_get_fold_matrices_reuses_cached_folds(tmp_path):
+    df = get_training_df(seasons=1, rows_per_event=10, features=3)
+    train_df = df.drop("event_all", axis=1)
+    features = get_features(train_df)
+    folds = get_folds(df["event_all"], n_folds=2, min_train_events=30)
+
+    paths = get_fold_matrices(train_df, features, folds, str(tmp_path))
+    modified = [os.path.getmtime(i) for i in paths]
+
+    assert get_fold_matrices(train_df, features, folds, str(tmp_path)) == paths
+    assert [os.path.getmtime(i) for i in paths] == modified
+
+
+def test_select_model(tmp_path):
+    df = get_training_df(seasons=1, rows_per_event=40, features=3)
+
+    ranking = select_model(
+        df,
+        alphas=[1.0, 0.1, 0.01],
+        feature_subsets={"all": [], "no_numerical": ["rolling_avg_feature_0"]},
+        n_folds=2,
+        min_train_events=30,
+        max_workers=2,
+        cache_dir=str(tmp_path),
+    )
+
+    assert len(ranking) == 6
+    assert list(ranking["mean_squared_error"]) == sorted(ranking["mean_squared_error"])
+    assert ranking.iloc[0]["subset"] == "all"
+    assert ranking.iloc[0]["alpha"] < 1.0
+    assert len(os.listdir(tmp_path)) == 1
+
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    assert get_selection(store) == ({"alpha": 0.0020}, [])
+    save_selection(ranking, df, store, {"all": [], "no_numerical": []})
+    assert get_selection(store) == ({"alpha": ranking.iloc[0]["alpha"]}, [])
+
+
+def test_select_model_stops_early_and_on_budget():
+    df = get_training_df(seasons=1, rows_per_event=40, features=3)
+    kwargs = dict(
+        feature_subsets={"all": []},
+        n_folds=2,
+        min_train_events=30,
+        max_workers=1,
+    )
+
+    # no alpha after the first improves the error
+    ranking = select_model(df, alphas=[0.1, 10, 20, 30, 40], patience=2, **kwargs)
+    assert sorted(ranking["alpha"]) == [0.1, 10, 20]
+
+    times = iter([0, 0, 100])
+    ranking = select_model(
+        df, alphas=[1.0, 0.1], budget_seconds=10, clock=lambda: next(times), **kwargs
+    )
+    assert list(ranking["alpha"]) == [1.0]
@@ -0,0 +1,100 @@
+from unittest.mock import Mock
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from footbot.data.backends import LocalBackend
+from footbot.predictor.snapshots import SNAPSHOTS_TABLE
+from footbot.predictor.snapshots import delete_old_snapshots
+from footbot.predictor.snapshots import get_current_version
+from footbot.predictor.snapshots import get_snapshot_df
+from footbot.predictor.snapshots import get_snapshot_hashes_df
+from footbot.predictor.snapshots import publish_snapshot
+from footbot.predictor.snapshots import write_snapshot
+
+PREDICTIONS_DF = pd.DataFrame(
+    {
+        "element": [1, 1, 2],
+        "event": [3, 4, 3],
+        "predicted_total_points": [2.0, 4.0, 1.0],
+    }
+)
+
+
+def test_snapshots(tmp_path):
+    pytest.importorskip("duckdb")
+
+    backend = LocalBackend(str(tmp_path))
+    assert get_current_version(backend) is None
+    assert get_snapshot_df(backend) is None
+
+    first = write_snapshot(PREDICTIONS_DF, backend, clock=lambda: 1.0)
+    publish_snapshot(first, backend)
+    assert first == 1000
+
+    # a written snapshot is only read once it is published
+    second = write_snapshot(
+        PREDICTIONS_DF.assign(predicted_total_points=0.0), backend, clock=lambda: 2.0
+    )
+    assert get_current_version(backend) == first
+    assert get_snapshot_df(backend)["predicted_total_points"].sum() == 7.0
+
+    publish_snapshot(second, backend)
+    assert get_current_version(backend) == second
+    assert get_snapshot_df(backend)["predicted_total_points"].sum() == 0.0
+    assert len(get_snapshot_df(backend, first)) == 3
+    assert "snapshot_version" not in get_snapshot_df(backend).columns
+
+    # expired snapshots are deleted, but never the published one
+    third = write_snapshot(PREDICTIONS_DF, backend, clock=lambda: 3.0)
+    delete_old_snapshots(third, backend, retention_seconds=0)
+    snapshots_df = backend.read_table("fpl", SNAPSHOTS_TABLE)
+    assert sorted(snapshots_df["snapshot_version"].unique()) == [second, third]
+
+
+def test_get_current_version_raises_other_errors():
+    with patch(
+        "footbot.predictor.snapshots.utils.run_templated_query",
+        side_effect=Exception("quota exceeded"),
+    ):
+        with pytest.raises(Exception, match="quota exceeded"):
+            get_current_version(Mock())
+
+
+def test_write_snapshot_copies_unchanged_elements(tmp_path):
+    pytest.importorskip("duckdb")
+
+    backend = LocalBackend(str(tmp_path))
+    base = write_snapshot(
+        PREDICTIONS_DF.assign(element=[1, 2, 3]), backend, clock=lambda: 1.0
+    )
+
+    # element 1 is rescored and element 3 is no longer predicted
+    predict_df = pd.DataFrame(
+        {"element": [1], "event": [3], "predicted_total_points": [5.0]}
+    )
+    version = write_snapshot(
+        predict_df, backend, clock=lambda: 2.0, base_version=base, elements=[1, 3]
+    )
+
+    snapshots_df = backend.read_table("fpl", SNAPSHOTS_TABLE)
+    assert (snapshots_df["snapshot_version"] == version).sum() == 2
+    df = get_snapshot_df(backend, version).sort_values("element")
+    assert df.to_dict("records") == [
+        {"element": 1, "event": 3, "predicted_total_points": 5.0},
+        {"element": 2, "event": 4, "predicted_total_points": 4.0},
+    ]
+
+
+def test_get_snapshot_hashes_df(tmp_path):
+    pytest.importorskip("duckdb")
+
+    backend = LocalBackend(str(tmp_path))
+    version = write_snapshot(
+        PREDICTIONS_DF.assign(feature_hash=[7, 8, 9]), backend, clock=lambda: 1.0
+    )
+
+    df = get_snapshot_hashes_df(backend, version)
+    assert list(df.columns) == ["element", "event", "feature_hash"]
+    assert df["feature_hash"].tolist() == [7, 8, 9]
@@ -0,0 +1,236 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from footbot.benchmark.predictor import get_regressions
+from footbot.benchmark.predictor import profile_pipeline
+from footbot.benchmark.training import get_training_df
+from footbot.predictor.artifacts import ArtifactStore
+from footbot.predictor.artifacts import get_fingerprint
+from footbot.predictor.train_predict import HYPERPARAMETERS
+from footbot.predictor.train_predict import get_downcast_df
+from footbot.predictor.train_predict import get_features
+from footbot.predictor.train_predict import get_fitted_model
+from footbot.predictor.train_predict import get_model
+from footbot.predictor.train_predict import get_predicted_points_delta_df
+from footbot.predictor.train_predict import get_predicted_points_df
+
+
+def get_train_df(rows=200, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "total_points": rng.integers(0, 10, rows),
+            "element_type": rng.integers(1, 5, rows),
+            "team": rng.integers(1, 21, rows),
+            "opponent_team": rng.integers(1, 21, rows),
+            "was_home": rng.integers(0, 2, rows).astype(bool),
+            "was_sunday": rng.integers(0, 2, rows).astype(bool),
+            "was_weekday": rng.integers(0, 2, rows).astype(bool),
+            "was_late": rng.integers(0, 2, rows).astype(bool),
+            "was_early": rng.integers(0, 2, rows).astype(bool),
+            "rolling_avg_total_points": rng.normal(3, 1, rows),
+            "rolling_avg_minutes": rng.normal(60, 20, rows),
+        }
+    )
+    df.loc[::7, "rolling_avg_minutes"] = np.nan
+    return df
+
+
+def test_get_fingerprint():
+    df = get_train_df()
+    features = get_features(df)
+
+    fingerprint = get_fingerprint(df, features, HYPERPARAMETERS)
+    assert fingerprint == get_fingerprint(df.copy(), features, HYPERPARAMETERS)
+    assert fingerprint != get_fingerprint(df.iloc[1:], features, HYPERPARAMETERS)
+    assert fingerprint != get_fingerprint(df, features, {"alpha": 0.1})
+
+
+def test_get_fitted_model_reuses_stored_model(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    df = get_train_df()
+
+    model, features = get_fitted_model(df, store)
+    assert features["numerical"] == ["rolling_avg_total_points", "rolling_avg_minutes"]
+
+    with patch("footbot.predictor.train_predict.get_model") as get_model:
+        stored_model, _ = get_fitted_model(df, store)
+        get_model.assert_not_called()
+
+    x = df.drop("total_points", axis=1)
+    np.testing.assert_array_equal(stored_model.predict(x), model.predict(x))
+
+    get_fitted_model(get_train_df(seed=1), store)
+    assert len(list(tmp_path.glob("points/*.joblib"))) == 2
+
+    # training data going back to an earlier state makes its model the latest again
+    get_fitted_model(df, store)
+    _, metadata = store.load("points")
+    assert metadata["fingerprint"] == get_fingerprint(df, features, HYPERPARAMETERS)
+
+
+def test_get_predicted_points_df_predict_only(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    train_df = get_train_df()
+    predict_df = train_df.drop("total_points", axis=1).assign(
+        event=10, element=range(len(train_df)), safe_web_name="a"
+    )
+
+    def run_templated_query(template, parameters, client):
+        assert template == "predict"
+        assert parameters == {"current_event": 9}
+        return predict_df.copy()
+
+    with patch(
+        "footbot.predictor.train_predict.utils.get_current_event", return_value=9
+    ), patch(
+        "footbot.predictor.train_predict.utils.run_templated_query",
+        side_effect=run_templated_query,
+    ):
+        with pytest.raises(Exception, match="no stored points model"):
+            get_predicted_points_df("train", "predict", None, store, predict_only=True)
+
+        model, _ = get_fitted_model(train_df, store)
+        df = get_predicted_points_df("train", "predict", None, store, predict_only=True)
+
+        # the incremental model is stored under its own name
+        with pytest.raises(Exception, match="no stored points_incremental model"):
+            get_predicted_points_df(
+                "train", "predict", None, store, predict_only=True, incremental=True
+            )
+
+    np.testing.assert_allclose(
+        df["predicted_total_points"],
+        model.predict(train_df.drop("total_points", axis=1)),
+    )
+
+
+def test_get_downcast_df():
+    df = get_train_df().assign(name="a")
+
+    downcast_df = get_downcast_df(df)
+
+    assert downcast_df["rolling_avg_minutes"].dtype == np.float32
+    assert downcast_df["team"].dtype == np.int8
+    assert downcast_df["was_home"].dtype == bool
+    assert downcast_df["name"].dtype == df["name"].dtype
+    assert df["team"].dtype == np.int64
+
+
+def test_get_model_fits_dense_float32_features():
+    df = get_downcast_df(get_train_df())
+    model = get_model(get_features(df))
+
+    model.fit(df.drop("total_points", axis=1), df["total_points"])
+    x = model.named_steps["pre-process features"].transform(
+        df.drop("total_points", axis=1)
+    )
+
+    assert isinstance(x, np.ndarray)
+    assert x.dtype == np.float32
+    lasso = model.named_steps["predictive model"]
+    assert lasso.coef_.dtype == np.float32
+    assert lasso.n_iter_ < lasso.max_iter
+
+
+def test_get_model_converges_like_float64_features():
+    df = get_training_df(1, rows_per_event=200, features=10).drop("event_all", axis=1)
+    models = []
+    for train_df in [df, get_downcast_df(df)]:
+        model = get_model(get_features(train_df))
+        model.fit(train_df.drop("total_points", axis=1), train_df["total_points"])
+        models.append(model.named_steps["predictive model"])
+
+    assert all(i.n_iter_ < i.max_iter for i in models)
+    np.testing.assert_allclose(models[0].coef_, models[1].coef_, atol=1e-4)
+
+
+def test_get_predicted_points_delta_df(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    train_df = get_train_df()
+    predict_df = train_df.drop("total_points", axis=1).assign(
+        event=10, element=range(len(train_df)), safe_web_name="a"
+    )
+    get_fitted_model(train_df, store)
+
+    with patch(
+        "footbot.predictor.train_predict.utils.get_current_event", return_value=9
+    ), patch(
+        "footbot.predictor.train_predict.utils.run_templated_query",
+        side_effect=lambda *args: predict_df.copy(),
+    ):
+        full_df = get_predicted_points_df(
+            "train", "predict", None, store, predict_only=True
+        )
+        stored_hashes_df = pd.concat(
+            [
+                full_df[["element", "event", "feature_hash"]],
+                pd.DataFrame({"element": [999], "event": [10], "feature_hash": [1]}),
+            ]
+        )
+
+        delta_df, elements = get_predicted_points_delta_df(
+            "train", "predict", None, stored_hashes_df, store, predict_only=True
+        )
+        assert delta_df.empty
+        assert elements == [999]
+
+        # element 3's team news changes its features, element 5 is no longer predicted
+        predict_df.loc[3, "rolling_avg_minutes"] = 0.0
+        predict_df = predict_df.drop(5)
+        delta_df, elements = get_predicted_points_delta_df(
+            "train", "predict", None, stored_hashes_df, store, predict_only=True
+        )
+
+    assert elements == [3, 5, 999]
+    assert delta_df["element"].tolist() == [3]
+    assert delta_df["feature_hash"][0] != full_df["feature_hash"][3]
+    assert delta_df["prediction_version"][0] >= full_df["prediction_version"][0]
+
+
+def test_profile_pipeline():
+    pytest.importorskip("duckdb")
+
+    results = profile_pipeline(1, rows_per_event=50, features=3)
+
+    assert [i["stage"] for i in results] == [
+        "train_query",
+        "column_transformer_fit",
+        "lasso_fit",
+        "predict_query",
+        "feature_hash",
+        "predict",
+        "save_snapshot",
+    ]
+    # rows failing the training filter on minutes are left out
+    assert 0 < results[0]["rows"] < 38 * 50
+    assert results[-1]["rows"] == 38 * 50
+    assert all(i["seconds"] > 0 and i["peak_traced_bytes"] > 0 for i in results)
+
+
+def test_get_regressions():
+    baseline = [
+        {"seasons": 1, "stage": "lasso_fit", "seconds": 1.0, "peak_traced_bytes": 2e6},
+        {"seasons": 1, "stage": "predict", "seconds": 0.01, "peak_traced_bytes": 10},
+    ]
+    results = [
+        {"seasons": 1, "stage": "lasso_fit", "seconds": 1.2, "peak_traced_bytes": 3e6},
+        # too quick and small to compare
+        {"seasons": 1, "stage": "predict", "seconds": 0.02, "peak_traced_bytes": 20},
+        # not in the baseline
+        {"seasons": 3, "stage": "lasso_fit", "seconds": 9.0, "peak_traced_bytes": 9e6},
+    ]
+
+    assert get_regressions(results, baseline, threshold=0.25) == [
+        {
+            "seasons": 1,
+            "stage": "lasso_fit",
+            "metric": "peak_traced_bytes",
+            "value": 3e6,
+            "baseline": 2e6,
+        }
+    ]
+    assert len(get_regressions(results, baseline, threshold=0.1)) == 2
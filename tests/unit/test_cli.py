@@ -49,3 +49,41 @@ def test_optimise_team():
             login=None,
             password=None,
         )
+
+
+def test_update_history():
+    report = {
+        "elements": 2,
+        "failed": [],
+        "seconds": 1.0,
+        "timings": [
+            {"element": 1, "seconds": 0.5, "error": None},
+            {"element": 2, "seconds": 0.25, "error": None},
+        ],
+    }
+    with mock.patch(
+        "footbot.cli.update_element_history_fixtures_bulk", return_value=report
+    ) as update:
+        runner = CliRunner()
+        result = runner.invoke(cli, ["update-history", "--max-workers=4"])
+        assert result.exit_code == 0
+        assert "fetched 2 elements" in result.output
+        update.assert_called_once_with(max_workers=4)
+
+
+def test_sync_history():
+    report = {
+        "elements": 3,
+        "history_rows": 2,
+        "fixtures_rows": 1,
+        "failed": [],
+        "seconds": 1.0,
+    }
+    with mock.patch("footbot.cli.utils.set_up_bigquery") as set_up_bigquery, mock.patch(
+        "footbot.cli.sync_element_history_fixtures", return_value=report
+    ) as sync:
+        runner = CliRunner()
+        result = runner.invoke(cli, ["sync-history", "--max-workers=4"])
+        assert result.exit_code == 0
+        assert "synced 3 elements" in result.output
+        sync.assert_called_once_with(set_up_bigquery.return_value, max_workers=4)
@@ -1,11 +1,17 @@
 from unittest.mock import ANY
 from unittest.mock import Mock
+from unittest.mock import patch
 
+import pandas as pd
 import pytest
 
 from footbot.main import app
 from footbot.main import home_route
 from footbot.main import optimise_team_route
+from footbot.main import select_model_route
+from footbot.main import update_element_history_fixtures_element_route_post
+from footbot.main import update_element_history_fixtures_route
+from footbot.main import update_element_history_fixtures_elements_route_put
 
 
 def test_home_route():
@@ -89,3 +95,51 @@ def test_optimise_team_route_private(flask_app):
             login="login",
             password="password",
         )
+
+
+def test_update_element_history_fixtures_elements_route_put_bad_data(flask_app):
+    with flask_app.test_request_context(method="PUT", json={"elements": 1}):
+        resp, code = update_element_history_fixtures_elements_route_put()
+    assert code == 400
+    assert resp == "Data must contain a list of 'elements'"
+
+
+def test_update_element_history_fixtures_element_route_post(flask_app):
+    backend = Mock()
+    dfs = (pd.DataFrame({"element": [1]}), pd.DataFrame({"element": [1]}))
+
+    with patch("footbot.main.writer.history_backend", backend), patch(
+        "footbot.main.element_data.get_element_history_fixture_dfs", return_value=dfs
+    ):
+        with flask_app.test_request_context(method="POST"):
+            resp = update_element_history_fixtures_element_route_post(1)
+        # rows are written before the task is acknowledged
+        assert resp == "lovely stuff"
+        assert backend.write.call_count == 2
+
+        # a failed write is retried by Cloud Tasks
+        backend.write.side_effect = Exception("quota exceeded")
+        with flask_app.test_request_context(method="POST"):
+            resp, code = update_element_history_fixtures_element_route_post(1)
+        assert code == 500
+
+
+def test_update_element_history_fixtures_route():
+    with patch("footbot.main.utils") as utils, patch(
+        "footbot.main.element_data.get_bootstrap"
+    ), patch("footbot.main.element_data.get_elements", return_value=[1, 2, 3]):
+        assert update_element_history_fixtures_route() == "elements queued"
+
+    # tasks are spread out at a fixed rate, whichever instance runs them
+    delays = [i.kwargs["delay"] for i in utils.create_cloud_task.call_args_list]
+    assert delays == [120, 120.5, 121]
+
+
+def test_select_model_route_rejects_budgets_near_the_timeout(flask_app):
+    for budget_seconds in ["600", "0", "soon"]:
+        with patch("footbot.main.selection.run_model_selection") as run:
+            with flask_app.test_request_context(f"?budget_seconds={budget_seconds}"):
+                resp, code = select_model_route()
+        assert code == 400
+        assert "budget_seconds must be" in resp
+        run.assert_not_called()